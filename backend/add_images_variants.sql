@@ -0,0 +1,9 @@
+-- SQL миграция: манифест вариантов фото (лесенка ширин для srcset, AVIF) рядом с file/file_lazy
+-- Выполнить в Supabase SQL Editor. До миграции бэкенд сохраняет только file и file_lazy
+
+-- [{"url": ..., "width": 400, "height": 300, "format": "webp"}, ...], по формату и ширине.
+-- cards/filter отдает колонку вместе с остальными полями images
+ALTER TABLE images
+ADD COLUMN IF NOT EXISTS variants JSONB NOT NULL DEFAULT '[]'::jsonb;
+
+COMMENT ON COLUMN images.variants IS 'Варианты фото для srcset: url, width, height, format (webp/avif). Пусто у фото, загруженных до лесенки';
@@ -1,20 +1,32 @@
 import os
 import json
+import math
 import base64
 import uuid
 import hashlib
 import hmac
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from functools import wraps
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from flask_socketio import SocketIO, emit, disconnect
 from flask_cors import CORS
 # from flask_jwt_extended import JWTManager, jwt_required, create_access_token, create_refresh_token, get_jwt_identity
-from PIL import Image, ImageOps
-from io import BytesIO
 from dotenv import load_dotenv
 from supabase import create_client, Client
 from flask import Flask, send_from_directory, jsonify, request
 import urllib.parse  # 👈 Добавь этот импорт
+from catalog_cache import CatalogCache, CatalogVersions
+from catalog_store import CatalogStore
+from catalog_search import CatalogSearch
+import wire_format
+import serialization
+from socket_actions import ActionRegistry, Arg, ArgumentError
+import metrics
+from supabase_trace import SupabaseTracer
+import image_processing
+from inflight import InFlight
+from upload_spool import UploadSpool, UploadError
 
 load_dotenv()
 
@@ -22,30 +34,134 @@ load_dotenv()
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# Трассировка запросов к Supabase: сколько round trip'ов стоит каждое действие, медленные запросы - в лог
+supabase_tracer = SupabaseTracer(
+    slow_ms=float(os.getenv('SUPABASE_SLOW_QUERY_MS', '500')),
+    log=lambda text: print(f"WARNING: {text}")
+)
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+if os.getenv('SUPABASE_TRACE', '1') == '1':
+    supabase = supabase_tracer.wrap(supabase)
 BUCKET_NAME = 'public_assets'
+# Варианты изображения загружаются в Storage параллельно (под eventlet потоки пула - green threads)
+STORAGE_UPLOAD_CONCURRENCY = int(os.getenv('STORAGE_UPLOAD_CONCURRENCY', '4'))
+storage_upload_executor = ThreadPoolExecutor(max_workers=STORAGE_UPLOAD_CONCURRENCY)
+# Фото карточек лежат под именем-хэшем содержимого: объект никогда не меняется, кэшируется на год
+STORAGE_CACHE_CONTROL = os.getenv('STORAGE_CACHE_CONTROL', '31536000')  # max-age в секундах
+STORAGE_KNOWN_OBJECTS_MAX = 10000  # сколько путей уже существующих объектов помним, чтобы не спрашивать Storage
+known_storage_objects = OrderedDict()
+# Загрузки фото, которые выполняются сейчас, по (card_id, image_index)
+image_uploads = InFlight()
+# Загрузка фото по частям (images/upload_begin, upload_chunk, upload_commit): части копятся во временном файле
+upload_spool = UploadSpool(
+    directory=os.getenv('IMAGE_UPLOAD_DIR') or None,
+    ttl=float(os.getenv('IMAGE_UPLOAD_TTL', '3600')),
+    max_size=int(os.getenv('IMAGE_UPLOAD_MAX_BYTES', str(30 * 1024 * 1024))),
+    chunk_size=int(os.getenv('IMAGE_UPLOAD_CHUNK_SIZE', str(256 * 1024)))
+)
+IMAGES_BATCH_SIZE = 150  # сколько card_id передаем в один in_() запрос к images
+
+# Списки опций карточки. После migrate_cards_jsonb.sql это JSONB-колонки,
+# до миграции - TEXT с json.dumps. CARDS_JSONB_WRITES=1 включать только после миграции
+CARD_LIST_FIELDS = ['colors', 'counts', 'packages', 'sizes', 'prices']
+CARDS_JSONB_WRITES = os.getenv('CARDS_JSONB_WRITES', '0') == '1'
+
+# Сортировки cards/filter: order_type -> (колонка, desc). По умолчанию - по id
+CARDS_SORTS = {
+    0: ('views_count', True),
+    1: ('price_number', False),
+    2: ('price_number', True),
+}
+CARDS_PAGE_SIZE = int(os.getenv('CARDS_PAGE_SIZE', '60'))  # размер страницы, если клиент не передал limit
+CARDS_MAX_PAGE_SIZE = int(os.getenv('CARDS_MAX_PAGE_SIZE', '200'))
+CATALOG_LOAD_PAGE_SIZE = 1000  # PostgREST по умолчанию отдает не больше 1000 строк за запрос
+CATALOG_SYNC_OVERLAP = 5  # секунд: на столько назад сдвигаем точку синхронизации cards/sync
+CATALOG_SYNC_MAX_AGE_DAYS = int(os.getenv('CATALOG_SYNC_MAX_AGE_DAYS', '90'))  # сколько дней храним журнал удалений
+CARDS_STREAM_CHUNK_SIZE = int(os.getenv('CARDS_STREAM_CHUNK_SIZE', '20'))  # размер пачки в потоковом режиме
+
+# Кэш выдачи cards/filter (TTL в секундах, 0 - кэш выключен)
+cards_cache = CatalogCache(
+    max_entries=int(os.getenv('CARDS_CACHE_SIZE', '256')),
+    ttl=float(os.getenv('CARDS_CACHE_TTL', '30'))
+)
+# Версии каталогов: клиент присылает последнюю виденную и получает ['cards', 'not_modified', version]
+catalog_versions = CatalogVersions(max_age=float(os.getenv('CATALOG_VERSION_MAX_AGE', '3600')))
 
 # Конфигурация Flask и JWT
 app = Flask(__name__)
 # app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-this')
 # app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
 # app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=30)
-app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024 * 1024
+# Лимит размера сообщения. 1 ГБ - ради images/add с фото целиком в base64; клиенты, которые грузят фото
+# частями (images/upload_chunk), позволяют опустить его через SOCKET_MAX_BUFFER_SIZE
+SOCKET_MAX_BUFFER_SIZE = int(os.getenv('SOCKET_MAX_BUFFER_SIZE', str(1024 * 1024 * 1024)))
+app.config['MAX_CONTENT_LENGTH'] = SOCKET_MAX_BUFFER_SIZE
 
 CORS(app, resources={r"/*": {"origins": "*"}})
-socketio = SocketIO(app, cors_allowed_origins="*", max_http_buffer_size=1024 * 1024 * 1024)
+# jsonify, сообщения сокета и пакеты Socket.IO кодируются одним модулем (orjson при наличии)
+app.json = serialization.FastJSONProvider(app)
+socketio = SocketIO(app, cors_allowed_origins="*", max_http_buffer_size=SOCKET_MAX_BUFFER_SIZE, json=serialization)
 # jwt = JWTManager(app)
 
-def prepare_data(data):
-    """Подготовка данных для JSON"""
-    if isinstance(data, list):
-        return [prepare_data(item) for item in data]
-    elif isinstance(data, dict):
-        return {k: prepare_data(v) for k, v in data.items()}
-    elif isinstance(data, (int, str, bool, type(None))):
-        return data
-    else:
-        return str(data)
+# Метрики для /metrics (формат Prometheus)
+metrics_registry = metrics.MetricsRegistry(prefix='shop_backend_')
+socket_connections = metrics_registry.gauge('socket_connections', 'Открытые Socket.IO соединения')
+socket_connections_total = metrics_registry.counter('socket_connections_total', 'Подключения Socket.IO с запуска процесса')
+socket_action_seconds = metrics_registry.histogram(
+    'socket_action_duration_seconds', 'Время обработки действия сокета', ('action', 'status')
+)
+socket_payload_bytes = metrics_registry.histogram(
+    'socket_payload_bytes', 'Размер сообщений сокета', ('action', 'direction'), buckets=metrics.BYTES_BUCKETS
+)
+supabase_request_seconds = metrics_registry.histogram(
+    'supabase_request_duration_seconds', 'HTTP-запросы к Supabase (PostgREST и Storage)',
+    ('service', 'target', 'operation', 'status')
+)
+storage_uploads_total = metrics_registry.counter(
+    'storage_uploads_total', 'Загрузки фото в Storage: uploaded - новый объект, deduplicated - такой уже был', ('result',)
+)
+image_processing_seconds = metrics_registry.histogram(
+    'image_processing_duration_seconds', 'Обработка изображений (декодирование, ресайз, WebP)', ('variant',)
+)
+
+# Сжатие изображений - в пуле процессов, чтобы Pillow не блокировал единственный eventlet-воркер.
+# IMAGE_POOL_SIZE=0 - сжимать в процессе воркера, как раньше
+image_pool = image_processing.ImagePool(
+    size=int(os.getenv('IMAGE_POOL_SIZE', str(image_processing.default_pool_size()))),
+    sleep=socketio.sleep
+)
+
+SUPABASE_OPERATIONS = {'GET': 'select', 'HEAD': 'select', 'POST': 'insert', 'PATCH': 'update', 'DELETE': 'delete'}
+
+def observe_supabase_request(http_request, http_response, seconds):
+    """/rest/v1/<таблица>, /rest/v1/rpc/<функция>, /storage/v1/object/<bucket>/... -> метка запроса"""
+    parts = http_request.url.path.strip('/').split('/')
+    service, target = (parts[0] if parts else ''), ''
+    if service == 'rest' and len(parts) > 2:
+        if parts[2] == 'rpc' and len(parts) > 3:
+            service, target = 'rpc', parts[3]
+        else:
+            target = parts[2]
+    elif service == 'storage' and len(parts) > 3:
+        target = parts[3] if parts[2] == 'object' and parts[3] not in ('public', 'sign') else parts[2]
+    operation = SUPABASE_OPERATIONS.get(http_request.method, http_request.method.lower())
+    if service == 'rpc':
+        operation = 'call'
+    elif service == 'storage' and http_request.method == 'POST':
+        operation = 'upload'
+    supabase_request_seconds.observe(
+        seconds, service=service, target=target, operation=operation, status=f"{http_response.status_code // 100}xx"
+    )
+
+def instrument_supabase():
+    """Подключает замеры к HTTP-клиентам PostgREST и Storage. Без них метрики Supabase просто пустые"""
+    for name in ('postgrest', 'storage'):
+        try:
+            metrics.instrument_http_client(getattr(supabase, name).session, observe_supabase_request)
+        except Exception as e:
+            print(f"WARNING: Не удалось подключить метрики к supabase.{name}: {e}")
+
+instrument_supabase()
 def verify_telegram_init_data(init_data: str, bot_token: str):
     parsed_data = dict(urllib.parse.parse_qsl(init_data))
     received_hash = parsed_data.pop("hash", None)
@@ -339,18 +455,27 @@ def update_business_settings(settings_data):
     except Exception as e:
         print(f"Error updating business settings: {e}")
         return False
+def image_bytes(image_data):
+    """
+    Байты изображения из сообщения. Бинарное вложение Socket.IO (или bin в msgpack) приходит
+    как bytes и передается дальше без копирования, строка - base64 или data URL
+    """
+    if isinstance(image_data, (bytes, bytearray)):
+        return image_data
+    return base64.b64decode(image_data.split(',')[-1])
+
 def upload_business_logo(business_id, image_data):
     """Загружает логотип бизнеса в Supabase Storage и удаляет старый"""
     try:
         print(f"DEBUG: Начало загрузки логотипа для бизнеса {business_id}")
         
         # Проверяем, не пустые ли данные
-        if not image_data or image_data.strip() == "":
+        if not image_data or (isinstance(image_data, str) and image_data.strip() == ""):
             print(f"ERROR: Пустые данные изображения")
             return None
             
         # Проверяем, не пытаемся ли мы загрузить уже существующий URL
-        if image_data.startswith('http'):
+        if isinstance(image_data, str) and image_data.startswith('http'):
             print(f"WARNING: Получен URL вместо base64: {image_data}")
             return image_data
         
@@ -386,32 +511,11 @@ def upload_business_logo(business_id, image_data):
                 print(f"WARNING: Не удалось удалить старый файл: {delete_error}")
                 # Продолжаем загрузку нового файла даже если не удалось удалить старый
         
-        # Декодируем base64
-        if "," in image_data:
-            image_data_binary = base64.b64decode(image_data.split(',')[-1])
-        else:
-            image_data_binary = base64.b64decode(image_data)
-        
-        # Сжимаем изображение
-        image = Image.open(BytesIO(image_data_binary))
-        
-        # Сохраняем прозрачность для PNG
-        if image.mode in ("RGBA", "LA") or (image.mode == "P" and 'transparency' in image.info):
-            # Сохраняем альфа-канал для PNG с прозрачностью
-            image = image.convert("RGBA")
-            # WebP поддерживает прозрачность
-        else:
-            # Для изображений без прозрачности конвертируем в RGB
-            if image.mode in ("P", "L"):
-                image = image.convert("RGB")
-        
-        # Оптимальный размер для логотипа - увеличиваем качество
-        image.thumbnail((400, 400), Image.LANCZOS)
+        image_data_binary = image_bytes(image_data)
         
-        # Конвертируем в WebP с лучшим качеством для логотипов
-        img_byte_arr = BytesIO()
-        image.save(img_byte_arr, format='WEBP', quality=95, method=6)
-        compressed_image = img_byte_arr.getvalue()
+        # Сжимаем изображение (400x400, WebP с лучшим качеством для логотипов) в пуле процессов
+        with image_processing_seconds.time(variant='logo'):
+            compressed_image = image_pool.run(image_processing.compress_logo, image_data_binary)
         
         # Генерируем имя файла
         filename = f"logo_{uuid.uuid4()}.webp"
@@ -424,7 +528,7 @@ def upload_business_logo(business_id, image_data):
             response = supabase.storage.from_(BUCKET_NAME).upload(
                 path,
                 compressed_image,
-                {"content-type": "image/webp", "upsert": 'true'}
+                {"content-type": "image/webp", "cache-control": STORAGE_CACHE_CONTROL, "upsert": 'true'}
             )
             print(f"DEBUG: Файл загружен в Supabase")
         except Exception as upload_error:
@@ -433,7 +537,7 @@ def upload_business_logo(business_id, image_data):
         
         # Получаем публичный URL
         try:
-            public_url = supabase.storage.from_(BUCKET_NAME).get_public_url(path)
+            public_url = storage_public_url(path)
             print(f"DEBUG: Публичный URL: {public_url}")
             
             # Обновляем URL логотипа в базе данных
@@ -509,49 +613,563 @@ def create_shop_owner(telegram_id: int, shop_id: str):
 
 # Вспомогательные функции
 def compress_image_to_bytes(image_data, max_size, quality):
-    """Конвертирует любое изображение в WebP и сжимает"""
-    image = Image.open(BytesIO(image_data))
-    
-    # Исправляем ориентацию изображения на основе EXIF данных
-    image = ImageOps.exif_transpose(image)
-    
-    # Сохраняем прозрачность для PNG
-    if image.mode in ("RGBA", "LA") or (image.mode == "P" and 'transparency' in image.info):
-        # Сохраняем альфа-канал для PNG с прозрачностью
-        image = image.convert("RGBA")
-        # WebP поддерживает прозрачность
-    else:
-        # Для изображений без прозрачности конвертируем в RGB
-        if image.mode in ("P", "L"):
-            image = image.convert("RGB")
-    
-    image.thumbnail(max_size, Image.LANCZOS)
-    img_byte_arr = BytesIO()
-    
-    image.save(img_byte_arr, format='WEBP', quality=quality, method=6)
-    return img_byte_arr.getvalue()
+    """Конвертирует любое изображение в WebP и сжимает (в пуле процессов)"""
+    with image_processing_seconds.time(variant=f"{max_size[0]}x{max_size[1]}"):
+        return image_pool.run(image_processing.compress_to_webp, image_data, max_size, quality)
+
+def storage_public_url(path, bucket=BUCKET_NAME):
+    """Публичный URL объекта в Storage без обращения к клиенту - тот же, что вернул бы get_public_url"""
+    return f"{SUPABASE_URL.rstrip('/')}/storage/v1/object/public/{bucket}/{urllib.parse.quote(path)}"
+
+def business_image_path(business_id, filename, is_lazy=False):
+    folder = f"{business_id}/products"
+    if is_lazy:
+        folder = f"{business_id}/products/lazy"
+    return f"{folder}/{filename}"
+
+def content_filename(file_data, extension):
+    """Имя файла по содержимому: одинаковые фото в разных карточках - один объект в Storage"""
+    return f"{hashlib.sha256(file_data).hexdigest()[:32]}.{extension}"
+
+def remember_storage_object(path):
+    known_storage_objects[path] = True
+    known_storage_objects.move_to_end(path)
+    while len(known_storage_objects) > STORAGE_KNOWN_OBJECTS_MAX:
+        known_storage_objects.popitem(last=False)
+
+def storage_object_exists(path):
+    """Есть ли объект в бакете (HEAD). При ошибке проверки считаем, что нет - загрузка все равно безопасна"""
+    if path in known_storage_objects:
+        return True
+    try:
+        exists = bool(supabase.storage.from_(BUCKET_NAME).exists(path))
+    except Exception as e:
+        print(f"WARNING: Не удалось проверить объект {path} в Storage: {e}")
+        return False
+    if exists:
+        remember_storage_object(path)
+    return exists
 
 def upload_to_business_bucket(file_data, business_id, card_id, filename, is_lazy=False):
-    """Загружает файл в папку business_id/products/"""
+    """
+    Загружает файл в папку business_id/products/. Имя - хэш содержимого (content_filename),
+    поэтому объект, который уже есть в бакете, не загружается повторно и не перезаписывается
+    """
     try:
-        folder = f"{business_id}/products"
-        if is_lazy:
-            folder = f"{business_id}/products/lazy"
+        path = business_image_path(business_id, filename, is_lazy)
+        if storage_object_exists(path):
+            storage_uploads_total.inc(result='deduplicated')
+            return storage_public_url(path)
         
-        path = f"{folder}/{filename}"
+        extension = filename.rsplit('.', 1)[-1]
+        try:
+            response = supabase.storage.from_(BUCKET_NAME).upload(
+                path,
+                file_data,
+                {
+                    "content-type": image_processing.CONTENT_TYPES.get(extension, "image/webp"),
+                    "cache-control": STORAGE_CACHE_CONTROL,
+                    "upsert": 'false'
+                }
+            )
+        except Exception as upload_error:
+            # Тот же объект успела загрузить параллельная загрузка - содержимое совпадает по построению
+            if 'Duplicate' not in str(upload_error) and 'already exists' not in str(upload_error):
+                raise
+            storage_uploads_total.inc(result='deduplicated')
+        else:
+            storage_uploads_total.inc(result='uploaded')
+        remember_storage_object(path)
         
-        response = supabase.storage.from_(BUCKET_NAME).upload(
-            path,
-            file_data,
-            {"content-type": "image/webp", "upsert": 'true'}
-        )
+        return storage_public_url(path)
+    except Exception as e:
+        print(f"Error uploading to Supabase Storage: {e}")
+        return None
+
+def upload_many_to_business_bucket(business_id, card_id, files):
+    """
+    Загружает несколько файлов параллельно. files - [(file_data, filename, is_lazy)],
+    результат - публичные URL в том же порядке (None для файла, который не загрузился)
+    """
+    futures = [
+        storage_upload_executor.submit(upload_to_business_bucket, file_data, business_id, card_id, filename, is_lazy)
+        for file_data, filename, is_lazy in files
+    ]
+    return [future.result() for future in futures]
+
+def attach_images_to_cards(cards):
+    """Загружает изображения для списка карточек одним запросом и раскладывает по card['images']"""
+    if not cards:
+        return cards
+    
+    card_ids = [card['id'] for card in cards]
+    images_by_card = {card_id: [] for card_id in card_ids}
+    
+    # Бьем на пачки, чтобы не упереться в длину URL у PostgREST
+    for start in range(0, len(card_ids), IMAGES_BATCH_SIZE):
+        batch = card_ids[start:start + IMAGES_BATCH_SIZE]
+        # У пачки может быть больше 1000 фото (до 10 на карточку) - читаем постранично,
+        # порядок (card_id, image_index, id) не меняется между страницами
+        offset = 0
+        while True:
+            images_response = supabase.table('images') \
+                .select('*') \
+                .in_('card_id', batch) \
+                .order('card_id') \
+                .order('image_index') \
+                .order('id') \
+                .range(offset, offset + CATALOG_LOAD_PAGE_SIZE - 1) \
+                .execute()
+            images = images_response.data or []
+            
+            # Группируем по card_id, порядок по image_index сохраняется из запроса
+            for image in images:
+                images_by_card.setdefault(image['card_id'], []).append(image)
+            if len(images) < CATALOG_LOAD_PAGE_SIZE:
+                break
+            offset += CATALOG_LOAD_PAGE_SIZE
+    
+    for card in cards:
+        card['images'] = images_by_card.get(card['id'], [])
+    return cards
+
+def encode_card_list_field(value):
+    """Список опций карточки для записи в базу: как есть для JSONB-колонок, строкой для старых TEXT"""
+    value = value if value is not None else []
+    return value if CARDS_JSONB_WRITES else json.dumps(value)
+
+def decode_card_list_fields(card):
+    """
+    Переходный период: JSONB-колонки приходят уже списками, старые TEXT-строки разбираем.
+    После migrate_cards_jsonb.sql строк не остается и json.loads не вызывается
+    """
+    for field in CARD_LIST_FIELDS:
+        value = card.get(field)
+        if isinstance(value, str):
+            try:
+                card[field] = serialization.loads(value)
+            except:
+                card[field] = []  # Если там пусто или ошибка
+        # Если поле уже список, None или другой тип, оставляем как есть
+    return card
+
+def cards_sort(order_type):
+    """Возвращает (колонка, desc) для order_type из cards/filter"""
+    return CARDS_SORTS.get(order_type, ('id', False))
+
+def encode_cards_cursor(card, order_type):
+    """Курсор на позицию после карточки: значение колонки сортировки + id для стабильного порядка"""
+    column, _ = cards_sort(order_type)
+    raw = serialization.dumps_bytes([card.get(column), card['id']])
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def is_cursor_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def decode_cards_cursor(cursor, order_type=None):
+    """
+    Разбирает курсор из encode_cards_cursor, ValueError если курсор битый.
+    Значения курсора подставляются в строку фильтра or_(), поэтому принимаем только числа:
+    id - int, значение колонки сортировки - число или None (для сортировки по id - тот же id)
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, last_id = serialization.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    column, _ = cards_sort(order_type)
+    if not isinstance(last_id, int) or isinstance(last_id, bool):
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    if column == 'id' and value != last_id:
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    if value is not None and not is_cursor_number(value):
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    return value, last_id
+
+def apply_cards_cursor(query, order_type, cursor):
+    """Добавляет к запросу условие "строго после курсора" в порядке (колонка, id)"""
+    value, last_id = decode_cards_cursor(cursor, order_type)
+    column, desc = cards_sort(order_type)
+    
+    if column == 'id':
+        return query.gt('id', last_id)
+    
+    # NULL в Postgres: при DESC идут первыми, при ASC - последними
+    if value is None:
+        if desc:
+            return query.or_(f"and({column}.is.null,id.gt.{last_id}),{column}.not.is.null")
+        return query.is_(column, 'null').gt('id', last_id)
+    
+    op = 'lt' if desc else 'gt'
+    condition = f"{column}.{op}.{value},and({column}.eq.{value},id.gt.{last_id})"
+    if not desc:
+        condition += f",{column}.is.null"
+    return query.or_(condition)
+
+def fetch_cards(filters, limit=None, order_type=None, price_range=None, cursor=None):
+    """
+    Выбирает карточки из базы по фильтрам, с изображениями и списками в виде list.
+    Возвращает tuple: (cards, next_cursor). next_cursor = None, если дальше карточек нет
+    """
+    cards, next_cursor = select_cards(filters, limit, order_type, price_range, cursor)
+    return prepare_cards(cards), next_cursor
+
+def select_cards(filters, limit=None, order_type=None, price_range=None, cursor=None):
+    """Строки cards по фильтрам, как в fetch_cards, но без изображений: (cards, next_cursor)"""
+    # Базовый запрос
+    query = supabase.table('cards').select('*')
+    
+    # Применение фильтров
+    for key, value in filters.items():
+        db_key = 'id' if key == '_id' else key
         
-        public_url = supabase.storage.from_(BUCKET_NAME).get_public_url(path)
+        if isinstance(value, list) and value:
+            query = query.in_(db_key, value)
+        else:
+            query = query.eq(db_key, value)
+    
+    # Фильтр по цене
+    if price_range:
+        query = query.gte('price_number', price_range[0]).lte('price_number', price_range[1])
+    
+    # Продолжение с места, где закончилась прошлая страница
+    if cursor:
+        query = apply_cards_cursor(query, order_type, cursor)
+    
+    # Сортировка, id - тайбрейкер для стабильного порядка между страницами
+    column, desc = cards_sort(order_type)
+    query = query.order(column, desc=desc)
+    if column != 'id':
+        query = query.order('id')
+    
+    # Лимит: берем на одну карточку больше, чтобы понять, есть ли следующая страница
+    if limit:
+        query = query.limit(limit + 1)
+    
+    # Выполнение запроса
+    response = query.execute()
+    cards = response.data
+    
+    next_cursor = None
+    if limit and len(cards) > limit:
+        cards = cards[:limit]
+        next_cursor = encode_cards_cursor(cards[-1], order_type)
+    
+    return cards, next_cursor
+
+def prepare_cards(cards):
+    """Догружает изображения одним запросом и приводит карточки к виду для фронта"""
+    attach_images_to_cards(cards)
+    for card in cards:
+        card['_id'] = card['id']
+        decode_card_list_fields(card)
+    return cards
+
+def select_business_cards(business_id, columns='*', updated_since=None):
+    """
+    Все карточки бизнеса (или измененные после updated_since), постранично:
+    PostgREST отдает не больше 1000 строк за запрос
+    """
+    cards = []
+    start = 0
+    while True:
+        query = supabase.table('cards') \
+            .select(columns) \
+            .eq('business_id', business_id)
+        if updated_since:
+            query = query.gt('updated_at', updated_since)
+        response = query \
+            .order('id') \
+            .range(start, start + CATALOG_LOAD_PAGE_SIZE - 1) \
+            .execute()
+        cards.extend(response.data or [])
+        if len(response.data or []) < CATALOG_LOAD_PAGE_SIZE:
+            break
+        start += CATALOG_LOAD_PAGE_SIZE
+    return cards
+
+def load_business_cards(business_id):
+    """Все карточки бизнеса с изображениями для реплики каталога"""
+    return prepare_cards(select_business_cards(business_id))
+
+def load_search_documents(business_id):
+    """Текстовые поля карточек бизнеса для поискового индекса"""
+    return select_business_cards(business_id, 'id, title, description, category')
+
+# Поисковые индексы строятся при первом cards/search бизнеса
+catalog_search = CatalogSearch(
+    load_search_documents,
+    reload_interval=float(os.getenv('CATALOG_SEARCH_RELOAD', '600'))
+)
+
+def load_card(card_id):
+    """Одна карточка с изображениями или None, если ее уже нет"""
+    response = supabase.table('cards').select('*').eq('id', card_id).execute()
+    if not response.data:
+        return None
+    return prepare_cards(response.data)[0]
+
+# Реплика каталога в памяти. Бизнес загружается при первом обращении (cards/facets всегда
+# считаются по ней), cards/filter отвечает из нее только при CATALOG_STORE_ENABLED=1
+catalog_store = CatalogStore(
+    load_business_cards,
+    load_card,
+    sorts=list(CARDS_SORTS.values()) + [('id', False)],
+    reconcile_interval=float(os.getenv('CATALOG_STORE_RECONCILE', '300')),
+    spawn=socketio.start_background_task,
+    columnar=os.getenv('CATALOG_STORE_ENGINE', 'indexed') == 'columnar',  # columnar - NumPy-вычислитель
+    price_buckets=[int(edge) for edge in os.getenv('FACET_PRICE_BUCKETS', '0,1000,2000,3000,5000,7000,10000,15000').split(',')]
+)
+CATALOG_STORE_SERVES_FILTER = os.getenv('CATALOG_STORE_ENABLED', '0') == '1'
+
+def query_catalog_store(filters, limit, order_type, price_range, cursor):
+    """
+    Отвечает на cards/filter из реплики каталога. None - запрос нельзя ответить из реплики
+    (нет одного business_id или id уже загруженной карточки, незнакомая колонка и т.п.)
+    """
+    business_id = filters.get('business_id')
+    if business_id is None or isinstance(business_id, list):
+        card_id = filters.get('_id', filters.get('id'))
+        if card_id is None or isinstance(card_id, list):
+            return None
+        business_id = catalog_store.find_business(card_id)
+        if business_id is None:
+            return None
+    
+    catalog = catalog_store.get(business_id)
+    after = decode_cards_cursor(cursor, order_type) if cursor else None
+    cards = catalog.query(filters, cards_sort(order_type), price_range, after, limit + 1 if limit else None)
+    if cards is None:
+        return None
+    
+    next_cursor = None
+    if limit and len(cards) > limit:
+        cards = cards[:limit]
+        next_cursor = encode_cards_cursor(cards[-1], order_type)
+    return cards, next_cursor
+
+def catalog_store_page(filters, limit=None, order_type=None, price_range=None, cursor=None):
+    """Страница из реплики каталога, если она включена и может ответить на запрос, иначе None"""
+    if not CATALOG_STORE_SERVES_FILTER:
+        return None
+    try:
+        return query_catalog_store(filters, limit, order_type, price_range, cursor)
+    except Exception as e:
+        # Реплика не загрузилась (ошибка PostgREST и т.п.) - отвечаем как без нее
+        print(f"WARNING: Реплика каталога недоступна, cards/filter идет в Supabase: {e}")
+        return None
+
+def get_cards_page(filters, limit=None, order_type=None, price_range=None, cursor=None):
+    """Страница выдачи: из реплики каталога, если она включена, иначе fetch_cards через кэш"""
+    result = catalog_store_page(filters, limit, order_type, price_range, cursor)
+    if result is not None:
+        return result
+    
+    cache_key = cards_cache.make_key(filters, limit, order_type, price_range, cursor)
+    cached = cards_cache.get(cache_key)
+    if cached is None:
+        # Запись в каталог во время выборки сбросит кэш раньше, чем мы сохраним прочитанное до нее
+        generation = cards_cache.generation()
+        cached = fetch_cards(filters, limit, order_type, price_range, cursor)
+        cards_cache.set(cache_key, cached, catalog_business_ids(filters, cached[0]), generation)
+    return cached
+
+def send_cards_chunk(seq, cards, request_filters):
+    """Одна пачка потоковой выдачи, возвращает номер следующей"""
+    send_message(['cards', 'filter_chunk', seq, cards, request_filters])
+    # Отдаем управление хабу, чтобы пачка ушла клиенту до подготовки следующей
+    socketio.sleep(0)
+    return seq + 1
+
+def stream_cards(filters, limit, order_type, price_range, cursor, chunk_size, request_filters, version=None):
+    """
+    Отправляет выдачу cards/filter пачками: ['cards', 'filter_chunk', seq, cards, filters]
+    и в конце ['cards', 'filter_end', chunks_count, filters, {'next_cursor': ..., 'version': ...}].
+    Карточки выбираются одним запросом на страницу до 1000 строк (или из реплики каталога), фото
+    догружаются по IMAGES_BATCH_SIZE карточек - пачка уходит клиенту, как только готовы ее фото
+    """
+    chunk_size = CARDS_STREAM_CHUNK_SIZE if chunk_size is None else max(1, min(chunk_size, CARDS_MAX_PAGE_SIZE))
+    seq = 0
+    
+    # Реплика отдает карточки уже с фото: запросов в базу нет, только нарезка на пачки
+    result = catalog_store_page(filters, limit, order_type, price_range, cursor)
+    if result is not None:
+        cards, next_cursor = result
+        for start in range(0, len(cards), chunk_size):
+            seq = send_cards_chunk(seq, cards[start:start + chunk_size], request_filters)
+        send_message(['cards', 'filter_end', seq, request_filters, {'next_cursor': next_cursor, 'version': version}])
+        return
+    
+    remaining = limit
+    next_cursor = cursor
+    pending = []
+    while True:
+        # select_cards берет на строку больше страницы - страница на одну меньше лимита PostgREST
+        page_size = CATALOG_LOAD_PAGE_SIZE - 1
+        if remaining:
+            page_size = min(page_size, remaining)
+        cards, next_cursor = select_cards(filters, page_size, order_type, price_range, next_cursor)
+        for start in range(0, len(cards), IMAGES_BATCH_SIZE):
+            pending.extend(prepare_cards(cards[start:start + IMAGES_BATCH_SIZE]))
+            while len(pending) >= chunk_size:
+                seq = send_cards_chunk(seq, pending[:chunk_size], request_filters)
+                pending = pending[chunk_size:]
         
-        return public_url
+        if remaining:
+            remaining -= len(cards)
+        if not next_cursor or (limit and remaining <= 0):
+            break
+    
+    if pending:
+        seq = send_cards_chunk(seq, pending, request_filters)
+    send_message(['cards', 'filter_end', seq, request_filters, {'next_cursor': next_cursor, 'version': version}])
+
+def catalog_business_ids(filters, cards):
+    """Собирает business_id, к которым относится выдача, для инвалидации кэша"""
+    business_ids = set()
+    filter_value = filters.get('business_id')
+    if isinstance(filter_value, list):
+        business_ids.update(filter_value)
+    elif filter_value is not None:
+        business_ids.add(filter_value)
+    for card in cards:
+        business_ids.add(card.get('business_id'))
+    return business_ids
+
+def get_card_business_id(card_id):
+    """Возвращает business_id карточки или None"""
+    business_id = catalog_store.find_business(card_id)
+    if business_id is not None:
+        return business_id
+    try:
+        response = supabase.table('cards').select('business_id').eq('id', card_id).execute()
+        if response.data:
+            return response.data[0].get('business_id')
     except Exception as e:
-        print(f"Error uploading to Supabase Storage: {e}")
+        print(f"WARNING: Не удалось получить business_id карточки {card_id}: {e}")
+    return None
+
+def get_image_card_id(image_id):
+    """Возвращает card_id изображения или None"""
+    try:
+        response = supabase.table('images').select('card_id').eq('id', image_id).execute()
+        if response.data:
+            return response.data[0].get('card_id')
+    except Exception as e:
+        print(f"WARNING: Не удалось получить карточку изображения {image_id}: {e}")
+    return None
+
+def touch_card(card_id):
+    """Отмечает изменение карточки (например, ее фото) для cards/sync"""
+    try:
+        supabase.table('cards').update({'updated_at': datetime.utcnow().isoformat()}).eq('id', card_id).execute()
+    except Exception as e:
+        print(f"WARNING: Не удалось обновить updated_at карточки {card_id}: {e}")
+
+def record_tombstone(business_id, entity, entity_id, card_id=None):
+    """Записывает удаление карточки или изображения в журнал для cards/sync"""
+    if not business_id:
+        print(f"WARNING: Удаление {entity} {entity_id} без business_id не попадет в журнал синхронизации")
+        return
+    try:
+        supabase.table('catalog_tombstones').insert({
+            'business_id': business_id,
+            'entity': entity,
+            'entity_id': str(entity_id),
+            'card_id': str(card_id) if card_id is not None else None,
+            'deleted_at': datetime.utcnow().isoformat()
+        }).execute()
+    except Exception as e:
+        print(f"WARNING: Не удалось записать удаление {entity} {entity_id}: {e}")
+
+def parse_sync_point(value):
+    """Точка синхронизации от клиента -> naive datetime в UTC, None если не разобрать"""
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except (TypeError, ValueError):
         return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def select_tombstones(business_id, since_iso):
+    """Записи журнала удалений после since_iso, постранично - как select_business_cards"""
+    tombstones = []
+    start = 0
+    while True:
+        response = supabase.table('catalog_tombstones') \
+            .select('entity, entity_id, card_id') \
+            .eq('business_id', business_id) \
+            .gt('deleted_at', since_iso) \
+            .order('deleted_at') \
+            .order('id') \
+            .range(start, start + CATALOG_LOAD_PAGE_SIZE - 1) \
+            .execute()
+        tombstones.extend(response.data or [])
+        if len(response.data or []) < CATALOG_LOAD_PAGE_SIZE:
+            break
+        start += CATALOG_LOAD_PAGE_SIZE
+    return tombstones
+
+def sync_catalog(business_id, since):
+    """
+    Изменения каталога бизнеса после точки since: новые и измененные карточки, удаленные
+    карточки и изображения. Без since (или если since старше журнала удалений) - полный каталог
+    """
+    # Точка синхронизации с запасом: запись, начатая до запроса, но сохраненная после, придет повторно
+    started_at = datetime.utcnow()
+    sync_point = (started_at - timedelta(seconds=CATALOG_SYNC_OVERLAP)).isoformat()
+    
+    since_time = parse_sync_point(since) if since else None
+    full = since_time is None or started_at - since_time > timedelta(days=CATALOG_SYNC_MAX_AGE_DAYS)
+    
+    if full:
+        return {
+            'full': True,
+            'cards': prepare_cards(select_business_cards(business_id)),
+            'deleted_cards': [],
+            'deleted_images': [],
+            'sync_point': sync_point
+        }
+    
+    since_iso = since_time.isoformat()
+    cards = prepare_cards(select_business_cards(business_id, updated_since=since_iso))
+    tombstones = select_tombstones(business_id, since_iso)
+    
+    # Карточка, перенесенная из бизнеса и вернувшаяся обратно, есть и в журнале, и в выборке - она не удалена
+    current_ids = {str(card['id']) for card in cards}
+    deleted_cards = []
+    deleted_images = []
+    for tombstone in tombstones:
+        if tombstone['entity'] == 'card':
+            if tombstone['entity_id'] not in current_ids:
+                deleted_cards.append(tombstone['entity_id'])
+        else:
+            deleted_images.append({'id': tombstone['entity_id'], 'card_id': tombstone.get('card_id')})
+    
+    return {
+        'full': False,
+        'cards': cards,
+        'deleted_cards': deleted_cards,
+        'deleted_images': deleted_images,
+        'sync_point': sync_point
+    }
+
+def invalidate_catalog(business_id, card_id=None):
+    """
+    Вызывается после любой записи в cards/images бизнеса. None - бизнес неизвестен, сбрасываем всё.
+    card_id - какую карточку перечитать в реплику каталога
+    """
+    cards_cache.invalidate(business_id)
+    catalog_versions.bump(business_id)
+    try:
+        if card_id is not None:
+            catalog_store.refresh_card(card_id, business_id)
+        else:
+            catalog_store.drop(business_id)
+    except Exception as e:
+        print(f"WARNING: Не удалось обновить реплику каталога, сбрасываем ее: {e}")
+        catalog_store.drop(business_id)
 
 @app.route('/api/business/check-owner/<string:business_id>', methods=['GET'])
 def check_business_owner_endpoint(business_id):
@@ -575,6 +1193,53 @@ def check_business_owner_endpoint(business_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/cards/cache-stats', methods=['GET'])
+def cards_cache_stats():
+    """Счетчики кэша cards/filter для подбора размера и TTL"""
+    stats = cards_cache.stats()
+    stats['catalog_store'] = catalog_store.stats()
+    return jsonify(stats)
+
+@app.route('/api/socket/stats', methods=['GET'])
+def socket_stats():
+    """Время, ошибки и объем данных по действиям сокета - какое действие занимает воркер"""
+    return jsonify(socket_actions.stats())
+
+def collect_process_metrics():
+    """Счетчики, которые уже ведут кэш, реплика каталога и реестр действий - снимаются при запросе /metrics"""
+    cache = cards_cache.stats()
+    store = catalog_store.stats()
+    spool = upload_spool.stats()
+    return [
+        ('cards_cache_requests_total', 'counter', 'Обращения к кэшу cards/filter', {'result': 'hit'}, cache['hits']),
+        ('cards_cache_requests_total', 'counter', 'Обращения к кэшу cards/filter', {'result': 'miss'}, cache['misses']),
+        ('cards_cache_entries', 'gauge', 'Записей в кэше cards/filter', {}, cache['entries']),
+        ('catalog_store_businesses', 'gauge', 'Бизнесов в реплике каталога', {}, store['businesses']),
+        ('catalog_store_cards', 'gauge', 'Карточек в реплике каталога', {}, store['cards']),
+        ('socket_unknown_actions_total', 'counter', 'Сообщения с незарегистрированным действием', {},
+         socket_actions.unknown),
+        ('image_pool_size', 'gauge', 'Процессов в пуле обработки изображений', {}, image_pool.size),
+        ('image_pool_tasks_total', 'counter', 'Задачи обработки изображений', {'where': 'pool'},
+         image_pool.submitted),
+        ('image_pool_tasks_total', 'counter', 'Задачи обработки изображений', {'where': 'inline'}, image_pool.inline),
+        ('image_uploads_coalesced_total', 'counter', 'Дубликаты images/add, дождавшиеся первой загрузки', {},
+         image_uploads.coalesced),
+        ('image_upload_spool_uploads', 'gauge', 'Незавершенные загрузки фото по частям', {}, spool['uploads']),
+        ('image_upload_spool_bytes', 'gauge', 'Принято байт в незавершенных загрузках', {}, spool['bytes']),
+    ]
+
+metrics_registry.add_collector(collect_process_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return app.response_class(metrics_registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/supabase/trace', methods=['GET'])
+def supabase_trace_stats():
+    """Запросы к Supabase по таблицам и по действиям сокета, последние медленные запросы"""
+    return jsonify(supabase_tracer.stats())
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'ok'}), 200
@@ -588,462 +1253,682 @@ def serve(path):
         return send_from_directory(app.static_folder, 'index.html')
 
 
+# Формат сообщений для каждого соединения (sid -> 'json' | 'native' | 'msgpack'), по умолчанию json
+wire_formats = {}
+
+def observe_socket_action(name, seconds, status, size_in):
+    socket_action_seconds.observe(seconds, action=name, status=status)
+    if size_in:
+        socket_payload_bytes.observe(size_in, action=name, direction='in')
+
+# Действия события 'message': (resource, action) -> обработчик, статистика - /api/socket/stats
+socket_actions = ActionRegistry(observer=observe_socket_action)
+
+def send_message(payload):
+    """Отправляет ответ в событие 'message' в формате, согласованном с этим соединением"""
+    fmt = wire_formats.get(request.sid, wire_format.DEFAULT_FORMAT)
+    encoded = wire_format.encode(payload, fmt)
+    size = len(encoded) if isinstance(encoded, (str, bytes)) else None
+    socket_actions.record_reply(size)
+    if size is not None:
+        action = socket_actions.current()
+        socket_payload_bytes.observe(size, action=action.name if action else '', direction='out')
+    emit('message', encoded)
+
 # WebSocket события
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     print('A user connected')
+    socket_connections.inc()
+    socket_connections_total.inc()
+    # Формат можно запросить сразу при подключении: io(url, {auth: {wire: ['msgpack', 'native']}})
+    if isinstance(auth, dict) and auth.get('wire'):
+        wire_formats[request.sid] = wire_format.negotiate(auth.get('wire'))
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    socket_connections.dec()
+    wire_formats.pop(request.sid, None)
     print('A user disconnected')
 
-@socketio.on('message')
-def handle_message(message):
-    message = json.loads(message)
-    print(f"Received message: {message[0]} и мы выполняем  {message[1]} ")
+# Формат сообщений
+@socket_actions.register(
+    'wire', 'negotiate',
+    Arg('formats', (str, list)),
+)
+def wire_negotiate(message, formats):
+    # Ответ уходит еще в старом формате, следующие сообщения - уже в новом
+    fmt = wire_format.negotiate(formats)
+    send_message(['wire', 'negotiate', fmt, wire_format.available_formats()])
+    wire_formats[request.sid] = fmt
+
+# Карточки
+@socket_actions.register(
+    'cards', 'filter',
+    Arg('filters', dict, default={}),
+    Arg('limit', (int, float)),
+    Arg('order_type', int),
+    Arg('price_range', list),
+    Arg('options', dict, default={}),
+)
+def cards_filter(message, filters, limit, order_type, price_range, options):
+    price_range = price_range if price_range and len(price_range) >= 2 else None
+
+    # Постраничная выдача: клиент передает options.cursor (null для первой страницы)
+    cursor = options.get('cursor')
+    if 'cursor' in options and not options.get('stream'):
+        limit = min(limit or CARDS_PAGE_SIZE, CARDS_MAX_PAGE_SIZE)
+    if cursor:
+        try:
+            decode_cards_cursor(cursor, order_type)
+        except ValueError:
+            send_message(['error', 'invalid_cursor'])
+            return
+
+    # Версия есть только у выдачи одного бизнеса
+    business_id = filters.get('business_id')
+    version = catalog_versions.get(business_id) if business_id and not isinstance(business_id, list) else None
+    if version and options.get('version') == version:
+        send_message(['cards', 'not_modified', version, message[2]])
+        return
+
+    # Потоковый режим: отдаем карточки пачками по мере загрузки
+    if options.get('stream'):
+        chunk_size = options.get('chunk_size')
+        if chunk_size is not None and (not isinstance(chunk_size, int) or isinstance(chunk_size, bool)):
+            raise ArgumentError(f"options.chunk_size must be int, got {type(chunk_size).__name__}")
+        stream_cards(filters, limit, order_type, price_range, cursor, chunk_size, message[2], version)
+        return
+
+    cards, next_cursor = get_cards_page(filters, limit, order_type, price_range, cursor)
+    # Пятый элемент - limit клиента как есть (формат ответа до пагинации), примененный - в meta
+    requested_limit = message[3] if len(message) > 3 else None
+    send_message(['cards', 'filter', cards, message[2], requested_limit, {
+        'next_cursor': next_cursor, 'version': version, 'limit': limit
+    }])
+
+@socket_actions.register(
+    'cards', 'sync',
+    Arg('payload', dict, default={}),
+)
+def cards_sync(message, payload):
+    business_id = payload.get('business_id')
+    if not business_id:
+        send_message(['error', 'sync_requires_business_id'])
+        return
+
+    result = sync_catalog(business_id, payload.get('since'))
+    result['version'] = catalog_versions.get(business_id)
+    send_message(['cards', 'sync', result])
+
+@socket_actions.register(
+    'cards', 'facets',
+    Arg('filters', dict, default={}),
+    Arg('price_range', list),
+)
+def cards_facets(message, filters, price_range):
+    price_range = price_range if price_range and len(price_range) >= 2 else None
+    business_id = filters.get('business_id')
+
+    if not business_id or isinstance(business_id, list):
+        send_message(['error', 'facets_require_business_id'])
+        return
+
+    # Считаем по реплике каталога: после первой загрузки бизнеса - без запросов в базу
+    facets = catalog_store.get(business_id).facets_for(filters, price_range)
+    if facets is None:
+        send_message(['error', 'facets_unsupported_filter'])
+        return
+    send_message(['cards', 'facets', facets, message[2]])
+
+@socket_actions.register(
+    'cards', 'search',
+    Arg('payload', dict, default={}),
+)
+def cards_search(message, payload):
+    business_id = payload.get('business_id')
+    query_text = (payload.get('query') or '').strip()
+    search_limit = min(int(payload.get('limit') or 20), CARDS_MAX_PAGE_SIZE)
+
+    if not business_id:
+        send_message(['cards', 'search', {'query': query_text, 'error': 'no business_id'}])
+        return
+
+    results = catalog_search.search(business_id, payload.get('query') or '', search_limit) if query_text else []
+    response_data = {
+        'query': query_text,
+        'results': [{'id': card_id, 'score': score} for card_id, score in results]
+    }
+
+    # По желанию клиента сразу отдаем карточки в порядке релевантности
+    if payload.get('with_cards') and results:
+        ids = [card_id for card_id, _ in results]
+        cards, _ = get_cards_page({'business_id': business_id, '_id': ids})
+        cards_by_id = {str(card['id']): card for card in cards}
+        response_data['cards'] = [cards_by_id[card_id] for card_id in ids if card_id in cards_by_id]
+
+    send_message(['cards', 'search', response_data])
+
+@socket_actions.register(
+    'cards', 'create',
+    Arg('card_data', dict, required=True),
+    Arg('account'),
+    Arg('business_id', required=True),
+)
+def cards_create(message, card_data, account, business_id):
+    # ОБРАБОТКА ЦЕНЫ - ИСПРАВЛЕННАЯ ВЕРСИЯ
+    price_raw = card_data.get('price', '0')
+    price_number = 0
+
+    if isinstance(price_raw, str):
+        # Убираем пробелы и символ ₽, оставляем только цифры
+        price_str = price_raw.replace(' ', '').replace('₽', '').strip()
+        if price_str and price_str.isdigit():
+            price_number = int(price_str)
+        else:
+            # Пробуем извлечь цифры из строки типа "1000 руб"
+            digits = ''.join(filter(str.isdigit, price_str))
+            price_number = int(digits) if digits else 0
+    elif isinstance(price_raw, (int, float)):
+        price_number = int(price_raw)
+
+    # ОБРАБОТКА VIEWS_COUNT - ДОЛЖНА БЫТЬ ЧИСЛОМ
+    views_count_raw = card_data.get('views_count', 0)
+    if isinstance(views_count_raw, (int, float)):
+        views_count = int(views_count_raw)
+    else:
+        views_count = 0
+
+    # ДЕБАГ: Выводим что получаем
+    print(f"DEBUG price_raw: {price_raw}, type: {type(price_raw)}")
+    print(f"DEBUG price_number: {price_number}, type: {type(price_number)}")
+    print(f"DEBUG views_count: {views_count}, type: {type(views_count)}")
+
+    data = {
+        'category': card_data.get('category'),
+        'title': card_data.get('title'),
+        'description': card_data.get('description'),
+        'price': card_data.get('price', ''),
+        'price_number': price_number,  # ← гарантированно число
+        'colors': encode_card_list_field(card_data.get('colors', [])),
+        'counts': encode_card_list_field(card_data.get('counts', [])),
+        'packages': encode_card_list_field(card_data.get('packages', [])),
+        'sizes': encode_card_list_field(card_data.get('sizes', [])),
+        'prices': encode_card_list_field(card_data.get('prices', [])),
+        'business_id': business_id,
+        'views_count': views_count,  # ← гарантированно число
+        'updated_at': datetime.utcnow().isoformat()
+    }
+
+    # ДЕБАГ: Проверяем все значения перед вставкой
+    print("DEBUG data to insert:")
+    for key, value in data.items():
+        print(f"  {key}: {repr(value)} (type: {type(value).__name__})")
 
     try:
-        if message[0] == "cards":
-            if message[1] == "filter":
-                
-                filters = message[2] if len(message) > 2 and message[2] else {}
-                limit = message[3] if len(message) > 3 else None
-    
-                # Безопасно достаем параметры, которых может не быть в коротком запросе
-                order_type = message[4] if len(message) > 4 else None
-                price_range = message[5] if len(message) > 5 and message[5] and len(message[5]) >= 2 else None
-                # Базовый запрос
-                
-                query = supabase.table('cards').select('*')
-                
-                # Применение фильтров
-                for key, value in filters.items():
-                    db_key = 'id' if key == '_id' else key
-                    
-                    if isinstance(value, list) and value:
-                        query = query.in_(db_key, value)
-                    else:
-                        query = query.eq(db_key, value)
-                
-                # Фильтр по цене
-                if price_range:
-                    query = query.gte('price_number', price_range[0]).lte('price_number', price_range[1])
-                
-                # Сортировка
-                if order_type == 0:
-                    query = query.order('views_count', desc=True)
-                elif order_type == 1:
-                    query = query.order('price_number')
-                elif order_type == 2:
-                    query = query.order('price_number', desc=True)
-                else:
-                    query = query.order('id')
-                
-                # Лимит
-                if limit:
-                    query = query.limit(limit)
-                
-                # Выполнение запроса
-                response = query.execute()
-                cards = response.data
-                
-                # Загрузка изображений для каждой карточки
-                for card in cards:
-                    images_response = supabase.table('images') \
-                        .select('*') \
-                        .eq('card_id', card['id']) \
-                        .order('image_index') \
-                        .execute()
-                    card['images'] = images_response.data
-                    card['_id'] = card['id']
-                    
-                    # 2. ДОБАВИТЬ ЭТУ ЧАСТЬ: Превращаем строки из БД обратно в списки для фронта
-                    list_fields = ['colors', 'counts', 'packages', 'sizes', 'prices']  # ← ДОБАВИЛ prices
-                    for field in list_fields:
-                        if field in card and isinstance(card[field], str):
-                            try:
-                                card[field] = json.loads(card[field])
-                            except:
-                                card[field] = []  # Если там пусто или ошибка
-                        # Если поле уже None или другой тип, оставляем как есть
-                emit('message', json.dumps(['cards', 'filter', cards, message[2], message[3]]))
-                
-            elif message[1] == "create":
-                card_data = message[2]
-                business_id = message[4]
-                
-                # ОБРАБОТКА ЦЕНЫ - ИСПРАВЛЕННАЯ ВЕРСИЯ
-                price_raw = card_data.get('price', '0')
-                price_number = 0
-                
-                if isinstance(price_raw, str):
-                    # Убираем пробелы и символ ₽, оставляем только цифры
-                    price_str = price_raw.replace(' ', '').replace('₽', '').strip()
-                    if price_str and price_str.isdigit():
-                        price_number = int(price_str)
-                    else:
-                        # Пробуем извлечь цифры из строки типа "1000 руб"
-                        digits = ''.join(filter(str.isdigit, price_str))
-                        price_number = int(digits) if digits else 0
-                elif isinstance(price_raw, (int, float)):
-                    price_number = int(price_raw)
-                
-                # ОБРАБОТКА VIEWS_COUNT - ДОЛЖНА БЫТЬ ЧИСЛОМ
-                views_count_raw = card_data.get('views_count', 0)
-                if isinstance(views_count_raw, (int, float)):
-                    views_count = int(views_count_raw)
-                else:
-                    views_count = 0
-                
-                # ДЕБАГ: Выводим что получаем
-                print(f"DEBUG price_raw: {price_raw}, type: {type(price_raw)}")
-                print(f"DEBUG price_number: {price_number}, type: {type(price_number)}")
-                print(f"DEBUG views_count: {views_count}, type: {type(views_count)}")
-                
-                data = {
-                    'category': card_data.get('category'),
-                    'title': card_data.get('title'),
-                    'description': card_data.get('description'),
-                    'price': card_data.get('price', ''),
-                    'price_number': price_number,  # ← гарантированно число
-                    'colors': json.dumps(card_data.get('colors', [])),
-                    'counts': json.dumps(card_data.get('counts', [])),
-                    'packages': json.dumps(card_data.get('packages', [])),
-                    'sizes': json.dumps(card_data.get('sizes', [])),
-                    'prices': json.dumps(card_data.get('prices', [])),
-                    'business_id': business_id,
-                    'views_count': views_count  # ← гарантированно число
-                }
-                
-                # ДЕБАГ: Проверяем все значения перед вставкой
-                print("DEBUG data to insert:")
-                for key, value in data.items():
-                    print(f"  {key}: {repr(value)} (type: {type(value).__name__})")
-                
-                try:
-                    response = supabase.table('cards').insert(data).execute()
-                    new_card_id = response.data[0]['id'] if response.data else None
-                    emit('message', json.dumps(['cards', 'created', str(new_card_id)]))
-                except Exception as e:
-                    print(f"ERROR in insert: {e}")
-                    print(f"Problematic data: {data}")
-                    emit('message', json.dumps(['error', 'card_creation', str(e)]))
-                
-            elif message[1] == "update":
-                card_data = message[2]
-                card_id = message[4]
-                business_id = message[5]
-                
-                # ТАКАЯ ЖЕ ОБРАБОТКА ЦЕНЫ КАК ВЫШЕ
-                price_raw = card_data.get('price', '0')
-                price_number = 0
-                
-                if isinstance(price_raw, str):
-                    price_str = price_raw.replace(' ', '').replace('₽', '').strip()
-                    if price_str and price_str.isdigit():
-                        price_number = int(price_str)
-                    else:
-                        digits = ''.join(filter(str.isdigit, price_str))
-                        price_number = int(digits) if digits else 0
-                elif isinstance(price_raw, (int, float)):
-                    price_number = int(price_raw)
-                
-                # ОБРАБОТКА VIEWS_COUNT
-                views_count_raw = card_data.get('views_count', 0)
-                if isinstance(views_count_raw, (int, float)):
-                    views_count = int(views_count_raw)
-                else:
-                    views_count = 0
-                
-                data = {
-                    'category': card_data.get('category'),
-                    'title': card_data.get('title'),
-                    'description': card_data.get('description'),
-                    'price': card_data.get('price', ''),
-                    'price_number': price_number,
-                    'colors': json.dumps(card_data.get('colors', [])),
-                    'counts': json.dumps(card_data.get('counts', [])),
-                    'packages': json.dumps(card_data.get('packages', [])),
-                    'sizes': json.dumps(card_data.get('sizes', [])),
-                    'prices': json.dumps(card_data.get('prices', [])),
-                    'business_id': business_id,
-                    'views_count': views_count
-                }
-                
-                supabase.table('cards').update(data).eq('id', card_id).execute()
-                emit('message', json.dumps(['cards', 'updated', card_id]))
-                
-            elif message[1] == "delete":
-                card_id = message[3]
-                # Удаляем сначала изображения (каскадное удаление в БД)
-                supabase.table('images').delete().eq('card_id', card_id).execute()
-                # Удаляем карточку
-                supabase.table('cards').delete().eq('id', card_id).execute()
-                emit('message', json.dumps(['cards', 'deleted']))
-                
-        elif message[0] == "images":
-            if message[1] == "add":
-                card_id = message[2]
-                image_index = message[3]
-                image_data = message[4]
-                
-                # НУЖНО ЕЩЁ ПОЛУЧИТЬ business_id
-                # Предположим, что он приходит в сообщении или есть в контексте
-                business_id = message[5] if len(message) > 5 else None
-                
-                if not business_id:
-                    # Попробуй получить из контекста или БД
-                    # Например, найди к какой карточке относится business_id
-                    try:
-                        card_response = supabase.table('cards').select('business_id').eq('id', card_id).execute()
-                        if card_response.data:
-                            business_id = card_response.data[0].get('business_id')
-                    except:
-                        pass
-                
-                if business_id and "," in image_data:
-                    # АТОМАРНАЯ ПРОВЕРКА: Сначала пытаемся вставить запись с unique constraint
-                    # или используем более строгую проверку с блокировкой
-                    try:
-                        # Проверяем, не существует ли уже изображение с таким индексом для этой карточки
-                        # Делаем это в транзакционном стиле
-                        existing_image = supabase.table('images') \
-                            .select('*') \
-                            .eq('card_id', card_id) \
-                            .eq('image_index', image_index) \
-                            .execute()
-                        
-                        if existing_image.data and len(existing_image.data) > 0:
-                            print(f"WARNING: Image with index {image_index} already exists for card {card_id}, skipping upload")
-                            # Отправляем сообщение, что изображение уже добавлено
-                            emit("message", json.dumps(["images", "added", image_index, existing_image.data[0]['file']]))
-                            return
-                    except Exception as check_error:
-                        print(f"WARNING: Error checking existing image: {check_error}")
-                        # Продолжаем загрузку, если не удалось проверить
-                    
-                    # ДОБАВЛЯЕМ ДОПОЛНИТЕЛЬНУЮ ПРОВЕРКУ: проверим, не идет ли уже загрузка этого изображения
-                    # Создаем уникальный идентификатор для текущей операции загрузки
-                    upload_key = f"upload_{card_id}_{image_index}"
-                    # В реальном приложении здесь можно использовать redis или другой кэш
-                    # Для простоты добавим задержку перед повторной проверкой
-                    import time
-                    time.sleep(0.1)  # Небольшая задержка для предотвращения race condition
-                    
-                    # Повторная проверка после задержки
-                    try:
-                        existing_image = supabase.table('images') \
-                            .select('*') \
-                            .eq('card_id', card_id) \
-                            .eq('image_index', image_index) \
-                            .execute()
-                        
-                        if existing_image.data and len(existing_image.data) > 0:
-                            print(f"WARNING: Image with index {image_index} already exists for card {card_id} (double-check), skipping upload")
-                            emit("message", json.dumps(["images", "added", image_index, existing_image.data[0]['file']]))
-                            return
-                    except Exception as double_check_error:
-                        print(f"WARNING: Error in double-check: {double_check_error}")
-                    
-                    # Декодируем base64
-                    image_data_binary = base64.b64decode(image_data.split(',')[-1])
-                    
-                    # Сжимаем изображения
-                    compressed_image = compress_image_to_bytes(image_data_binary, (1200, 1200), 95)
-                    compressed_image_lazy = compress_image_to_bytes(image_data_binary, (100, 100), 75)
-                    
-                    # Генерируем уникальные имена
-                    filename_base = str(uuid.uuid4())
-                    filename = f"{filename_base}.webp"
-                    filename_lazy = f"{filename_base}_lazy.webp"
-                    
-                    # 1. ЗАГРУЖАЕМ В ПАПКУ БИЗНЕСА
-                    public_url = upload_to_business_bucket(
-                        file_data=compressed_image,
-                        business_id=business_id,
-                        card_id=card_id,
-                        filename=filename,
-                        is_lazy=False
-                    )
-                    
-                    public_url_lazy = upload_to_business_bucket(
-                        file_data=compressed_image_lazy,
-                        business_id=business_id,
-                        card_id=card_id,
-                        filename=filename_lazy,
-                        is_lazy=True
-                    )
-                    
-                    if public_url and public_url_lazy:
-                        # 2. СОХРАНЯЕМ ССЫЛКИ В ТАБЛИЦУ images
-                        image_record = {
-                            'card_id': card_id,
-                            'file': public_url,
-                            'file_lazy': public_url_lazy,
-                            'image_index': image_index,
-                        }
-                        
-                        supabase.table('images').insert(image_record).execute()
-                        print(f"DEBUG: Image uploaded for card {card_id}, index {image_index}")
-                        emit("message", json.dumps(["images", "added", image_index, public_url]))
-                    else:
-                        emit("message", json.dumps(["error", "image_upload_failed"]))
-                
-            elif message[1] == "delete":
-                image_id = message[2]
-                supabase.table('images').delete().eq('id', image_id).execute()
-                
-        elif message[0] == "hint":
-            if message[1] == "new":
-                hint_data = message[2]
-                
-                data = {
-                    'name': hint_data.get('name'),
-                    'receiver_name': hint_data.get('receiver_name'),
-                    'receiver_phone': hint_data.get('receiver_phone'),
-                    'product': json.dumps(hint_data.get('product', {}))
-                }
-                
-                response = supabase.table('hints').insert(data).execute()
-                hint_id = response.data[0]['id'] if response.data else None
-                emit("message", json.dumps(["hint", "new", str(hint_id)]))
-                
-        elif message[0] == "order":
-            if message[1] == "new":
-                order_data = message[2]
-                data = {
-                    'name': order_data.get('name'),
-                    'phone': order_data.get('phone'),
-                    'anonymous': bool(order_data.get('anonymous')), 
-                    'receiver_name': order_data.get('receiver_name'),
-                    'receiver_phone': order_data.get('receiver_phone'),
-                    'text_of_postcard': order_data.get('text_of_postcard'),
-                    'comment': order_data.get('comment'),
-                    'delivery': order_data.get('delivery'),
-                    'city': order_data.get('city'),
-                    'address': order_data.get('address'),
-                    'date_of_post': order_data.get('date_of_post'),
-                    'time_of_post': order_data.get('time_of_post'),
-                    'request_address': bool(order_data.get('request_address')), 
-                    'request_datetime':  bool(order_data.get('request_datetime')),
-                    'business_id': order_data.get('business_id'),
-                    'items': json.dumps(order_data.get('items', []))
-                }
-                print(data)
-                
-                response = supabase.table('orders').insert(data).execute()
-                order_id = response.data[0]['id'] if response.data else None
-                emit("message", json.dumps(["order", "new", str(order_id)]))
-        elif message[0] == "business_settings":
-            if message[1] == "get":
-                business_id = message[2].get('business_id')
-                settings = get_business_settings(business_id)
-                emit('message', json.dumps(['business_settings', 'get', settings]))
-                
-            elif message[1] == "update":
-                settings_data = message[2]
-                success = update_business_settings(settings_data)
-                if success:
-                    emit('message', json.dumps(['business_settings', 'update', 'success']))
-                else:
-                    emit('message', json.dumps(['error', 'business_settings_update_failed']))
-                    
-            elif message[1] == "upload_logo":
-                business_id = message[2].get('business_id')
-                image_data = message[2].get('image_data')
-                
-                # Проверяем, не является ли это уже URL (защита от цикла)
-                if isinstance(image_data, str) and image_data.startswith('http'):
-                    print(f"WARNING: Получен URL вместо изображения, пропускаем загрузку: {image_data}")
-                    emit('message', json.dumps(['business_settings', 'upload_logo', image_data]))
-                    return
-                
-                logo_url = upload_business_logo(business_id, image_data)
-                if logo_url:
-                    emit('message', json.dumps(['business_settings', 'upload_logo', logo_url]))
-                else:
-                    emit('message', json.dumps(['error', 'logo_upload_failed']))  
-        elif message[0] == "get_bId":
-            if message[1] == "get":
-                payload = message[2]
-                init_data = payload.get("initData")
-                # init_data = "user=%7B%22id%22%3A709652754%2C%22first_name%22%3A%22%D0%9D%D0%B8%D0%BA%D0%B8%D1%82%D0%B0%22%2C%22last_name%22%3A%22%22%2C%22username%22%3A%22Nikitalsa%22%2C%22language_code%22%3A%22ru%22%2C%22is_premium%22%3Atrue%2C%22allows_write_to_pm%22%3Atrue%2C%22photo_url%22%3A%22https%3A%5C%2F%5C%2Ft.me%5C%2Fi%5C%2Fuserpic%5C%2F320%5C%2Fo_LrUJLTfkvZCTQwNQ66VpCZ9vcyFLbguHFkFSi19lE.svg%22%7D&chat_instance=8811103015501849481&chat_type=private&auth_date=1773464886&signature=ZuhCmSyPWiXM9fOh8dn3G1eW2OPjHdI3MGW52IZdRydSKGVcyVfJnIVA7UXWWwuYmbxwmymPfMhqD3UR9CTlCg&hash=ce69f26b5b55b25b361d815eb254c36815a5c49d407a993e8951c95b622f9111"
-                if not init_data:
-
-                    emit("message", json.dumps([
-                        "get_bId",
-                        "error",
-                        {"reason": "no initData"}
-                    ]))
-
-                    return
-                # test_mode_user = {
-                #     "id": 709652754,  # любое число
-                #     "first_name": "Test",
-                #     "username": "test_user"
-                # }
-
-                # tg_id = test_mode_user["id"]
-                # print(f"Ищем бизнес для tg_id: {tg_id}")
-                # # ищем бизнес по tg_id в Supabase
-                # try:
-                #     response = supabase.table('businesses') \
-                #         .select('id') \
-                #         .eq('owner_id', tg_id) \
-                #         .limit(1) \
-                #         .execute()
-
-                #     print(f"Результат запроса: {response.data}")
-                #     business_id = response.data[0]['id'] if response.data else None
-                #     print(f"Найден business_id: {business_id}")
-
-                # except Exception as e:
-                #     print("Supabase error:", e)
-                #     business_id = None
-
-                # emit("message", json.dumps([
-                #     "get_bId",
-                #     "result",
-                #     {"business_id": business_id}
-                # ]))
-                
-                user = verify_telegram_init_data(init_data, TELEGRAM_BOT_TOKEN)
+        response = supabase.table('cards').insert(data).execute()
+        new_card_id = response.data[0]['id'] if response.data else None
+        invalidate_catalog(business_id, new_card_id)
+        if new_card_id is not None:
+            catalog_search.index_card(business_id, {**data, 'id': new_card_id})
+        send_message(['cards', 'created', str(new_card_id)])
+    except Exception as e:
+        print(f"ERROR in insert: {e}")
+        print(f"Problematic data: {data}")
+        send_message(['error', 'card_creation', str(e)])
 
-                if not user:
+@socket_actions.register(
+    'cards', 'update',
+    Arg('card_data', dict, required=True),
+    Arg('account'),
+    Arg('card_id', required=True),
+    Arg('business_id'),
+)
+def cards_update(message, card_data, account, card_id, business_id):
+    # ТАКАЯ ЖЕ ОБРАБОТКА ЦЕНЫ КАК ВЫШЕ
+    price_raw = card_data.get('price', '0')
+    price_number = 0
 
-                    emit("message", json.dumps([
-                        "get_bId",
-                        "error",
-                        {"reason": "invalid telegram auth"}
-                    ]))
+    if isinstance(price_raw, str):
+        price_str = price_raw.replace(' ', '').replace('₽', '').strip()
+        if price_str and price_str.isdigit():
+            price_number = int(price_str)
+        else:
+            digits = ''.join(filter(str.isdigit, price_str))
+            price_number = int(digits) if digits else 0
+    elif isinstance(price_raw, (int, float)):
+        price_number = int(price_raw)
 
-                    return
+    # ОБРАБОТКА VIEWS_COUNT
+    views_count_raw = card_data.get('views_count', 0)
+    if isinstance(views_count_raw, (int, float)):
+        views_count = int(views_count_raw)
+    else:
+        views_count = 0
 
-                tg_id = user["id"]
+    data = {
+        'category': card_data.get('category'),
+        'title': card_data.get('title'),
+        'description': card_data.get('description'),
+        'price': card_data.get('price', ''),
+        'price_number': price_number,
+        'colors': encode_card_list_field(card_data.get('colors', [])),
+        'counts': encode_card_list_field(card_data.get('counts', [])),
+        'packages': encode_card_list_field(card_data.get('packages', [])),
+        'sizes': encode_card_list_field(card_data.get('sizes', [])),
+        'prices': encode_card_list_field(card_data.get('prices', [])),
+        'business_id': business_id,
+        'views_count': views_count,
+        'updated_at': datetime.utcnow().isoformat()
+    }
 
-                business_id = get_business_by_tg_id(tg_id)
+    # Обычно бизнес карточки не меняется: обновляем с условием на него, без отдельного запроса бизнеса.
+    # Пустой ответ - карточка в другом бизнесе (или ее нет): тогда узнаем прежний бизнес и обновляем по id
+    response = None
+    previous_business_id = business_id
+    if business_id is not None:
+        response = supabase.table('cards').update(data).eq('id', card_id).eq('business_id', business_id).execute()
+    if not (response and response.data):
+        previous_business_id = get_card_business_id(card_id)
+        response = supabase.table('cards').update(data).eq('id', card_id).execute()
+    if str(previous_business_id) != str(business_id):
+        # None - прежний бизнес неизвестен, убираем карточку из всех индексов
+        catalog_search.remove_card(previous_business_id, card_id)
+        if previous_business_id is not None:
+            # Для клиентов cards/sync прежнего бизнеса перенос выглядит как удаление
+            if response.data:
+                record_tombstone(previous_business_id, 'card', card_id)
+            invalidate_catalog(previous_business_id, card_id)
+    invalidate_catalog(business_id, card_id)
+    if response.data:
+        catalog_search.index_card(business_id, {**data, 'id': card_id})
+    send_message(['cards', 'updated', card_id])
 
-                emit("message", json.dumps([
-                    "get_bId",
-                    "result",
-                    {
-                        "business_id": business_id
-                    }
-                ]))
-        elif message[0] == "business":
-            if message[1] == "create":
-                business_data = message[2]
-                user_from_tg = message[3]
-                business_id, error_message = create_business(business_data, user_from_tg)
+@socket_actions.register(
+    'cards', 'delete',
+    Arg('account'),
+    Arg('card_id', required=True),
+)
+def cards_delete(message, account, card_id):
+    business_id = get_card_business_id(card_id)
+    # Удаляем сначала изображения (каскадное удаление в БД)
+    supabase.table('images').delete().eq('card_id', card_id).execute()
+    # Удаляем карточку
+    supabase.table('cards').delete().eq('id', card_id).execute()
+    record_tombstone(business_id, 'card', card_id)
+    invalidate_catalog(business_id, card_id)
+    catalog_search.remove_card(business_id, card_id)
+    send_message(['cards', 'deleted'])
 
-                if business_id:
-                    emit('message', json.dumps(['business', 'create', 'success', business_id]))
-                else:
-                    # error_message уже человеко-понятный текст
-                    emit('message', json.dumps(['business', 'create', 'error', error_message or 'Не удалось создать бизнес']))
+# Изображения карточек
+def save_image_record(image_record):
+    """
+    Строка images идемпотентна по (card_id, image_index): upsert по уникальному индексу.
+    Пока create_images_unique_index.sql не выполнена, upsert падает - тогда обычный insert
+    """
+    try:
+        supabase.table('images').upsert(image_record, on_conflict='card_id,image_index').execute()
+    except Exception as e:
+        if 'variants' in image_record and 'variants' in str(e):
+            # Колонки еще нет: сохраняем как раньше, только file и file_lazy
+            print(f"WARNING: Колонка images.variants не найдена ({e}). Выполните add_images_variants.sql")
+            save_image_record({key: value for key, value in image_record.items() if key != 'variants'})
+            return
+        print(f"WARNING: upsert в images не удался ({e}), делаем insert. Выполните create_images_unique_index.sql")
+        supabase.table('images').insert(image_record).execute()
+
+def store_card_image(business_id, card_id, image_index, image_source):
+    """
+    Сжимает фото (байты или путь к собранному файлу загрузки), загружает варианты в Storage
+    и сохраняет ссылки. Возвращает URL или None
+    """
+    # Сжимаем изображения: full (1200px), лесенка ширин IMAGE_WIDTHS и lazy (100px) из одного декодирования
+    with image_processing_seconds.time(variant='card'):
+        renditions = image_pool.run(image_processing.compress_card_renditions, image_source)
+
+    # 1. ЗАГРУЖАЕМ В ПАПКУ БИЗНЕСА (все варианты одновременно, имена - хэши содержимого)
+    urls = upload_many_to_business_bucket(business_id, card_id, [
+        (rendition['data'], content_filename(rendition['data'], rendition['format']), rendition['name'] == 'lazy')
+        for rendition in renditions
+    ])
+    uploaded = {(rendition['name'], rendition['format']): url for rendition, url in zip(renditions, urls)}
+    public_url = uploaded.get(('full', 'webp'))
+    public_url_lazy = uploaded.get(('lazy', 'webp'))
+    if not (public_url and public_url_lazy):
+        return None
+
+    # Манифест для srcset: варианты по формату и ширине. Незагрузившаяся ступень просто не попадает в него
+    variants = sorted((
+        {'url': url, 'width': rendition['width'], 'height': rendition['height'], 'format': rendition['format']}
+        for rendition, url in zip(renditions, urls)
+        if url and rendition['name'] != 'lazy'
+    ), key=lambda variant: (variant['format'], variant['width']))
+
+    # 2. СОХРАНЯЕМ ССЫЛКИ В ТАБЛИЦУ images
+    save_image_record({
+        'card_id': card_id,
+        'file': public_url,
+        'file_lazy': public_url_lazy,
+        'image_index': image_index,
+        'variants': variants,
+    })
+    touch_card(card_id)
+    invalidate_catalog(business_id, card_id)
+    print(f"DEBUG: Image uploaded for card {card_id}, index {image_index}")
+    return public_url
+
+@socket_actions.register(
+    'images', 'add',
+    Arg('card_id', required=True),
+    Arg('image_index'),
+    Arg('image_data'),
+    Arg('business_id'),
+)
+def images_add(message, card_id, image_index, image_data, business_id):
+    # НУЖНО ЕЩЁ ПОЛУЧИТЬ business_id
+    # Предположим, что он приходит в сообщении или есть в контексте
+
+    if not business_id:
+        # Попробуй получить из контекста или БД
+        # Например, найди к какой карточке относится business_id
+        try:
+            card_response = supabase.table('cards').select('business_id').eq('id', card_id).execute()
+            if card_response.data:
+                business_id = card_response.data[0].get('business_id')
+        except:
+            pass
+
+    # image_data - data URL или бинарное вложение Socket.IO (bytes, без base64)
+    is_binary = isinstance(image_data, (bytes, bytearray))
+    if business_id and image_data and (is_binary or "," in image_data):
+        add_card_image(business_id, card_id, image_index, image_bytes(image_data))
+
+def add_card_image(business_id, card_id, image_index, image_source):
+    """Сохраняет фото карточки и отвечает ['images', 'added', ...]. True, если фото сохранено"""
+    # Одновременные дубликаты (двойная отправка, повтор после обрыва) ждут первую загрузку
+    # и получают ее URL. Повтор после завершения перезапишет ту же строку: images - upsert
+    # по уникальному (card_id, image_index), см. create_images_unique_index.sql
+    upload_key = (str(card_id), str(image_index))
+    public_url, leader = image_uploads.run(
+        upload_key, lambda: store_card_image(business_id, card_id, image_index, image_source)
+    )
+    if not leader:
+        print(f"DEBUG: Duplicate upload for card {card_id}, index {image_index} coalesced")
+
+    if public_url:
+        send_message(["images", "added", image_index, public_url])
+    else:
+        send_message(["error", "image_upload_failed"])
+    return bool(public_url)
+
+# Загрузка фото по частям: переживает обрыв соединения, фото не держится в памяти целиком.
+# 1. ['images', 'upload_begin', {card_id, image_index, business_id?, size, chunk_size?}]
+#    -> ['images', 'upload_begin', {upload_id, chunk_size, chunk_count, received_bytes, missing}]
+#    После переподключения - ['images', 'upload_begin', {upload_id}]: в ответе missing - какие части дослать
+# 2. ['images', 'upload_chunk', upload_id, index, data] (data - бинарное вложение или base64)
+#    -> ['images', 'upload_chunk', upload_id, index, received_bytes]
+# 3. ['images', 'upload_commit', upload_id] -> ['images', 'added', image_index, public_url]
+@socket_actions.register(
+    'images', 'upload_begin',
+    Arg('params', dict, required=True),
+)
+def images_upload_begin(message, params):
+    upload_id = params.get('upload_id')
+    meta = None
+    if not upload_id:
+        card_id = params.get('card_id')
+        if card_id is None:
+            raise ArgumentError("card_id is required")
+        business_id = params.get('business_id') or get_card_business_id(card_id)
+        if not business_id:
+            send_message(['error', 'card_not_found', card_id])
+            return
+        meta = {'card_id': card_id, 'image_index': params.get('image_index'), 'business_id': business_id}
+    try:
+        upload = upload_spool.begin(params.get('size'), meta, upload_id=upload_id, chunk_size=params.get('chunk_size'))
+    except (UploadError, TypeError, ValueError) as e:
+        send_upload_error(e)
+        return
+    send_message(['images', 'upload_begin', {**upload.state(), **upload.meta}])
+
+@socket_actions.register(
+    'images', 'upload_chunk',
+    Arg('upload_id', str, required=True),
+    Arg('index', int, required=True),
+    Arg('data', (str, bytes, bytearray), required=True),
+)
+def images_upload_chunk(message, upload_id, index, data):
+    try:
+        upload = upload_spool.write_chunk(upload_id, index, image_bytes(data))
+    except UploadError as e:
+        send_upload_error(e)
+        return
+    send_message(['images', 'upload_chunk', upload_id, index, upload.received_bytes])
+
+@socket_actions.register(
+    'images', 'upload_commit',
+    Arg('upload_id', str, required=True),
+)
+def images_upload_commit(message, upload_id):
+    try:
+        upload = upload_spool.finish(upload_id)
+    except UploadError as e:
+        send_upload_error(e)
+        return
+    meta = upload.meta
+    # Пул обработки читает собранный файл сам - байты фото не проходят через воркер с сокетами
+    if add_card_image(meta['business_id'], meta['card_id'], meta['image_index'], upload.path):
+        upload_spool.discard(upload_id)
+    # Если сохранить не удалось, загрузка остается в спуле: commit можно повторить без повторной отправки частей
+
+def send_upload_error(error):
+    """['error', код, подробности] - клиент по коду решает, начинать ли загрузку заново"""
+    code = getattr(error, 'code', 'invalid_upload')
+    send_message(['error', code, str(error)])
+
+@socket_actions.register(
+    'images', 'delete',
+    Arg('image_id', required=True),
+)
+def images_delete(message, image_id):
+    card_id = get_image_card_id(image_id)
+    business_id = get_card_business_id(card_id) if card_id is not None else None
+    supabase.table('images').delete().eq('id', image_id).execute()
+    record_tombstone(business_id, 'image', image_id, card_id)
+    invalidate_catalog(business_id, card_id)
+
+# Подсказки
+@socket_actions.register(
+    'hint', 'new',
+    Arg('hint_data', dict, required=True),
+)
+def hint_new(message, hint_data):
+    data = {
+        'name': hint_data.get('name'),
+        'receiver_name': hint_data.get('receiver_name'),
+        'receiver_phone': hint_data.get('receiver_phone'),
+        'product': json.dumps(hint_data.get('product', {}))
+    }
+
+    response = supabase.table('hints').insert(data).execute()
+    hint_id = response.data[0]['id'] if response.data else None
+    send_message(["hint", "new", str(hint_id)])
+
+# Заказы
+@socket_actions.register(
+    'order', 'new',
+    Arg('order_data', dict, required=True),
+)
+def order_new(message, order_data):
+    data = {
+        'name': order_data.get('name'),
+        'phone': order_data.get('phone'),
+        'anonymous': bool(order_data.get('anonymous')), 
+        'receiver_name': order_data.get('receiver_name'),
+        'receiver_phone': order_data.get('receiver_phone'),
+        'text_of_postcard': order_data.get('text_of_postcard'),
+        'comment': order_data.get('comment'),
+        'delivery': order_data.get('delivery'),
+        'city': order_data.get('city'),
+        'address': order_data.get('address'),
+        'date_of_post': order_data.get('date_of_post'),
+        'time_of_post': order_data.get('time_of_post'),
+        'request_address': bool(order_data.get('request_address')), 
+        'request_datetime':  bool(order_data.get('request_datetime')),
+        'business_id': order_data.get('business_id'),
+        'items': json.dumps(order_data.get('items', []))
+    }
+    print(data)
+
+    response = supabase.table('orders').insert(data).execute()
+    order_id = response.data[0]['id'] if response.data else None
+    send_message(["order", "new", str(order_id)])
+
+# Настройки бизнеса
+@socket_actions.register(
+    'business_settings', 'get',
+    Arg('payload', dict, required=True),
+)
+def business_settings_get(message, payload):
+    business_id = payload.get('business_id')
+    settings = get_business_settings(business_id)
+    send_message(['business_settings', 'get', settings])
+
+@socket_actions.register(
+    'business_settings', 'update',
+    Arg('settings_data', dict, required=True),
+)
+def business_settings_update(message, settings_data):
+    success = update_business_settings(settings_data)
+    if success:
+        send_message(['business_settings', 'update', 'success'])
+    else:
+        send_message(['error', 'business_settings_update_failed'])
+
+@socket_actions.register(
+    'business_settings', 'upload_logo',
+    Arg('payload', dict, required=True),
+)
+def business_settings_upload_logo(message, payload):
+    business_id = payload.get('business_id')
+    image_data = payload.get('image_data')
+
+    # Проверяем, не является ли это уже URL (защита от цикла)
+    if isinstance(image_data, str) and image_data.startswith('http'):
+        print(f"WARNING: Получен URL вместо изображения, пропускаем загрузку: {image_data}")
+        send_message(['business_settings', 'upload_logo', image_data])
+        return
+
+    logo_url = upload_business_logo(business_id, image_data)
+    if logo_url:
+        send_message(['business_settings', 'upload_logo', logo_url])
+    else:
+        send_message(['error', 'logo_upload_failed'])
+
+# Бизнес по Telegram initData
+@socket_actions.register(
+    'get_bId', 'get',
+    Arg('payload', dict, required=True),
+)
+def get_bid(message, payload):
+    init_data = payload.get("initData")
+    # init_data = "user=%7B%22id%22%3A709652754%2C%22first_name%22%3A%22%D0%9D%D0%B8%D0%BA%D0%B8%D1%82%D0%B0%22%2C%22last_name%22%3A%22%22%2C%22username%22%3A%22Nikitalsa%22%2C%22language_code%22%3A%22ru%22%2C%22is_premium%22%3Atrue%2C%22allows_write_to_pm%22%3Atrue%2C%22photo_url%22%3A%22https%3A%5C%2F%5C%2Ft.me%5C%2Fi%5C%2Fuserpic%5C%2F320%5C%2Fo_LrUJLTfkvZCTQwNQ66VpCZ9vcyFLbguHFkFSi19lE.svg%22%7D&chat_instance=8811103015501849481&chat_type=private&auth_date=1773464886&signature=ZuhCmSyPWiXM9fOh8dn3G1eW2OPjHdI3MGW52IZdRydSKGVcyVfJnIVA7UXWWwuYmbxwmymPfMhqD3UR9CTlCg&hash=ce69f26b5b55b25b361d815eb254c36815a5c49d407a993e8951c95b622f9111"
+    if not init_data:
+
+        send_message([
+            "get_bId",
+            "error",
+            {"reason": "no initData"}
+        ])
+
+        return
+    # test_mode_user = {
+    #     "id": 709652754,  # любое число
+    #     "first_name": "Test",
+    #     "username": "test_user"
+    # }
+
+    # tg_id = test_mode_user["id"]
+    # print(f"Ищем бизнес для tg_id: {tg_id}")
+    # # ищем бизнес по tg_id в Supabase
+    # try:
+    #     response = supabase.table('businesses') \
+    #         .select('id') \
+    #         .eq('owner_id', tg_id) \
+    #         .limit(1) \
+    #         .execute()
+
+    #     print(f"Результат запроса: {response.data}")
+    #     business_id = response.data[0]['id'] if response.data else None
+    #     print(f"Найден business_id: {business_id}")
+
+    # except Exception as e:
+    #     print("Supabase error:", e)
+    #     business_id = None
+
+    # emit("message", json.dumps([
+    #     "get_bId",
+    #     "result",
+    #     {"business_id": business_id}
+    # ]))
+
+    user = verify_telegram_init_data(init_data, TELEGRAM_BOT_TOKEN)
+
+    if not user:
+
+        send_message([
+            "get_bId",
+            "error",
+            {"reason": "invalid telegram auth"}
+        ])
+
+        return
+
+    tg_id = user["id"]
+
+    business_id = get_business_by_tg_id(tg_id)
+
+    send_message([
+        "get_bId",
+        "result",
+        {
+            "business_id": business_id
+        }
+    ])
+
+# Бизнесы
+@socket_actions.register(
+    'business', 'create',
+    Arg('business_data', dict, required=True),
+    Arg('user_from_tg', dict),
+)
+def business_create(message, business_data, user_from_tg):
+    business_id, error_message = create_business(business_data, user_from_tg)
+
+    if business_id:
+        send_message(['business', 'create', 'success', business_id])
+    else:
+        # error_message уже человеко-понятный текст
+        send_message(['business', 'create', 'error', error_message or 'Не удалось создать бизнес'])
+
+@socketio.on('message')
+def handle_message(message):
+    size_in = wire_format.message_size(message)
+    message = wire_format.decode(message)
+    print(f"Received message: {message[0]} и мы выполняем  {message[1]} ")
+
+    try:
+        # Имя scope - только из зарегистрированных действий: клиент не может плодить записи в сводке
+        with supabase_tracer.scope(socket_actions.name_of(message)):
+            dispatched = socket_actions.dispatch(message, size_in)
+        if not dispatched:
+            print(f"WARNING: Неизвестное действие {message[0]}/{message[1]}")
+    except ArgumentError as e:
+        print(f"WARNING: {message[0]}/{message[1]}: {e}")
+        send_message(['error', 'invalid_arguments', f"{message[0]}/{message[1]}", str(e)])
     except Exception as e:
         print(f"Error: {e}")
-        emit('message', json.dumps(['error', str(e)]))
+        send_message(['error', str(e)])
 
 # REST API endpoints
 @app.route('/api/cards', methods=['GET'])
@@ -1073,6 +1958,7 @@ def increment_views(card_id):
         
         current_views = response.data[0]['views_count']
         supabase.table('cards').update({'views_count': current_views + 1}).eq('id', card_id).execute()
+        catalog_store.patch_card(card_id, {'views_count': current_views + 1})
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,145 @@
+"""
+Бенчмарк вычисления cards/filter: индексы реплики каталога (catalog_store),
+колоночный NumPy-вычислитель (catalog_columnar) и, если задан --business-id,
+реальный запрос к PostgREST для сравнения.
+
+Запуск из папки backend:
+    python benchmarks/bench_catalog_filter.py
+    python benchmarks/bench_catalog_filter.py --sizes 1000 10000 --json bench_catalog.json
+    python benchmarks/bench_catalog_filter.py --business-id <uuid>   # + round trip в Supabase
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog_store import BusinessCatalog
+from catalog_columnar import ColumnarCatalog
+
+SORTS = [('views_count', True), ('price_number', False), ('price_number', True), ('id', False)]
+CATEGORIES = ['Букеты', 'Розы', 'Тюльпаны', 'Пионы', 'Подарки', 'Композиции', 'Корзины', 'Свадебные']
+
+
+def make_cards(count, seed=42):
+    """Синтетический каталог в том виде, в каком его отдает fetch_cards"""
+    rnd = random.Random(seed)
+    cards = []
+    for card_id in range(1, count + 1):
+        price = rnd.choice([None] + [rnd.randrange(500, 30000, 100) for _ in range(9)])
+        cards.append({
+            'id': card_id,
+            '_id': card_id,
+            'business_id': 'bench',
+            'category': rnd.choice(CATEGORIES),
+            'title': f'Букет #{card_id}',
+            'price': f'{price} ₽' if price else '',
+            'price_number': price,
+            'views_count': rnd.randint(0, 5000),
+            'colors': ['красный', 'белый'],
+            'images': []
+        })
+    return cards
+
+
+def scenarios(cards):
+    """(имя, фильтры, сортировка, диапазон цен, курсор, лимит) - типовые запросы витрины"""
+    middle = sorted(cards, key=lambda card: card['id'])[len(cards) // 2]
+    return [
+        ('top60_by_views', {'business_id': 'bench'}, SORTS[0], None, None, 60),
+        ('category_price_asc', {'business_id': 'bench', 'category': 'Розы'}, SORTS[1], [1000, 10000], None, 60),
+        ('categories_in_price_desc', {'business_id': 'bench', 'category': ['Пионы', 'Подарки']}, SORTS[2], None, None, 60),
+        ('single_card', {'_id': str(middle['id'])}, SORTS[3], None, None, 1),
+        ('page_after_cursor', {'business_id': 'bench'}, SORTS[0], None, (middle['views_count'], middle['id']), 60),
+        ('full_catalog', {'business_id': 'bench'}, SORTS[3], None, None, None),
+    ]
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'median_ms': round(statistics.median(timings), 4),
+        'min_ms': round(min(timings), 4),
+        'p95_ms': round(sorted(timings)[max(0, int(len(timings) * 0.95) - 1)], 4)
+    }
+
+
+def bench_postgrest(business_id, repeat):
+    """Round trip того же запроса, что строит fetch_cards, к настоящему Supabase"""
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    load_dotenv()
+    client = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
+
+    def top60():
+        client.table('cards').select('*').eq('business_id', business_id) \
+            .order('views_count', desc=True).order('id').limit(61).execute()
+
+    top60()  # прогрев соединения
+    return measure(top60, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--business-id', help='замерить и round trip в PostgREST для этого бизнеса')
+    parser.add_argument('--json', help='куда сохранить результаты')
+    args = parser.parse_args()
+
+    results = {'sizes': {}, 'postgrest': None}
+    if args.business_id:
+        results['postgrest'] = bench_postgrest(args.business_id, args.repeat)
+        print(f"PostgREST top60_by_views: {results['postgrest']['median_ms']:.2f} ms (median)")
+
+    for size in args.sizes:
+        cards = make_cards(size)
+        started = time.perf_counter()
+        indexed = BusinessCatalog('bench', cards, SORTS)
+        indexed_build = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        columnar = ColumnarCatalog(cards)
+        for column, _ in SORTS:
+            if column != 'id':
+                columnar.numeric(column)
+        columnar.text('category')
+        columnar_build = (time.perf_counter() - started) * 1000
+
+        size_results = {
+            'build_ms': {'indexed': round(indexed_build, 2), 'columnar': round(columnar_build, 2)},
+            'queries': {}
+        }
+        print(f"\n{size} карточек: сборка indexed {indexed_build:.1f} ms, columnar {columnar_build:.1f} ms")
+        print(f"  {'запрос':<28}{'indexed, ms':>14}{'columnar, ms':>14}")
+        for name, filters, sort, price_range, after, limit in scenarios(cards):
+            expected = indexed.query(filters, sort, price_range, after, limit)
+            actual = columnar.query(filters, sort, price_range, after, limit)
+            if [card['id'] for card in expected] != [card['id'] for card in actual]:
+                raise AssertionError(f"{name}: indexed и columnar выдали разный результат")
+            row = {
+                'rows': len(expected),
+                'indexed': measure(lambda: indexed.query(filters, sort, price_range, after, limit), args.repeat),
+                'columnar': measure(lambda: columnar.query(filters, sort, price_range, after, limit), args.repeat)
+            }
+            size_results['queries'][name] = row
+            print(f"  {name:<28}{row['indexed']['median_ms']:>14.3f}{row['columnar']['median_ms']:>14.3f}")
+        results['sizes'][str(size)] = size_results
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.json}")
+
+
+if __name__ == '__main__':
+    main()
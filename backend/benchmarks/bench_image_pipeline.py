@@ -0,0 +1,248 @@
+"""
+Бенчмарк обработки фото карточек (image_processing): сгенерированный корпус JPEG/PNG
+от 0.5 до 12 МП (размеры фото телефонов, в том числе HEIC-кадры 4032x3024 после конвертации),
+с альфа-каналом и без, с EXIF-поворотом и без.
+
+Для каждого изображения: время по стадиям (декодирование, ресайз, кодирование) для всех
+вариантов compress_card_renditions, пиковый RSS отдельного процесса и размер результата.
+Затем - сравнение качества/method WebP для full (как в compress_image_to_bytes) и
+пропускная способность: изображений в секунду в одном процессе и в пуле на --workers ядер.
+Сеть не нужна: корпус генерируется в памяти.
+
+Запуск из папки backend:
+    python benchmarks/bench_image_pipeline.py
+    python benchmarks/bench_image_pipeline.py --sizes 0.5,2,12 --repeat 5 --workers 4 --json bench_images.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PIL
+from PIL import Image
+
+import image_processing
+
+ASPECT = 4 / 3  # кадр телефона
+EXIF_ORIENTATION = 0x0112
+# (имя, формат, режим, EXIF Orientation или None)
+KINDS = [
+    ('jpeg', 'JPEG', 'RGB', None),
+    ('jpeg_exif_rotated', 'JPEG', 'RGB', 6),
+    ('png', 'PNG', 'RGB', None),
+    ('png_alpha', 'PNG', 'RGBA', None),
+]
+WEBP_SETTINGS = [(75, 4), (75, 6), (85, 4), (85, 6), (95, 4), (95, 6)]  # (quality, method) для full
+
+
+def make_image(megapixels, kind):
+    """Фото-подобное изображение: градиенты с шумом (однотонная заливка сжимается нереалистично хорошо)"""
+    name, fmt, mode, orientation = kind
+    height = int((megapixels * 1_000_000 / ASPECT) ** 0.5)
+    width = int(height * ASPECT)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    channels = [
+        Image.blend(gradient, noise, 0.35),
+        Image.blend(gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT), noise, 0.2),
+        Image.blend(gradient.transpose(Image.Transpose.ROTATE_180), noise, 0.5),
+    ]
+    if mode == 'RGBA':
+        channels.append(gradient.transpose(Image.Transpose.FLIP_TOP_BOTTOM))
+    image = Image.merge(mode, channels)
+
+    output = BytesIO()
+    options = {'quality': 90} if fmt == 'JPEG' else {'compress_level': 6}
+    if orientation is not None:
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = orientation
+        options['exif'] = exif.tobytes()
+    image.save(output, format=fmt, **options)
+    return {
+        'name': f"{name}_{megapixels:g}mp",
+        'kind': name,
+        'megapixels': megapixels,
+        'width': width,
+        'height': height,
+        'input_bytes': output.tell(),
+        'data': output.getvalue(),
+    }
+
+
+def peak_rss_mb():
+    """Пиковый RSS текущего процесса: ru_maxrss в КБ на Linux и в байтах на macOS"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def profile_stages(image_data, renditions):
+    """Повторяет build_renditions с замером каждой стадии, мс"""
+    renditions = sorted(renditions, key=lambda rendition: (-rendition[1][0], -rendition[1][1]))
+    started = time.perf_counter()
+    image = image_processing.decode_image(image_data, renditions[0][1])
+    image.load()
+    stages = {'decode': (time.perf_counter() - started) * 1000, 'resize': 0.0, 'encode': 0.0}
+    outputs = {}
+    for name, max_size, quality, formats in renditions:
+        started = time.perf_counter()
+        image.thumbnail(max_size, Image.LANCZOS, reducing_gap=3.0)
+        stages['resize'] += (time.perf_counter() - started) * 1000
+        for fmt in formats:
+            started = time.perf_counter()
+            if fmt == 'avif':
+                data = image_processing.encode_avif(image)
+            else:
+                data = image_processing.encode_webp(image, quality)
+            stages['encode'] += (time.perf_counter() - started) * 1000
+            outputs[f"{name}.{fmt}"] = len(data)
+    return stages, outputs
+
+
+def summarize(timings):
+    return {
+        'median_ms': round(statistics.median(timings), 2),
+        'min_ms': round(min(timings), 2),
+        'max_ms': round(max(timings), 2)
+    }
+
+
+def bench_one(megapixels, kind, repeat, webp_settings):
+    """Один элемент корпуса в отдельном процессе: пиковый RSS не смешивается с другими изображениями"""
+    sample = make_image(megapixels, kind)
+    image_data = sample.pop('data')
+    baseline_rss = peak_rss_mb()
+    renditions = image_processing.card_renditions()
+
+    stage_timings = {'decode': [], 'resize': [], 'encode': [], 'total': []}
+    outputs = {}
+    for _ in range(repeat):
+        stages, outputs = profile_stages(image_data, renditions)
+        for stage, value in stages.items():
+            stage_timings[stage].append(value)
+        stage_timings['total'].append(sum(stages.values()))
+
+    full_size = image_processing.CARD_VARIANTS[0][1]
+    webp = {}
+    image = image_processing.decode_image(image_data, full_size)
+    image.thumbnail(full_size, Image.LANCZOS, reducing_gap=3.0)
+    for quality, method in webp_settings:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = BytesIO()
+            image.save(output, format='WEBP', quality=quality, method=method)
+            timings.append((time.perf_counter() - started) * 1000)
+        webp[f"q{quality}_m{method}"] = {**summarize(timings), 'bytes': output.tell()}
+
+    return {
+        **sample,
+        'stages': {stage: summarize(values) for stage, values in stage_timings.items()},
+        'output_bytes': outputs,
+        'output_total_bytes': sum(outputs.values()),
+        'webp_full': webp,
+        'rss_baseline_mb': baseline_rss,
+        'rss_peak_mb': peak_rss_mb(),
+    }
+
+
+def throughput(corpus, workers):
+    """Изображений в секунду: compress_card_renditions по всему корпусу в одном процессе и в пуле"""
+    started = time.perf_counter()
+    for image_data in corpus:
+        image_processing.compress_card_renditions(image_data)
+    single = len(corpus) / (time.perf_counter() - started)
+
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        list(executor.map(image_processing.compress_card_renditions, corpus[:workers]))  # прогрев процессов
+        started = time.perf_counter()
+        list(executor.map(image_processing.compress_card_renditions, corpus))
+        pooled = len(corpus) / (time.perf_counter() - started)
+    return {
+        'images': len(corpus),
+        'single_process_images_per_sec': round(single, 2),
+        'pool_workers': workers,
+        'pool_images_per_sec': round(pooled, 2),
+        'pool_images_per_sec_per_core': round(pooled / workers, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='0.5,2,5,8,12', help='размеры корпуса в мегапикселях через запятую')
+    parser.add_argument('--kinds', default=','.join(kind[0] for kind in KINDS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=image_processing.default_pool_size())
+    parser.add_argument('--no-throughput', action='store_true', help='не измерять пропускную способность')
+    parser.add_argument('--json', help='куда сохранить результаты')
+    args = parser.parse_args()
+
+    sizes = [float(size) for size in args.sizes.split(',') if size.strip()]
+    kinds = [kind for kind in KINDS if kind[0] in args.kinds.split(',')]
+    renditions = image_processing.card_renditions()
+
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'pillow': PIL.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'avif': image_processing.AVIF_ENABLED,
+            'renditions': [
+                {'name': name, 'max_size': list(max_size), 'quality': quality, 'formats': list(formats)}
+                for name, max_size, quality, formats in renditions
+            ],
+        },
+        'repeat': args.repeat,
+        'images': [],
+    }
+    print(f"Pillow {PIL.__version__}, варианты: {', '.join(name for name, *_ in renditions)}, "
+          f"AVIF: {'да' if image_processing.AVIF_ENABLED else 'нет'}")
+    print(f"  {'изображение':<28}{'decode':>9}{'resize':>9}{'encode':>9}{'total':>9}{'RSS, MB':>9}"
+          f"{'вход, KB':>10}{'выход, KB':>11}")
+
+    # Каждое изображение - в новом процессе (spawn), чтобы ru_maxrss относился только к нему
+    context = multiprocessing.get_context('spawn')
+    for megapixels in sizes:
+        for kind in kinds:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                row = executor.submit(bench_one, megapixels, kind, args.repeat, WEBP_SETTINGS).result()
+            results['images'].append(row)
+            stages = row['stages']
+            print(f"  {row['name']:<28}{stages['decode']['median_ms']:>9.1f}{stages['resize']['median_ms']:>9.1f}"
+                  f"{stages['encode']['median_ms']:>9.1f}{stages['total']['median_ms']:>9.1f}"
+                  f"{row['rss_peak_mb']:>9.1f}{row['input_bytes'] / 1024:>10.0f}"
+                  f"{row['output_total_bytes'] / 1024:>11.1f}")
+
+    print("\nWebP full (1200px): медиана кодирования, мс / размер, KB")
+    for row in results['images']:
+        cells = '  '.join(f"{name} {cell['median_ms']:.0f}/{cell['bytes'] / 1024:.0f}"
+                          for name, cell in row['webp_full'].items())
+        print(f"  {row['name']:<28}{cells}")
+
+    if not args.no_throughput:
+        corpus = [make_image(megapixels, kind)['data'] for megapixels in sizes for kind in kinds]
+        results['throughput'] = throughput(corpus, max(1, args.workers))
+        print(f"\nПропускная способность на корпусе из {len(corpus)} изображений:")
+        print(f"  1 процесс: {results['throughput']['single_process_images_per_sec']:.2f} изобр./с")
+        print(f"  пул на {args.workers}: {results['throughput']['pool_images_per_sec']:.2f} изобр./с, "
+              f"{results['throughput']['pool_images_per_sec_per_core']:.2f} на ядро")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.json}")
+
+
+if __name__ == '__main__':
+    main()
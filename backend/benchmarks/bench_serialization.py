@@ -0,0 +1,144 @@
+"""
+Бенчмарк сериализации ответа cards/filter на 500 карточек: стандартный json.dumps
+(как было до serialization.py), serialization.dumps (orjson или fallback) и форматы wire_format.
+Отдельно - разбор TEXT-полей colors/sizes/packages, как в decode_card_list_fields.
+
+Запуск из папки backend:
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --cards 500 --repeat 200 --json bench_serialization.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization
+import wire_format
+
+CATEGORIES = ['Букеты', 'Розы', 'Тюльпаны', 'Пионы', 'Подарки', 'Композиции', 'Корзины', 'Свадебные']
+LIST_FIELDS = ['colors', 'sizes', 'packages']
+
+
+def make_response(count, seed=42):
+    """Ответ ['cards', 'filter', cards, filters, limit, meta] с карточками в виде, как их отдает prepare_cards"""
+    rnd = random.Random(seed)
+    business_id = str(uuid.UUID(int=rnd.getrandbits(128)))
+    created = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    cards = []
+    for card_id in range(1, count + 1):
+        price = rnd.randrange(500, 30000, 100)
+        images = []
+        for position in range(rnd.randint(1, 5)):
+            path = f'{business_id}/{card_id}/{uuid.UUID(int=rnd.getrandbits(128)).hex}.jpg'
+            images.append({
+                'id': card_id * 10 + position,
+                'card_id': card_id,
+                'image_url': f'https://example.supabase.co/storage/v1/object/public/business-images/{path}',
+                'lazy_image_url': f'https://example.supabase.co/storage/v1/object/public/business-images/lazy_{path}',
+                'created_at': (created + datetime.timedelta(minutes=card_id)).isoformat()
+            })
+        cards.append({
+            'id': card_id,
+            '_id': card_id,
+            'business_id': business_id,
+            'category': rnd.choice(CATEGORIES),
+            'title': f'Букет «Весенний» #{card_id}',
+            'description': 'Свежие цветы, авторская упаковка и открытка в подарок. ' * rnd.randint(1, 4),
+            'price': f'{price} ₽',
+            'price_number': price,
+            'views_count': rnd.randint(0, 5000),
+            'colors': ['красный', 'белый', 'розовый'][:rnd.randint(1, 3)],
+            'sizes': [{'name': 'S', 'price': price}, {'name': 'M', 'price': price + 1000}],
+            'packages': [{'name': 'Крафт', 'price': 0}, {'name': 'Шляпная коробка', 'price': 900}],
+            'created_at': created + datetime.timedelta(hours=card_id),
+            'updated_at': created + datetime.timedelta(hours=card_id, minutes=5),
+            'images': images
+        })
+    return ['cards', 'filter', cards, {'business_id': business_id}, count, {'next_cursor': None, 'version': 'bench'}]
+
+
+def stdlib_prepared(payload):
+    """Старый путь: даты и UUID в строки вручную (prepare_data), затем json.dumps"""
+    def prepare(data):
+        if isinstance(data, list):
+            return [prepare(item) for item in data]
+        if isinstance(data, dict):
+            return {k: prepare(v) for k, v in data.items()}
+        if isinstance(data, (int, float, str, bool, type(None))):
+            return data
+        return str(data)
+    return json.dumps(prepare(payload))
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'median_ms': round(statistics.median(timings), 4),
+        'min_ms': round(min(timings), 4),
+        'p95_ms': round(sorted(timings)[max(0, int(len(timings) * 0.95) - 1)], 4)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cards', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=100)
+    parser.add_argument('--json', help='куда сохранить результаты')
+    args = parser.parse_args()
+
+    payload = make_response(args.cards)
+    text_cards = [{field: json.dumps(card[field]) for field in LIST_FIELDS} for card in payload[2]]
+
+    encoders = {
+        'stdlib_json_dumps': lambda: stdlib_prepared(payload),
+        f'serialization.dumps ({serialization.ENGINE})': lambda: serialization.dumps(payload),
+        'serialization.dumps_bytes': lambda: serialization.dumps_bytes(payload),
+    }
+    for fmt in wire_format.available_formats():
+        if fmt != 'native':
+            encoders[f'wire_format.encode ({fmt})'] = lambda fmt=fmt: wire_format.encode(payload, fmt)
+
+    encoded = serialization.dumps_bytes(payload)
+    decoders = {
+        'stdlib_json_loads': lambda: json.loads(encoded),
+        f'serialization.loads ({serialization.ENGINE})': lambda: serialization.loads(encoded),
+        'list_fields stdlib json.loads': lambda: [json.loads(card[field]) for card in text_cards for field in LIST_FIELDS],
+        'list_fields serialization.loads': lambda: [serialization.loads(card[field]) for card in text_cards
+                                                    for field in LIST_FIELDS],
+    }
+
+    results = {'cards': args.cards, 'engine': serialization.ENGINE, 'encode': {}, 'decode': {}}
+    print(f"Ответ cards/filter на {args.cards} карточек, движок: {serialization.ENGINE}")
+    print(f"  {'кодирование':<40}{'median, ms':>12}{'p95, ms':>10}{'bytes':>10}")
+    for name, fn in encoders.items():
+        encoded_value = fn()
+        size = len(encoded_value.encode() if isinstance(encoded_value, str) else encoded_value)
+        row = {**measure(fn, args.repeat), 'bytes': size}
+        results['encode'][name] = row
+        print(f"  {name:<40}{row['median_ms']:>12.3f}{row['p95_ms']:>10.3f}{size:>10}")
+    print(f"  {'разбор':<40}{'median, ms':>12}{'p95, ms':>10}")
+    for name, fn in decoders.items():
+        row = measure(fn, args.repeat)
+        results['decode'][name] = row
+        print(f"  {name:<40}{row['median_ms']:>12.3f}{row['p95_ms']:>10.3f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Кэш результатов cards/filter в памяти процесса"""
+
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class CatalogCache:
+    """
+    Read-through кэш выдачи каталога с TTL и LRU-вытеснением.
+    Каждая запись помечается business_id, к которым она относится,
+    чтобы запись в каталог бизнеса сбрасывала только его выдачи.
+    Записи без известного business_id сбрасываются при любой записи.
+    Выборка, начатая до сброса, не попадает в кэш: generation() берется до выборки
+    и передается в set()
+    """
+
+    def __init__(self, max_entries=256, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, business_ids, value)
+        self._keys_by_business = {}  # business_id -> set(key)
+        self._generation = 0  # растет при каждом invalidate()
+        self._invalidated = {}  # business_id (None - выдачи без business_id) -> generation последнего сброса
+        self._invalidated_all = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    @staticmethod
+    def make_key(filters, limit, order_type, price_range, *extra):
+        """Нормализует параметры запроса в хешируемый ключ"""
+        normalized = {}
+        for key, value in (filters or {}).items():
+            db_key = 'id' if key == '_id' else key
+            if isinstance(value, list):
+                # Для in_() порядок значений не важен
+                value = sorted(value, key=lambda item: json.dumps(item, sort_keys=True, default=str))
+            normalized[db_key] = value
+        return json.dumps(
+            [normalized, limit, order_type, list(price_range) if price_range else None, *extra],
+            sort_keys=True,
+            default=str
+        )
+
+    def get(self, key):
+        """Возвращает закэшированное значение или None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, _, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self):
+        """Метка для set(): берется до выборки из базы"""
+        return self._generation
+
+    def set(self, key, value, business_ids, generation=None):
+        """
+        Сохраняет значение. Закэшированное значение нельзя изменять после сохранения.
+        generation - метка из generation() до выборки: если бизнес выдачи сбросили после нее,
+        значение могло быть прочитано до записи и не сохраняется
+        """
+        if not self.enabled:
+            return
+        tags = {str(b) for b in business_ids if b is not None} or {None}
+        with self._lock:
+            if generation is not None and (
+                    self._invalidated_all > generation
+                    or any(self._invalidated.get(tag, 0) > generation for tag in tags)):
+                self.stale += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, tags, value)
+            for tag in tags:
+                self._keys_by_business.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate(self, business_id=None):
+        """Сбрасывает выдачи бизнеса (и выдачи без business_id). None - сбросить всё"""
+        with self._lock:
+            self._generation += 1
+            if business_id is None:
+                self._invalidated_all = self._generation
+                self._invalidated.clear()
+                dropped = len(self._entries)
+                self._entries.clear()
+                self._keys_by_business.clear()
+            else:
+                self._invalidated[str(business_id)] = self._generation
+                self._invalidated[None] = self._generation
+                keys = self._keys_by_business.get(str(business_id), set()) | self._keys_by_business.get(None, set())
+                dropped = len(keys)
+                for key in list(keys):
+                    self._remove(key)
+            self.invalidations += dropped
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'stale': self.stale
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[1]:
+            keys = self._keys_by_business.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_business[tag]
+
+
+class CatalogVersions:
+    """
+    Версии каталогов бизнесов для ответов "not modified". Версия меняется при каждой
+    записи в cards/images бизнеса. В версию входит метка запуска процесса, поэтому после
+    рестарта версии клиентов не совпадут и каталог будет отдан заново. Раз в max_age секунд
+    версии меняются сами - на случай правок каталога в обход бэкенда
+    """
+
+    def __init__(self, max_age=3600):
+        self.max_age = max_age
+        self.epoch = uuid.uuid4().hex[:8]
+        self._generation = 0  # растет при записи в неизвестный бизнес - меняет версии всех бизнесов
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, business_id):
+        period = int(time.time() // self.max_age) if self.max_age else 0
+        return f"{self.epoch}.{period}.{self._generation}.{self._versions.get(str(business_id), 0)}"
+
+    def bump(self, business_id=None):
+        with self._lock:
+            if business_id is None:
+                self._generation += 1
+            else:
+                key = str(business_id)
+                self._versions[key] = self._versions.get(key, 0) + 1
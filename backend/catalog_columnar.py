@@ -0,0 +1,124 @@
+"""Колоночный вычислитель cards/filter на NumPy: фильтры - булевы маски, сортировка - lexsort"""
+
+try:
+    import numpy as np
+except ImportError:  # numpy не обязателен: без него реплика каталога работает на индексах catalog_store
+    np = None
+
+from catalog_store import _norm
+
+
+class ColumnarCatalog:
+    """
+    Карточки бизнеса в виде колонок NumPy. Числовые колонки (price_number, views_count) - float64
+    с маской NULL, остальные колонки строятся по первому запросу как массивы нормализованных строк.
+    evaluate() возвращает индексы строк в self.cards в порядке выдачи
+    """
+
+    def __init__(self, cards):
+        if np is None:
+            raise RuntimeError("numpy is not installed")
+        self.cards = list(cards)
+        self.columns = set()
+        for card in self.cards:
+            self.columns.update(card.keys())
+        ids = [card['id'] for card in self.cards]
+        if all(isinstance(card_id, int) and not isinstance(card_id, bool) for card_id in ids):
+            self.ids = np.array(ids, dtype=np.int64)
+        else:
+            self.ids = np.array(ids, dtype=object)
+        # Ранг id - целочисленный ключ для lexsort вместо object-массива
+        self.id_rank = np.empty(len(ids), dtype=np.int64)
+        self.id_rank[np.argsort(self.ids, kind='stable')] = np.arange(len(ids))
+        self._numeric = {}
+        self._text = {}
+
+    def __len__(self):
+        return len(self.cards)
+
+    def numeric(self, column):
+        """(значения float64, маска NULL) для числовой колонки"""
+        if column not in self._numeric:
+            raw = [card.get(column) for card in self.cards]
+            nulls = np.array([value is None for value in raw], dtype=bool)
+            values = np.array([0.0 if value is None else float(value) for value in raw], dtype=np.float64)
+            self._numeric[column] = (values, nulls)
+        return self._numeric[column]
+
+    def text(self, column):
+        """Колонка в виде нормализованных строк, как их сравнивает PostgREST eq/in"""
+        if column not in self._text:
+            self._text[column] = np.array([_norm(card.get(column)) for card in self.cards], dtype=object)
+        return self._text[column]
+
+    def mask(self, filters, price_range=None):
+        """Булева маска строк под фильтры cards/filter. None - фильтр нельзя вычислить"""
+        mask = np.ones(len(self.cards), dtype=bool)
+        for key, value in filters.items():
+            db_key = 'id' if key == '_id' else key
+            if db_key == 'business_id':
+                continue
+            if isinstance(value, list) and not value:
+                return None
+            if self.cards and db_key not in self.columns:
+                return None
+            column = self.text(db_key)
+            if isinstance(value, list):
+                mask &= np.isin(column, [_norm(v) for v in value])
+            else:
+                mask &= column == _norm(value)
+
+        if price_range:
+            try:
+                low, high = float(price_range[0]), float(price_range[1])
+            except (TypeError, ValueError):
+                return None
+            values, nulls = self.numeric('price_number')
+            mask &= ~nulls & (values >= low) & (values <= high)
+        return mask
+
+    def after_mask(self, column, desc, value, last_id):
+        """Строки строго после курсора (value, last_id) в порядке ORDER BY column [DESC], id"""
+        id_after = self.ids > last_id
+        if column == 'id':
+            return id_after
+        values, nulls = self.numeric(column)
+        if value is None:
+            # NULL при DESC идут первыми, при ASC - последними
+            return (nulls & id_after) | ~nulls if desc else nulls & id_after
+        value = float(value)
+        past = values < value if desc else values > value
+        result = ~nulls & (past | ((values == value) & id_after))
+        return result if desc else result | nulls
+
+    def order(self, rows, column, desc):
+        """Сортирует индексы строк как ORDER BY column [DESC], id в Postgres"""
+        if column == 'id':
+            return rows[np.argsort(self.id_rank[rows], kind='stable')]
+        values, nulls = self.numeric(column)
+        primary = -values[rows] if desc else values[rows].copy()
+        row_nulls = nulls[rows]
+        primary[row_nulls] = 0.0
+        null_key = ~row_nulls if desc else row_nulls
+        # lexsort: последний ключ - главный
+        return rows[np.lexsort((self.id_rank[rows], primary, null_key))]
+
+    def evaluate(self, filters, sort, price_range=None, after=None, limit=None):
+        """Индексы строк в порядке выдачи. None - запрос нельзя вычислить"""
+        mask = self.mask(filters, price_range)
+        if mask is None:
+            return None
+        column, desc = sort
+        if after is not None:
+            mask &= self.after_mask(column, desc, after[0], after[1])
+        rows = self.order(np.flatnonzero(mask), column, desc)
+        if limit:
+            rows = rows[:limit]
+        return rows
+
+    def query(self, filters, sort, price_range=None, after=None, limit=None):
+        """То же, что BusinessCatalog.query: список карточек или None"""
+        rows = self.evaluate(filters, sort, price_range, after, limit)
+        if rows is None:
+            return None
+        return [self.cards[row] for row in rows]
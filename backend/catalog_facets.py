@@ -0,0 +1,89 @@
+"""Фасетные счетчики каталога: сколько карточек по категории, цвету, размеру, упаковке и цене"""
+
+import json
+
+# category - скалярное поле, остальные - списки опций карточки
+FACET_FIELDS = ['category', 'colors', 'sizes', 'packages']
+DEFAULT_PRICE_BUCKETS = [0, 1000, 2000, 3000, 5000, 7000, 10000, 15000]
+
+
+def _facet_value(value):
+    """Значение фасета как ключ словаря: строки как есть, прочее - в JSON"""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def card_facet_values(card, field):
+    """Различные значения поля карточки: одна карточка считается в значении один раз"""
+    value = card.get(field)
+    if isinstance(value, list):
+        return {_facet_value(item) for item in value}
+    if value is None or value == '':
+        return set()
+    return {_facet_value(value)}
+
+
+class FacetCounts:
+    """
+    Счетчики фасетов, которые ведутся инкрементально: add() при появлении карточки,
+    remove() при удалении. Перед изменением карточки нужно remove() старой версии
+    """
+
+    def __init__(self, price_buckets=None):
+        self.price_buckets = sorted(price_buckets or DEFAULT_PRICE_BUCKETS)
+        self.total = 0
+        self.values = {field: {} for field in FACET_FIELDS}
+        self.bucket_counts = [0] * len(self.price_buckets)
+        self.prices = {}  # price_number -> количество карточек, для min/max с учетом удалений
+
+    def bucket(self, price):
+        """Индекс ценового диапазона: последний порог, не превышающий цену"""
+        index = 0
+        for position, edge in enumerate(self.price_buckets):
+            if price >= edge:
+                index = position
+        return index
+
+    def add(self, card, sign=1):
+        self.total += sign
+        for field in FACET_FIELDS:
+            counts = self.values[field]
+            for value in card_facet_values(card, field):
+                counts[value] = counts.get(value, 0) + sign
+                if counts[value] <= 0:
+                    del counts[value]
+        price = card.get('price_number')
+        if price is not None:
+            self.bucket_counts[self.bucket(price)] += sign
+            self.prices[price] = self.prices.get(price, 0) + sign
+            if self.prices[price] <= 0:
+                del self.prices[price]
+
+    def remove(self, card):
+        self.add(card, sign=-1)
+
+    def snapshot(self):
+        """Фасеты для ответа клиенту"""
+        buckets = []
+        for position, edge in enumerate(self.price_buckets):
+            upper = self.price_buckets[position + 1] if position + 1 < len(self.price_buckets) else None
+            buckets.append({'from': edge, 'to': upper, 'count': self.bucket_counts[position]})
+        return {
+            'total': self.total,
+            **{field: dict(sorted(counts.items(), key=lambda item: (-item[1], str(item[0]))))
+               for field, counts in self.values.items()},
+            'price': {
+                'min': min(self.prices) if self.prices else None,
+                'max': max(self.prices) if self.prices else None,
+                'buckets': buckets
+            }
+        }
+
+
+def compute_facets(cards, price_buckets=None):
+    """Фасеты по произвольному набору карточек (например, по выдаче под фильтрами)"""
+    counts = FacetCounts(price_buckets)
+    for card in cards:
+        counts.add(card)
+    return counts.snapshot()
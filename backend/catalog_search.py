@@ -0,0 +1,261 @@
+"""Полнотекстовый поиск по каталогу: инвертированный индекс по бизнесам и ранжирование BM25"""
+
+import math
+import re
+import threading
+import time
+from bisect import bisect_left
+
+TOKEN_RE = re.compile(r'[0-9a-zа-яё]+')
+
+STOP_WORDS = {
+    'и', 'в', 'во', 'не', 'на', 'с', 'со', 'для', 'по', 'из', 'к', 'ко', 'у', 'о', 'об', 'от', 'до',
+    'а', 'но', 'или', 'что', 'это', 'как', 'за', 'при', 'без', 'под', 'над', 'же', 'ли', 'бы',
+    'the', 'and', 'of', 'for'
+}
+
+# Поля карточки и их веса в BM25F: совпадение в названии важнее, чем в описании
+FIELD_WEIGHTS = {'title': 3.0, 'category': 2.0, 'description': 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_PREFIX_EXPANSIONS = 20
+
+
+# Стеммер Портера для русского языка (Snowball)
+_PERFECTIVE_GROUND = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE = re.compile(r'(с[яь])$')
+_ADJECTIVE = re.compile(r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$')
+_PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+_NOUN = re.compile(r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+_RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+_DER = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+_I = re.compile(r'и$')
+_P = re.compile(r'ь$')
+_NN = re.compile(r'нн$')
+
+
+def stem(word):
+    """Основа русского слова, латиница и числа возвращаются как есть"""
+    word = word.lower().replace('ё', 'е')
+    match = _RV.match(word)
+    if not match:
+        return word
+    prefix, rv = match.groups()
+    temp = _PERFECTIVE_GROUND.sub('', rv, 1)
+    if temp == rv:
+        rv = _REFLEXIVE.sub('', rv, 1)
+        temp = _ADJECTIVE.sub('', rv, 1)
+        if temp != rv:
+            rv = _PARTICIPLE.sub('', temp, 1)
+        else:
+            temp = _VERB.sub('', rv, 1)
+            rv = _NOUN.sub('', rv, 1) if temp == rv else temp
+    else:
+        rv = temp
+    rv = _I.sub('', rv, 1)
+    if _DERIVATIONAL.match(rv):
+        rv = _DER.sub('', rv, 1)
+    temp = _P.sub('', rv, 1)
+    if temp == rv:
+        rv = _SUPERLATIVE.sub('', rv, 1)
+        rv = _NN.sub('н', rv, 1)
+    else:
+        rv = temp
+    return prefix + rv
+
+
+def tokenize(text):
+    """Слова текста без стоп-слов, до стемминга"""
+    if not text:
+        return []
+    return [token for token in TOKEN_RE.findall(str(text).lower().replace('ё', 'е')) if token not in STOP_WORDS]
+
+
+def analyze(text):
+    """Термы для индекса: токены после стемминга"""
+    return [stem(token) for token in tokenize(text)]
+
+
+class BusinessSearchIndex:
+    """Инвертированный индекс карточек одного бизнеса по полям FIELD_WEIGHTS, id карточек - строки"""
+
+    def __init__(self, cards=()):
+        self.loaded_at = time.monotonic()
+        self.postings = {}  # term -> {card_id: {field: tf}}
+        self.doc_lengths = {}  # card_id -> {field: длина в термах}
+        self.doc_terms = {}  # card_id -> set(term), чтобы удалять карточку без полного прохода
+        self.field_totals = {field: 0 for field in FIELD_WEIGHTS}
+        self._vocabulary = None
+        for card in cards:
+            self.upsert(card)
+
+    def upsert(self, card):
+        card_id = str(card['id'])
+        self.remove(card_id)
+        lengths = {}
+        terms = set()
+        for field in FIELD_WEIGHTS:
+            field_terms = analyze(card.get(field))
+            lengths[field] = len(field_terms)
+            self.field_totals[field] += len(field_terms)
+            for term in field_terms:
+                fields = self.postings.setdefault(term, {}).setdefault(card_id, {})
+                fields[field] = fields.get(field, 0) + 1
+                terms.add(term)
+        self.doc_lengths[card_id] = lengths
+        self.doc_terms[card_id] = terms
+        self._vocabulary = None
+
+    def remove(self, card_id):
+        card_id = str(card_id)
+        terms = self.doc_terms.pop(card_id, None)
+        if terms is None:
+            return
+        for field, length in self.doc_lengths.pop(card_id).items():
+            self.field_totals[field] -= length
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(card_id, None)
+                if not docs:
+                    del self.postings[term]
+        self._vocabulary = None
+
+    def expand_prefix(self, token):
+        """Термы словаря, начинающиеся с токена: поиск по мере набора последнего слова"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        prefix = stem(token) if len(token) > 3 else token
+        position = bisect_left(self._vocabulary, prefix)
+        expansions = []
+        while position < len(self._vocabulary) and len(expansions) < MAX_PREFIX_EXPANSIONS:
+            term = self._vocabulary[position]
+            if not term.startswith(prefix):
+                break
+            expansions.append(term)
+            position += 1
+        return expansions
+
+    def search(self, query, limit=20, prefix=True):
+        """[(card_id, score)] по убыванию BM25F. prefix - дополнять последнее слово запроса"""
+        tokens = tokenize(query)
+        if not tokens or not self.doc_lengths:
+            return []
+
+        query_terms = [[stem(token)] for token in tokens]
+        if prefix and query == query.rstrip():
+            expansions = self.expand_prefix(tokens[-1])
+            query_terms[-1] = sorted(set(query_terms[-1]) | set(expansions))
+
+        total_docs = len(self.doc_lengths)
+        averages = {field: (total / total_docs) or 1.0 for field, total in self.field_totals.items()}
+        scores = {}
+        for alternatives in query_terms:
+            # Для слова берем лучший из вариантов (основа или дополнения префикса), чтобы не раздувать счет
+            best = {}
+            for term in alternatives:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (total_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for card_id, fields in docs.items():
+                    lengths = self.doc_lengths[card_id]
+                    score = 0.0
+                    for field, tf in fields.items():
+                        norm = 1 - BM25_B + BM25_B * lengths[field] / averages[field]
+                        score += FIELD_WEIGHTS[field] * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+                    score *= idf
+                    if score > best.get(card_id, 0.0):
+                        best[card_id] = score
+            for card_id, score in best.items():
+                scores[card_id] = scores.get(card_id, 0.0) + score
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(card_id, round(score, 4)) for card_id, score in ranked[:limit]]
+
+
+class CatalogSearch:
+    """
+    Поисковые индексы по business_id. Индекс строится при первом поиске через
+    load_business(business_id) и обновляется write-путями (index_card/remove_card).
+    Раз в reload_interval секунд индекс перестраивается целиком на случай записей в обход бэкенда.
+    Записи, пришедшие во время построения, повторяются на новом индексе перед заменой - как в CatalogStore
+    """
+
+    def __init__(self, load_business, reload_interval=600):
+        self.load_business = load_business
+        self.reload_interval = reload_interval
+        self._indexes = {}
+        self._building = {}  # business_id -> сколько построений идет сейчас
+        self._writes = {}  # business_id -> [(card, card_id)] записей с начала построения, card=None - удаление
+        self._lock = threading.RLock()
+
+    def get(self, business_id):
+        business_id = str(business_id)
+        index = self._indexes.get(business_id)
+        if index is None or time.monotonic() - index.loaded_at > self.reload_interval:
+            index = self._build(business_id)
+        return index
+
+    def _build(self, business_id):
+        with self._lock:
+            writes = self._writes.setdefault(business_id, [])
+            self._building[business_id] = self._building.get(business_id, 0) + 1
+            seen = len(writes)
+        try:
+            index = BusinessSearchIndex(self.load_business(business_id))
+            with self._lock:
+                for card, card_id in writes[seen:]:
+                    if card is not None:
+                        index.upsert(card)
+                    else:
+                        index.remove(card_id)
+                self._indexes[business_id] = index
+            return index
+        finally:
+            with self._lock:
+                self._building[business_id] -= 1
+                if not self._building[business_id]:
+                    del self._building[business_id]
+                    del self._writes[business_id]
+
+    def search(self, business_id, query, limit=20, prefix=True):
+        return self.get(business_id).search(query, limit, prefix)
+
+    def index_card(self, business_id, card):
+        """Обновляет карточку в индексе, если индекс бизнеса уже построен"""
+        with self._lock:
+            writes = self._writes.get(str(business_id))
+            if writes is not None:
+                writes.append((card, card['id']))
+            index = self._indexes.get(str(business_id))
+            if index is not None:
+                index.upsert(card)
+
+    def remove_card(self, business_id, card_id):
+        """Убирает карточку из индекса бизнеса. business_id=None - из всех индексов"""
+        with self._lock:
+            if business_id is None:
+                indexes = list(self._indexes.values())
+                journals = list(self._writes.values())
+            else:
+                indexes = [self._indexes.get(str(business_id))]
+                journals = [self._writes[str(business_id)]] if str(business_id) in self._writes else []
+            for writes in journals:
+                writes.append((None, card_id))
+            for index in indexes:
+                if index is not None:
+                    index.remove(card_id)
+
+    def drop(self, business_id=None):
+        with self._lock:
+            if business_id is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(str(business_id), None)
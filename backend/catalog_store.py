@@ -0,0 +1,381 @@
+"""Реплика каталога в памяти процесса: карточки бизнеса с изображениями и вторичными индексами"""
+
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+
+from catalog_facets import FacetCounts, compute_facets
+
+
+class _Top:
+    """Значение больше любого другого - правая граница для bisect по префиксу ключа"""
+
+    def __lt__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return True
+
+
+_TOP = _Top()
+
+
+def sort_key(card, column, desc):
+    """
+    Ключ сортировки, совпадающий с порядком Postgres для ORDER BY column [DESC], id:
+    при ASC NULL идут последними, при DESC - первыми, id всегда по возрастанию
+    """
+    if column == 'id':
+        return (card['id'],)
+    value = card.get(column)
+    if desc:
+        return (0, 0, card['id']) if value is None else (1, -value, card['id'])
+    return (1, 0, card['id']) if value is None else (0, value, card['id'])
+
+
+def _norm(value):
+    """Сравнение как в PostgREST eq/in: значения приходят строками из URL"""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if value is None:
+        return 'null'
+    return str(value)
+
+
+class BusinessCatalog:
+    """
+    Карточки одного бизнеса: сортированные индексы по (колонка, desc)
+    и хеш-индекс по category. Словари карточек общие с выдачей - их нельзя изменять снаружи.
+    columnar=True - запросы считает ColumnarCatalog (NumPy), он перестраивается после записи
+    """
+
+    def __init__(self, business_id, cards, sorts, columnar=False, price_buckets=None):
+        self.business_id = business_id
+        self.sorts = list(sorts)
+        self.columnar = columnar
+        self._columnar = None
+        self.price_buckets = price_buckets
+        self.facets = FacetCounts(price_buckets)
+        self.loaded_at = time.monotonic()
+        self.cards = {}
+        self.columns = set()
+        self._by_category = {}
+        for card in cards:
+            self.cards[card['id']] = card
+            self.columns.update(card.keys())
+            self._by_category.setdefault(_norm(card.get('category')), set()).add(card['id'])
+            self.facets.add(card)
+        # Первичная сборка индексов одной сортировкой, дальше - insort на каждую запись
+        self._sorted = {
+            (column, desc): sorted(sort_key(card, column, desc) for card in self.cards.values())
+            for column, desc in self.sorts
+        }
+
+    def upsert(self, card):
+        if card['id'] in self.cards:
+            self.remove(card['id'])
+        self._columnar = None
+        self.cards[card['id']] = card
+        self.columns.update(card.keys())
+        self.facets.add(card)
+        for (column, desc), index in self._sorted.items():
+            insort(index, sort_key(card, column, desc))
+        self._by_category.setdefault(_norm(card.get('category')), set()).add(card['id'])
+
+    def remove(self, card_id):
+        card = self.cards.pop(card_id, None)
+        if card is None:
+            return None
+        self._columnar = None
+        self.facets.remove(card)
+        for (column, desc), index in self._sorted.items():
+            key = sort_key(card, column, desc)
+            position = bisect_left(index, key)
+            if position < len(index) and index[position] == key:
+                del index[position]
+        category_ids = self._by_category.get(_norm(card.get('category')))
+        if category_ids is not None:
+            category_ids.discard(card_id)
+        return card
+
+    def patch(self, card_id, fields):
+        """Обновляет поля карточки (например views_count) с перестройкой индексов"""
+        card = self.cards.get(card_id)
+        if card is None:
+            return
+        self.upsert({**card, **fields})
+
+    def price_range_ids(self, low, high):
+        """id карточек с low <= price_number <= high по индексу (price_number, asc)"""
+        index = self._sorted[('price_number', False)]
+        start = bisect_left(index, (0, low))
+        end = bisect_right(index, (0, high, _TOP))
+        return {key[2] for key in index[start:end]}
+
+    def facets_for(self, filters, price_range=None):
+        """
+        Фасеты под фильтрами cards/filter. Без фильтров - готовые инкрементальные счетчики,
+        иначе подсчет по выдаче реплики. None - фильтры нельзя ответить из реплики
+        """
+        if not price_range and not any(key != 'business_id' for key in filters):
+            return self.facets.snapshot()
+        cards = self.query(filters, ('id', False), price_range)
+        if cards is None:
+            return None
+        return compute_facets(cards, self.price_buckets)
+
+    def query(self, filters, sort, price_range=None, after=None, limit=None):
+        """
+        Карточки по фильтрам в порядке sort=(колонка, desc), строго после курсора
+        after=(значение, id), не больше limit. None - запрос нельзя ответить из реплики
+        """
+        if sort not in self._sorted:
+            return None
+        if self.columnar:
+            if self._columnar is None:
+                from catalog_columnar import ColumnarCatalog  # catalog_columnar сам импортирует этот модуль
+                self._columnar = ColumnarCatalog(self.cards.values())
+            return self._columnar.query(filters, sort, price_range, after, limit)
+
+        candidates = None
+        residual = []
+        for key, value in filters.items():
+            db_key = 'id' if key == '_id' else key
+            if db_key == 'business_id':
+                continue
+            if isinstance(value, list) and not value:
+                return None
+            if self.cards and db_key not in self.columns:
+                return None
+            wanted = {_norm(v) for v in value} if isinstance(value, list) else {_norm(value)}
+            if db_key == 'category':
+                ids = set()
+                for category in wanted:
+                    ids |= self._by_category.get(category, set())
+                candidates = ids if candidates is None else candidates & ids
+            elif db_key == 'id':
+                ids = {card_id for card_id in self.cards if _norm(card_id) in wanted}
+                candidates = ids if candidates is None else candidates & ids
+            else:
+                residual.append((db_key, wanted))
+
+        if price_range:
+            try:
+                low, high = float(price_range[0]), float(price_range[1])
+            except (TypeError, ValueError):
+                return None
+            ids = self.price_range_ids(low, high)
+            candidates = ids if candidates is None else candidates & ids
+
+        column, desc = sort
+        index = self._sorted[sort]
+        start = 0
+        if after is not None:
+            value, last_id = after
+            start = bisect_right(index, sort_key({column: value, 'id': last_id}, column, desc))
+
+        result = []
+        for key in index[start:]:
+            card_id = key[-1]
+            if candidates is not None and card_id not in candidates:
+                continue
+            card = self.cards[card_id]
+            if all(_norm(card.get(db_key)) in wanted for db_key, wanted in residual):
+                result.append(card)
+                if limit and len(result) >= limit:
+                    break
+        return result
+
+
+class CatalogStore:
+    """
+    Реплики каталогов по business_id. Бизнес загружается при первом обращении
+    через load_business(business_id), отдельные карточки - через load_card(card_id).
+    Свежесть поддерживается write-путями бэкенда (refresh_card/remove_card/patch_card)
+    и фоновой сверкой с таблицей cards раз в reconcile_interval секунд.
+    Пока бизнес загружается, записи копятся в его журнале: снимок мог быть прочитан до них,
+    поэтому перед заменой реплики они повторяются на снимке
+    """
+
+    def __init__(self, load_business, load_card, sorts, reconcile_interval=300, spawn=None, columnar=False,
+                 price_buckets=None):
+        self.load_business = load_business
+        self.load_card = load_card
+        self.sorts = list(sorts)
+        self.columnar = columnar
+        self.price_buckets = price_buckets
+        self.reconcile_interval = reconcile_interval
+        self.spawn = spawn
+        self._catalogs = {}
+        self._business_by_card = {}
+        self._reconciling = set()
+        self._loading = {}  # business_id -> сколько загрузок идет сейчас
+        self._writes = {}  # business_id -> [(card_id, fields)] записей с начала загрузки
+        self._lock = threading.RLock()
+        self._load_locks = {}
+        self.loads = 0
+        self.reconciles = 0
+
+    def get(self, business_id):
+        """Реплика бизнеса, загружает ее при первом обращении"""
+        business_id = str(business_id)
+        catalog = self._catalogs.get(business_id)
+        if catalog is None:
+            with self._lock:
+                load_lock = self._load_locks.setdefault(business_id, threading.Lock())
+            with load_lock:
+                catalog = self._catalogs.get(business_id)
+                if catalog is None:
+                    catalog = self._load(business_id)
+        elif time.monotonic() - catalog.loaded_at > self.reconcile_interval:
+            self._schedule_reconcile(business_id)
+        return catalog
+
+    def find_business(self, card_id):
+        """business_id загруженной реплики, где есть карточка, иначе None"""
+        return self._business_by_card.get(_norm(card_id))
+
+    def is_loaded(self, business_id):
+        return str(business_id) in self._catalogs
+
+    def refresh_card(self, card_id, business_id=None):
+        """
+        Перечитывает карточку (с изображениями) из базы после записи.
+        Если бизнес известен и его реплика не загружена - в базу не ходим
+        """
+        self._note_write(card_id)
+        if business_id is not None and not self.is_loaded(business_id) and self.find_business(card_id) is None:
+            return
+        card = self.load_card(card_id)
+        if card is None:
+            self.remove_card(card_id)
+            return
+        business_id = str(card.get('business_id'))
+        with self._lock:
+            previous_business = self._business_by_card.get(_norm(card_id))
+            if previous_business is not None and previous_business != business_id:
+                self.remove_card(card_id)
+            catalog = self._catalogs.get(business_id)
+            if catalog is not None:
+                catalog.upsert(card)
+                self._business_by_card[_norm(card_id)] = business_id
+
+    def remove_card(self, card_id):
+        self._note_write(card_id)
+        with self._lock:
+            business_id = self._business_by_card.pop(_norm(card_id), None)
+            catalog = self._catalogs.get(business_id)
+            if catalog is not None:
+                for stored_id in list(catalog.cards):
+                    if _norm(stored_id) == _norm(card_id):
+                        catalog.remove(stored_id)
+
+    def patch_card(self, card_id, fields):
+        self._note_write(card_id, fields)
+        with self._lock:
+            catalog = self._catalogs.get(self._business_by_card.get(_norm(card_id)))
+            if catalog is not None:
+                for stored_id in list(catalog.cards):
+                    if _norm(stored_id) == _norm(card_id):
+                        catalog.patch(stored_id, fields)
+
+    def drop(self, business_id=None):
+        """Выбрасывает реплику бизнеса (None - все), следующее обращение загрузит ее заново"""
+        with self._lock:
+            if business_id is None:
+                self._catalogs.clear()
+                self._business_by_card.clear()
+                return
+            catalog = self._catalogs.pop(str(business_id), None)
+            if catalog is not None:
+                for card_id in catalog.cards:
+                    self._business_by_card.pop(_norm(card_id), None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'businesses': len(self._catalogs),
+                'cards': sum(len(catalog.cards) for catalog in self._catalogs.values()),
+                'loads': self.loads,
+                'reconciles': self.reconciles
+            }
+
+    def _note_write(self, card_id, fields=None):
+        """Добавляет запись в журналы загружаемых бизнесов. fields=None - карточку нужно перечитать"""
+        with self._lock:
+            for writes in self._writes.values():
+                writes.append((card_id, fields))
+
+    def _replay(self, catalog, writes):
+        """Повторяет на еще не опубликованном снимке записи, прошедшие во время его загрузки"""
+        reloaded = set()
+        for card_id, fields in writes:
+            stored_ids = [stored_id for stored_id in catalog.cards if _norm(stored_id) == _norm(card_id)]
+            if fields is not None:
+                for stored_id in stored_ids:
+                    catalog.patch(stored_id, fields)
+                continue
+            if _norm(card_id) in reloaded:
+                continue
+            reloaded.add(_norm(card_id))
+            card = self.load_card(card_id)
+            for stored_id in stored_ids:
+                catalog.remove(stored_id)
+            if card is not None and str(card.get('business_id')) == catalog.business_id:
+                catalog.upsert(card)
+
+    def _load(self, business_id):
+        with self._lock:
+            writes = self._writes.setdefault(business_id, [])
+            self._loading[business_id] = self._loading.get(business_id, 0) + 1
+            seen = len(writes)
+        try:
+            cards = self.load_business(business_id)
+            catalog = BusinessCatalog(business_id, cards, self.sorts, columnar=self.columnar,
+                                      price_buckets=self.price_buckets)
+            while True:
+                with self._lock:
+                    replay = writes[seen:]
+                    seen = len(writes)
+                    if not replay:
+                        previous = self._catalogs.get(business_id)
+                        if previous is not None:
+                            for card_id in previous.cards:
+                                self._business_by_card.pop(_norm(card_id), None)
+                        self._catalogs[business_id] = catalog
+                        for card_id in catalog.cards:
+                            self._business_by_card[_norm(card_id)] = business_id
+                        self.loads += 1
+                        return catalog
+                # Перечитывание идет без блокировки: новые записи попадут в следующий круг
+                self._replay(catalog, replay)
+        finally:
+            with self._lock:
+                self._loading[business_id] -= 1
+                if not self._loading[business_id]:
+                    del self._loading[business_id]
+                    del self._writes[business_id]
+
+    def _schedule_reconcile(self, business_id):
+        with self._lock:
+            if business_id in self._reconciling:
+                return
+            self._reconciling.add(business_id)
+        if self.spawn is None:
+            self._reconcile(business_id)
+        else:
+            self.spawn(self._reconcile, business_id)
+
+    def _reconcile(self, business_id):
+        try:
+            self._load(business_id)
+            self.reconciles += 1
+        except Exception as e:
+            print(f"WARNING: Не удалось сверить каталог бизнеса {business_id}: {e}")
+            # Следующая попытка - через reconcile_interval
+            catalog = self._catalogs.get(business_id)
+            if catalog is not None:
+                catalog.loaded_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._reconciling.discard(business_id)
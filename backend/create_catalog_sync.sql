@@ -0,0 +1,30 @@
+-- SQL миграция для синхронизации каталога (cards/sync): updated_at у карточек и журнал удалений
+-- Выполнить в Supabase SQL Editor до выкладки бэкенда с cards/sync
+
+-- Время последнего изменения карточки (бэкенд выставляет его в cards/create, cards/update и при изменении фото)
+ALTER TABLE cards
+ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+UPDATE cards SET updated_at = NOW() WHERE updated_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_cards_business_id_updated_at ON cards(business_id, updated_at);
+
+-- Журнал удалений: клиент с закэшированным каталогом узнает, какие карточки и фото убрать
+CREATE TABLE IF NOT EXISTS catalog_tombstones (
+    id BIGSERIAL PRIMARY KEY,
+    business_id UUID NOT NULL,
+    entity VARCHAR(10) NOT NULL, -- 'card' или 'image'
+    entity_id TEXT NOT NULL, -- id удаленной карточки или изображения
+    card_id TEXT, -- для изображений: карточка, к которой оно относилось
+    deleted_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_catalog_tombstones_business_id_deleted_at ON catalog_tombstones(business_id, deleted_at);
+
+-- Комментарии к таблице
+COMMENT ON COLUMN cards.updated_at IS 'Время последнего изменения карточки или ее изображений';
+COMMENT ON TABLE catalog_tombstones IS 'Удаленные карточки и изображения для дельта-синхронизации каталога';
+COMMENT ON COLUMN catalog_tombstones.entity IS 'Тип удаленной записи: card или image';
+
+-- Старые записи журнала можно чистить: клиенты, не синхронизировавшиеся дольше, получат полный каталог
+-- DELETE FROM catalog_tombstones WHERE deleted_at < NOW() - INTERVAL '90 days';
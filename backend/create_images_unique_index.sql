@@ -0,0 +1,22 @@
+-- SQL миграция: одно изображение на позицию карточки, images/add пишет через upsert по (card_id, image_index)
+-- Выполнить в Supabase SQL Editor. До миграции бэкенд откатывается на обычный insert
+
+-- Убираем дубликаты, которые успели появиться: оставляем самую раннюю запись для (card_id, image_index)
+DELETE FROM images a
+USING images b
+WHERE a.card_id = b.card_id
+  AND a.image_index = b.image_index
+  AND a.id > b.id;
+
+-- Уникальность позиции фото в карточке: ON CONFLICT (card_id, image_index) для upsert из PostgREST
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint WHERE conname = 'images_card_id_image_index_key'
+    ) THEN
+        ALTER TABLE images
+        ADD CONSTRAINT images_card_id_image_index_key UNIQUE (card_id, image_index);
+    END IF;
+END $$;
+
+COMMENT ON CONSTRAINT images_card_id_image_index_key ON images IS 'Одно изображение на позицию карточки: повторная загрузка перезаписывает строку';
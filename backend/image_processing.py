@@ -0,0 +1,235 @@
+"""
+Преобразования изображений (Pillow) и пул процессов для них. Функции модуля выполняются
+в дочерних процессах, поэтому не зависят от app.py и принимают/возвращают только байты
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+LOGO_SIZE = (400, 400)
+LOGO_QUALITY = 95
+# Варианты фото карточки: (имя, максимальный размер, качество WebP)
+CARD_VARIANTS = [('full', (1200, 1200), 95), ('lazy', (100, 100), 75)]
+# Лесенка ширин для srcset витрины (пустая строка - только full и lazy) и их качество
+CARD_WIDTHS = [int(width) for width in os.getenv('IMAGE_WIDTHS', '200,400,800').split(',') if width.strip()]
+CARD_WIDTH_QUALITY = int(os.getenv('IMAGE_WIDTH_QUALITY', '80'))
+# AVIF для лесенки и full: нужен Pillow >= 11.3 (или pillow-avif-plugin), иначе тихо выключен
+AVIF_QUALITY = int(os.getenv('IMAGE_AVIF_QUALITY', '60'))
+CONTENT_TYPES = {'webp': 'image/webp', 'avif': 'image/avif'}
+# Больше этого числа пикселей не декодируем: 12 МП фото телефона проходит, "декомпрессионная бомба" - нет
+MAX_IMAGE_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', str(50_000_000)))
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+
+def _prepare_mode(image):
+    """Сохраняем прозрачность для PNG, остальное - в RGB (WebP поддерживает оба режима)"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and 'transparency' in image.info):
+        return image.convert("RGBA")
+    if image.mode in ("P", "L"):
+        return image.convert("RGB")
+    return image
+
+
+def decode_image(image_data, max_size):
+    """
+    Открывает изображение (байты или путь к файлу) один раз для всех вариантов. JPEG декодируется сразу в уменьшенном
+    масштабе (draft: 1/2, 1/4, 1/8 средствами libjpeg), но не меньше max_size с любой стороны -
+    сторона может поменяться после EXIF-поворота. Слишком большие изображения отклоняются до декодирования
+    """
+    source = image_data if isinstance(image_data, str) else BytesIO(image_data)
+    image = Image.open(source)
+    width, height = image.size
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValueError(f"image is too large: {width}x{height}")
+    if image.format == 'JPEG':
+        side = max(max_size)
+        image.draft('RGB', (side, side))
+    # Исправляем ориентацию изображения на основе EXIF данных
+    image = ImageOps.exif_transpose(image)
+    return _prepare_mode(image)
+
+
+def avif_supported():
+    try:
+        import pillow_avif  # noqa: F401 - регистрирует AVIF в старых версиях Pillow
+    except ImportError:
+        pass
+    Image.init()
+    return 'AVIF' in Image.SAVE
+
+
+AVIF_ENABLED = os.getenv('IMAGE_AVIF', '0') == '1' and avif_supported()
+
+
+def encode_webp(image, quality):
+    output = BytesIO()
+    image.save(output, format='WEBP', quality=quality, method=6)
+    return output.getvalue()
+
+
+def encode_avif(image, quality=AVIF_QUALITY):
+    output = BytesIO()
+    image.save(output, format='AVIF', quality=quality)
+    return output.getvalue()
+
+
+def build_variants(image_data, variants):
+    """
+    Все варианты из одного декодирования: {имя: WebP-байты}. variants - [(имя, (w, h), качество)].
+    Варианты строятся от большего к меньшему, каждый следующий уменьшается из предыдущего
+    """
+    variants = sorted(variants, key=lambda variant: -max(variant[1]))
+    image = decode_image(image_data, variants[0][1])
+    result = {}
+    for name, max_size, quality in variants:
+        # reducing_gap: сначала быстрый reduce() в целое число раз, затем LANCZOS до точного размера
+        image.thumbnail(max_size, Image.LANCZOS, reducing_gap=3.0)
+        result[name] = encode_webp(image, quality)
+    return result
+
+
+def compress_to_webp(image_data, max_size, quality):
+    """Конвертирует любое изображение в WebP и сжимает"""
+    return build_variants(image_data, [('image', max_size, quality)])['image']
+
+
+def compress_card_image(image_data):
+    """Варианты фото карточки CARD_VARIANTS за одно декодирование: {'full': ..., 'lazy': ...}"""
+    return build_variants(image_data, CARD_VARIANTS)
+
+
+def card_renditions(widths=None, avif=None):
+    """
+    Спецификация всех вариантов фото карточки: [(имя, (w, h), качество WebP, форматы)],
+    от большего к меньшему. lazy остается только WebP - он весит сотню байт
+    """
+    widths = CARD_WIDTHS if widths is None else widths
+    formats = ('webp', 'avif') if (AVIF_ENABLED if avif is None else avif) else ('webp',)
+    (full_name, full_size, full_quality), (lazy_name, lazy_size, lazy_quality) = CARD_VARIANTS
+    renditions = [(full_name, full_size, full_quality, formats)]
+    for width in sorted(set(widths), reverse=True):
+        if lazy_size[0] < width < full_size[0]:
+            # Ограничиваем ширину (srcset с w-дескрипторами), высоту - как у full
+            renditions.append((f"w{width}", (width, full_size[1]), CARD_WIDTH_QUALITY, formats))
+    renditions.append((lazy_name, lazy_size, lazy_quality, ('webp',)))
+    return renditions
+
+
+def build_renditions(image_data, renditions):
+    """
+    Все варианты за одно декодирование: [{'name', 'format', 'width', 'height', 'data'}].
+    Ступень лесенки, которая не меньше предыдущей (исходник меньше ширины), пропускается -
+    full и lazy есть всегда
+    """
+    renditions = sorted(renditions, key=lambda rendition: (-rendition[1][0], -rendition[1][1]))
+    image = decode_image(image_data, renditions[0][1])
+    required = {renditions[0][0], renditions[-1][0]}
+    result = []
+    previous_size = None
+    for name, max_size, quality, formats in renditions:
+        image.thumbnail(max_size, Image.LANCZOS, reducing_gap=3.0)
+        if image.size == previous_size and name not in required:
+            continue
+        previous_size = image.size
+        for fmt in formats:
+            data = encode_avif(image) if fmt == 'avif' else encode_webp(image, quality)
+            result.append({'name': name, 'format': fmt, 'width': image.width, 'height': image.height, 'data': data})
+    return result
+
+
+def compress_card_renditions(image_data):
+    """full, лесенка CARD_WIDTHS (и AVIF, если включен) и lazy за одно декодирование"""
+    return build_renditions(image_data, card_renditions())
+
+
+def compress_logo(image_data):
+    """Логотип бизнеса: до 400x400, WebP с высоким качеством"""
+    return compress_to_webp(image_data, LOGO_SIZE, LOGO_QUALITY)
+
+
+def default_pool_size():
+    """Все ядра, кроме одного - он остается воркеру с сокетами"""
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+class ImagePool:
+    """
+    Ограниченный пул процессов для CPU-тяжелой обработки изображений.
+    run() ждет результат, уступая управление через sleep (socketio.sleep под eventlet),
+    поэтому хаб продолжает обслуживать другие сокеты, пока процессы считают.
+    size=0 - выполнять в текущем процессе (как раньше)
+    """
+
+    def __init__(self, size, sleep=time.sleep, poll_interval=0.005, max_poll_interval=0.05):
+        self.size = size
+        self.sleep = sleep
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self._executor = None
+        self.submitted = 0
+        self.inline = 0
+        self.restarts = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn: дочерний процесс не наследует сокеты и хаб eventlet воркера. Функции задач берутся
+            # из этого модуля, но spawn заново выполняет главный модуль как __mp_main__: под gunicorn
+            # (app:app) это сам gunicorn, а при запуске `python app.py` - app.py целиком, кроме блока
+            # if __name__ == '__main__' (создаются клиент Supabase и реестры, сервер не запускается)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.size, mp_context=multiprocessing.get_context('spawn')
+            )
+        return self._executor
+
+    def run(self, fn, *args):
+        if self.size <= 0:
+            self.inline += 1
+            return fn(*args)
+        try:
+            return self._run_in_pool(fn, *args)
+        except BrokenProcessPool as e:
+            # Процесс пула умер во время задачи (OOM и т.п.): один повтор на новом пуле. В процессе
+            # воркера не повторяем - если задачу убила память, она уронила бы и сервер с сокетами
+            print(f"WARNING: Пул обработки изображений упал ({e}), повторяем задачу на новом пуле")
+            return self._run_in_pool(fn, *args)
+
+    def _run_in_pool(self, fn, *args):
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except (BrokenProcessPool, RuntimeError) as e:
+            # Пул сломан (процесс убит OOM и т.п.) - пересоздаем на следующий вызов, этот выполняем здесь
+            print(f"WARNING: Пул обработки изображений недоступен, выполняем в процессе воркера: {e}")
+            self._reset()
+            self.inline += 1
+            return fn(*args)
+        self.submitted += 1
+
+        interval = self.poll_interval
+        while not future.done():
+            self.sleep(interval)
+            interval = min(interval * 2, self.max_poll_interval)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            self._reset()
+            raise
+
+    def _reset(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            self.restarts += 1
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self):
+        return {'size': self.size, 'submitted': self.submitted, 'inline': self.inline, 'restarts': self.restarts}
@@ -0,0 +1,58 @@
+"""Склейка одинаковых операций, выполняющихся одновременно (single flight)"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class InFlight:
+    """
+    Первый вызов run(key, fn) выполняет fn, вызовы с тем же ключом, пришедшие до его
+    завершения, ждут и получают тот же результат (или то же исключение). После завершения
+    ключ освобождается: повторная операция выполнится заново
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def run(self, key, fn):
+        """(результат, True если fn выполнил этот вызов, False если результат чужой)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        try:
+            call.result = fn()
+            return call.result, True
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    def __len__(self):
+        return len(self._calls)
@@ -0,0 +1,199 @@
+"""Метрики процесса в текстовом формате Prometheus (без prometheus_client)"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы по умолчанию: от миллисекунды до 10 секунд
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name}: labels {sorted(labels)} != {sorted(self.labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}']
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            position = bisect.bisect_left(self.buckets, value)
+            if position < len(self.buckets):
+                state[0][position] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет длительность блока в секундах"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_value(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for edge, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labels, key, ('le', _format_value(float(edge))))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, ("le", "+Inf"))} {count}')
+        lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}')
+        lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Набор метрик процесса. Значения, которые удобнее снять в момент запроса /metrics
+    (размер кэша и т.п.), отдаются коллекторами: add_collector(fn) -> fn() возвращает
+    [(name, kind, help, {labels}, value)]
+    """
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self._metrics = []
+        self._collectors = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(self.prefix + name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._add(Gauge(self.prefix + name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help_text, labels, buckets))
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception as e:
+                print(f"WARNING: Коллектор метрик {collector.__name__} упал: {e}")
+                continue
+            declared = set()
+            for name, kind, help_text, labels, value in samples:
+                name = self.prefix + name
+                if name not in declared:
+                    lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} {kind}'])
+                    declared.add(name)
+                lines.append(f'{name}{_format_labels(tuple(labels), tuple(labels.values()))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def instrument_http_client(client, observe):
+    """
+    Замеряет запросы httpx.Client через event hooks: observe(request, response, seconds).
+    Повторный вызов для того же клиента ничего не делает
+    """
+    if getattr(client, '_metrics_instrumented', False):
+        return
+
+    def on_request(request):
+        request.extensions['metrics_started'] = time.perf_counter()
+
+    def on_response(response):
+        started = response.request.extensions.get('metrics_started')
+        if started is not None:
+            observe(response.request, response, time.perf_counter() - started)
+
+    hooks = client.event_hooks
+    hooks.setdefault('request', []).append(on_request)
+    hooks.setdefault('response', []).append(on_response)
+    client.event_hooks = hooks
+    client._metrics_instrumented = True
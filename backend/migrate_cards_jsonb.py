@@ -0,0 +1,41 @@
+# migrate_cards_jsonb.py
+import os
+from supabase import create_client
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_KEY = os.getenv('SUPABASE_KEY')
+supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+SQL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrate_cards_jsonb.sql')
+LIST_FIELDS = ['colors', 'counts', 'packages', 'sizes', 'prices']
+
+def migrate():
+    """Переводит списки опций карточек в JSONB (через ту же RPC exec_sql, что и populate_database.py)"""
+    with open(SQL_FILE, encoding='utf-8') as f:
+        sql = f.read()
+    
+    try:
+        supabase.postgrest.rpc('exec_sql', {'query': sql}).execute()
+        print("Миграция колонок cards в JSONB выполнена")
+    except Exception as e:
+        print(f"Ошибка миграции: {e}")
+        return False
+    
+    # Проверяем, что PostgREST уже отдает списки, а не строки
+    response = supabase.table('cards').select(', '.join(LIST_FIELDS)).limit(20).execute()
+    legacy = [
+        field for row in response.data or [] for field in LIST_FIELDS
+        if isinstance(row.get(field), str)
+    ]
+    if legacy:
+        print(f"ВНИМАНИЕ: остались строковые значения в полях: {sorted(set(legacy))}")
+        return False
+    
+    print("Можно включать CARDS_JSONB_WRITES=1")
+    return True
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,50 @@
+-- SQL миграция: списки опций карточки (colors, counts, packages, sizes, prices) из TEXT в JSONB
+-- Выполнить в Supabase SQL Editor (или python migrate_cards_jsonb.py) ДО включения CARDS_JSONB_WRITES
+-- Бэкенд читает оба формата, поэтому миграцию можно запускать на работающем сервисе
+
+-- Безопасное приведение: битые и пустые строки превращаются в пустой список
+CREATE OR REPLACE FUNCTION cards_text_to_jsonb(value TEXT)
+RETURNS JSONB AS $$
+BEGIN
+    IF value IS NULL OR btrim(value) = '' THEN
+        RETURN '[]'::jsonb;
+    END IF;
+    RETURN value::jsonb;
+EXCEPTION WHEN others THEN
+    RETURN '[]'::jsonb;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+ALTER TABLE cards
+    ALTER COLUMN colors TYPE JSONB USING cards_text_to_jsonb(colors::text),
+    ALTER COLUMN counts TYPE JSONB USING cards_text_to_jsonb(counts::text),
+    ALTER COLUMN packages TYPE JSONB USING cards_text_to_jsonb(packages::text),
+    ALTER COLUMN sizes TYPE JSONB USING cards_text_to_jsonb(sizes::text),
+    ALTER COLUMN prices TYPE JSONB USING cards_text_to_jsonb(prices::text);
+
+ALTER TABLE cards
+    ALTER COLUMN colors SET DEFAULT '[]'::jsonb,
+    ALTER COLUMN counts SET DEFAULT '[]'::jsonb,
+    ALTER COLUMN packages SET DEFAULT '[]'::jsonb,
+    ALTER COLUMN sizes SET DEFAULT '[]'::jsonb,
+    ALTER COLUMN prices SET DEFAULT '[]'::jsonb;
+
+-- Строки, которые раньше были записаны как JSON-строка внутри JSON ("[\"red\"]"), раскрываем
+UPDATE cards SET colors = cards_text_to_jsonb(colors #>> '{}') WHERE jsonb_typeof(colors) = 'string';
+UPDATE cards SET counts = cards_text_to_jsonb(counts #>> '{}') WHERE jsonb_typeof(counts) = 'string';
+UPDATE cards SET packages = cards_text_to_jsonb(packages #>> '{}') WHERE jsonb_typeof(packages) = 'string';
+UPDATE cards SET sizes = cards_text_to_jsonb(sizes #>> '{}') WHERE jsonb_typeof(sizes) = 'string';
+UPDATE cards SET prices = cards_text_to_jsonb(prices #>> '{}') WHERE jsonb_typeof(prices) = 'string';
+
+COMMENT ON COLUMN cards.colors IS 'Список цветов (JSONB)';
+COMMENT ON COLUMN cards.counts IS 'Список вариантов количества (JSONB)';
+COMMENT ON COLUMN cards.packages IS 'Список вариантов упаковки (JSONB)';
+COMMENT ON COLUMN cards.sizes IS 'Список размеров (JSONB)';
+COMMENT ON COLUMN cards.prices IS 'Конфигурации цен по опциям (JSONB)';
+
+-- Проверка структуры таблицы
+SELECT 
+    column_name, 
+    data_type
+FROM information_schema.columns 
+WHERE table_name = 'cards' AND column_name IN ('colors', 'counts', 'packages', 'sizes', 'prices');
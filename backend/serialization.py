@@ -0,0 +1,69 @@
+"""JSON для сокета и REST: orjson, если установлен, иначе стандартный json с тем же поведением"""
+
+import datetime
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson не обязателен: без него ответы кодирует стандартный json
+    orjson = None
+
+ENGINE = 'orjson' if orjson is not None else 'json'
+
+
+def default(value):
+    """Типы, которых нет в JSON: даты - ISO 8601, UUID и Decimal - строкой, множества - списком"""
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode('utf-8', errors='replace')
+    if hasattr(value, 'tolist'):  # скаляры и массивы numpy из реплики каталога
+        return value.tolist()
+    return str(value)  # uuid.UUID, decimal.Decimal и прочее - как раньше делал prepare_data
+
+
+if orjson is not None:
+    # Даты, UUID и numpy orjson кодирует сам, ключи-не-строки (например, None в фасетах) - как json
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps_bytes(value):
+        """JSON в UTF-8 без пробелов"""
+        return orjson.dumps(value, default=default, option=_ORJSON_OPTIONS)
+
+    def dumps(value, *args, **kwargs):
+        """JSON строкой. Лишние аргументы (separators и т.п. от python-socketio) игнорируются"""
+        return orjson.dumps(value, default=default, option=_ORJSON_OPTIONS).decode()
+
+    def loads(data, *args, **kwargs):
+        return orjson.loads(data)
+else:
+    _encoder = json.JSONEncoder(default=default, ensure_ascii=False, separators=(',', ':'))
+
+    def dumps_bytes(value):
+        """JSON в UTF-8 без пробелов"""
+        return _encoder.encode(value).encode()
+
+    def dumps(value, *args, **kwargs):
+        """JSON строкой. Лишние аргументы (separators и т.п. от python-socketio) игнорируются"""
+        return _encoder.encode(value)
+
+    def loads(data, *args, **kwargs):
+        return json.loads(data)
+
+
+try:
+    from flask.json.provider import JSONProvider
+except ImportError:  # для бенчмарков и скриптов без Flask
+    JSONProvider = None
+
+if JSONProvider is not None:
+    class FastJSONProvider(JSONProvider):
+        """jsonify() и request.get_json() Flask через этот модуль: app.json = FastJSONProvider(app)"""
+
+        def dumps(self, obj, **kwargs):
+            return dumps(obj)
+
+        def loads(self, s, **kwargs):
+            return loads(s)
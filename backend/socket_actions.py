@@ -0,0 +1,187 @@
+"""Таблица действий сокета: (resource, action) -> обработчик со схемой аргументов и статистикой по действию"""
+
+import threading
+import time
+
+
+class ArgumentError(ValueError):
+    """Аргументы сообщения не подходят под схему действия"""
+
+
+class Arg:
+    """
+    Позиционный аргумент сообщения [resource, action, arg0, arg1, ...].
+    types - допустимые типы (None - любой), отсутствующее значение или null заменяется на default
+    """
+
+    def __init__(self, name, types=None, required=False, default=None):
+        self.name = name
+        self.types = types
+        self.required = required
+        self.default = default
+
+    def parse(self, message, position):
+        value = message[position] if len(message) > position else None
+        if value is None:
+            if self.required:
+                raise ArgumentError(f"{self.name} is required")
+            # Изменяемые значения по умолчанию копируем, чтобы обработчик не испортил общий объект
+            return self.default.copy() if isinstance(self.default, (dict, list)) else self.default
+        if self.types is not None and not isinstance(value, self.types):
+            expected = '|'.join(t.__name__ for t in (self.types if isinstance(self.types, tuple) else (self.types,)))
+            raise ArgumentError(f"{self.name} must be {expected}, got {type(value).__name__}")
+        return value
+
+
+class ActionStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.invalid = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.replies = 0
+        self.last_error = None
+
+    def as_dict(self, busy_ms):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'invalid': self.invalid,
+            'total_ms': round(self.total_ms, 2),
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'max_ms': round(self.max_ms, 2),
+            'time_share': round(self.total_ms / busy_ms, 4) if busy_ms else 0.0,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'replies': self.replies,
+            'last_error': self.last_error
+        }
+
+
+class Action:
+    def __init__(self, resource, action, handler, args):
+        self.resource = resource
+        self.action = action
+        self.handler = handler
+        self.args = list(args)
+        self.stats = ActionStats()
+
+    @property
+    def name(self):
+        return f"{self.resource}/{self.action}"
+
+    def parse(self, message):
+        return {arg.name: arg.parse(message, position) for position, arg in enumerate(self.args, start=2)}
+
+
+class ActionRegistry:
+    """
+    Реестр действий сокета. Обработчик регистрируется декоратором:
+
+        @actions.register('cards', 'delete', Arg('account'), Arg('card_id', required=True))
+        def cards_delete(message, account, card_id): ...
+
+    и вызывается как handler(message, **аргументы по схеме). dispatch() ищет действие по словарю,
+    замеряет время, считает ошибки и размер входящего сообщения, а record_reply() - размер ответов,
+    отправленных во время обработки (поток/гринлет eventlet знает свое текущее действие).
+    observer(name, seconds, status, size_in) вызывается после каждого действия, status - ok/error/invalid
+    """
+
+    def __init__(self, observer=None):
+        self.observer = observer
+        self._actions = {}
+        self._current = threading.local()
+        self._lock = threading.Lock()
+        self.unknown = 0
+        self.started_at = time.time()
+
+    def register(self, resource, action, *args):
+        def decorator(handler):
+            key = (resource, action)
+            if key in self._actions:
+                raise ValueError(f"action {resource}/{action} is already registered")
+            self._actions[key] = Action(resource, action, handler, args)
+            return handler
+        return decorator
+
+    def get(self, resource, action):
+        return self._actions.get((resource, action))
+
+    def dispatch(self, message, size_in=0):
+        """
+        Выполняет действие сообщения. False - действие не зарегистрировано.
+        ArgumentError и исключения обработчика пробрасываются вызывающему после учета в статистике
+        """
+        action = self._lookup(message)
+        if action is None:
+            with self._lock:
+                self.unknown += 1
+            return False
+
+        stats = action.stats
+        status = 'ok'
+        started = time.perf_counter()
+        previous = getattr(self._current, 'action', None)
+        self._current.action = action
+        try:
+            kwargs = action.parse(message)
+            action.handler(message, **kwargs)
+        except ArgumentError as e:
+            status = 'invalid'
+            with self._lock:
+                stats.invalid += 1
+                stats.last_error = str(e)
+            raise
+        except Exception as e:
+            status = 'error'
+            with self._lock:
+                stats.errors += 1
+                stats.last_error = str(e)
+            raise
+        finally:
+            self._current.action = previous
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                stats.calls += 1
+                stats.total_ms += elapsed
+                stats.max_ms = max(stats.max_ms, elapsed)
+                stats.bytes_in += size_in
+            if self.observer is not None:
+                self.observer(action.name, elapsed / 1000, status, size_in)
+        return True
+
+    def _lookup(self, message):
+        return self._actions.get((message[0], message[1])) if len(message) > 1 else None
+
+    def name_of(self, message, unknown='unknown'):
+        """Имя зарегистрированного действия сообщения или unknown - для меток и сводок с ограниченным набором имен"""
+        action = self._lookup(message)
+        return action.name if action is not None else unknown
+
+    def current(self):
+        """Действие, которое сейчас выполняется в этом потоке/гринлете, иначе None"""
+        return getattr(self._current, 'action', None)
+
+    def record_reply(self, size):
+        """Учитывает ответ текущего действия. size=None - размер неизвестен (native-формат)"""
+        action = self.current()
+        if action is None:
+            return
+        with self._lock:
+            action.stats.replies += 1
+            action.stats.bytes_out += size or 0
+
+    def stats(self):
+        """Статистика по действиям, самые затратные по суммарному времени - первыми"""
+        with self._lock:
+            busy_ms = sum(action.stats.total_ms for action in self._actions.values())
+            actions = sorted(self._actions.values(), key=lambda action: -action.stats.total_ms)
+            return {
+                'uptime_s': round(time.time() - self.started_at),
+                'busy_ms': round(busy_ms, 2),
+                'unknown': self.unknown,
+                'actions': {action.name: action.stats.as_dict(busy_ms) for action in actions}
+            }
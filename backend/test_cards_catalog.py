@@ -0,0 +1,446 @@
+import unittest
+import sys
+import os
+import base64
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from unittest import mock
+
+import app
+import serialization
+
+POSTGREST_MAX_ROWS = 1000  # db-max-rows PostgREST: больше строк за запрос не отдается
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+def split_top_level(text):
+    parts, depth, current = [], 0, ''
+    for char in text:
+        if char == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+            continue
+        depth += {'(': 1, ')': -1}.get(char, 0)
+        current += char
+    return parts + [current]
+
+
+def parse_condition(text, combine):
+    checks = []
+    for part in split_top_level(text):
+        if part.startswith('and(') and part.endswith(')'):
+            checks.append(parse_condition(part[4:-1], all))
+            continue
+        column, rest = part.split('.', 1)
+        if rest == 'is.null':
+            checks.append(lambda row, column=column: row.get(column) is None)
+        elif rest == 'not.is.null':
+            checks.append(lambda row, column=column: row.get(column) is not None)
+        else:
+            op, value = rest.split('.', 1)
+            compare = {'eq': lambda a, b: a == b, 'gt': lambda a, b: a > b, 'lt': lambda a, b: a < b}[op]
+            checks.append(lambda row, column=column, value=float(value), compare=compare:
+                          row.get(column) is not None and compare(row.get(column), value))
+    return lambda row: combine(check(row) for check in checks)
+
+
+class FakeQuery:
+    """Запрос к таблице FakeSupabase: фильтры, сортировка и страницы как у PostgREST"""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.operation = None
+        self.payload = None
+        self.columns = None
+        self.filters = []
+        self.orders = []
+        self.bounds = None
+
+    def select(self, columns='*'):
+        self.operation = 'select'
+        self.columns = None if columns == '*' else [column.strip() for column in columns.split(',')]
+        return self
+
+    def insert(self, payload):
+        self.operation, self.payload = 'insert', payload
+        return self
+
+    def update(self, payload):
+        self.operation, self.payload = 'update', payload
+        return self
+
+    def delete(self):
+        self.operation = 'delete'
+        return self
+
+    def _compare(self, column, value, check):
+        def predicate(row):
+            current = row.get(column)
+            if current is None:
+                return False
+            other = float(value) if isinstance(current, (int, float)) else str(value)
+            return check(current, other)
+        self.filters.append(predicate)
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: str(row.get(column)) == str(value))
+        return self
+
+    def in_(self, column, values):
+        expected = {str(value) for value in values}
+        self.filters.append(lambda row: str(row.get(column)) in expected)
+        return self
+
+    def is_(self, column, value):
+        self.filters.append(lambda row: row.get(column) is None)
+        return self
+
+    def gt(self, column, value):
+        return self._compare(column, value, lambda a, b: a > b)
+
+    def gte(self, column, value):
+        return self._compare(column, value, lambda a, b: a >= b)
+
+    def lte(self, column, value):
+        return self._compare(column, value, lambda a, b: a <= b)
+
+    def or_(self, condition):
+        """Логическое дерево PostgREST из apply_cards_cursor: col.op.value, col.is.null, col.not.is.null, and(...)"""
+        self.filters.append(parse_condition(condition, any))
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.bounds = (0, count - 1)
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end)
+        return self
+
+    def execute(self):
+        self.db.requests.append((self.table, self.operation))
+        rows = self.db.tables.setdefault(self.table, [])
+        if self.operation == 'insert':
+            inserted = []
+            for row in (self.payload if isinstance(self.payload, list) else [self.payload]):
+                row = {'id': self.db.next_id(), **row}
+                rows.append(row)
+                inserted.append(dict(row))
+            return FakeResponse(inserted)
+
+        matched = [row for row in rows if all(predicate(row) for predicate in self.filters)]
+        if self.operation == 'update':
+            for row in matched:
+                row.update(self.payload)
+            return FakeResponse([dict(row) for row in matched])
+        if self.operation == 'delete':
+            self.db.tables[self.table] = [row for row in rows if row not in matched]
+            return FakeResponse([dict(row) for row in matched])
+
+        # NULL при ASC - последними, при DESC - первыми, как в Postgres
+        for column, desc in reversed(self.orders):
+            matched.sort(key=lambda row: (row.get(column) is None, row.get(column) if row.get(column) is not None else 0))
+            if desc:
+                matched.reverse()
+        if self.bounds is not None:
+            matched = matched[self.bounds[0]:self.bounds[1] + 1]
+        matched = matched[:POSTGREST_MAX_ROWS]
+        if self.columns is not None:
+            matched = [{column: row.get(column) for column in self.columns} for row in matched]
+        return FakeResponse([dict(row) for row in matched])
+
+
+class FakeSupabase:
+    """Таблицы в памяти вместо PostgREST, requests - выполненные запросы (таблица, операция)"""
+
+    def __init__(self, **tables):
+        self.tables = {name: [dict(row) for row in rows] for name, rows in tables.items()}
+        self.requests = []
+        self._last_id = 100000
+
+    def next_id(self):
+        self._last_id += 1
+        return self._last_id
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def count(self, table, operation='select'):
+        return self.requests.count((table, operation))
+
+
+class CatalogTestCase(unittest.TestCase):
+    """Подменяет клиент Supabase и сбрасывает кэши и реплики каталога между тестами"""
+
+    def use_database(self, **tables):
+        self.db = FakeSupabase(**tables)
+        patcher = mock.patch.object(app, 'supabase', self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sent = []
+        patcher = mock.patch.object(app, 'send_message', self.sent.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for reset in (app.cards_cache.invalidate, app.catalog_store.drop, app.catalog_search.drop):
+            reset()
+            self.addCleanup(reset)
+        return self.db
+
+
+def make_cards(count, business_id='b1', start=1):
+    return [{
+        'id': card_id,
+        'business_id': business_id,
+        'title': f"Букет {card_id}",
+        'category': 'Розы',
+        'price_number': 1000 + card_id,
+        'views_count': 0,
+        'colors': [],
+        'updated_at': '2025-01-01T00:00:00'
+    } for card_id in range(start, start + count)]
+
+
+def make_images(cards, per_card):
+    images = []
+    for image_index in reversed(range(per_card)):
+        for card in cards:
+            images.append({
+                'id': len(images) + 1,
+                'card_id': card['id'],
+                'image_index': image_index,
+                'file': f"{card['id']}_{image_index}.webp"
+            })
+    return images
+
+
+class TestAttachImages(CatalogTestCase):
+
+    def test_more_images_than_one_page(self):
+        """150 карточек по 10 фото - 1500 строк: все фото на месте и по порядку image_index"""
+        cards = make_cards(app.IMAGES_BATCH_SIZE)
+        db = self.use_database(images=make_images(cards, 10))
+        app.attach_images_to_cards(cards)
+        for card in cards:
+            self.assertEqual([image['image_index'] for image in card['images']], list(range(10)))
+        self.assertEqual(db.count('images'), 2)
+
+    def test_cards_without_images(self):
+        cards = make_cards(3)
+        db = self.use_database(images=make_images(cards[:1], 2))
+        app.attach_images_to_cards(cards)
+        self.assertEqual([len(card['images']) for card in cards], [2, 0, 0])
+        self.assertEqual(db.count('images'), 1)
+
+
+def raw_cursor(payload):
+    """Курсор с произвольным содержимым - как его мог бы собрать клиент"""
+    raw = payload if isinstance(payload, bytes) else serialization.dumps_bytes(payload)
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+class TestCardsCursor(CatalogTestCase):
+
+    def test_round_trip(self):
+        card = {'id': 42, 'price_number': 1500, 'views_count': None}
+        for order_type in (None, 0, 1, 2):
+            with self.subTest(order_type=order_type):
+                cursor = app.encode_cards_cursor(card, order_type)
+                column, _ = app.cards_sort(order_type)
+                self.assertEqual(app.decode_cards_cursor(cursor, order_type), (card[column], 42))
+
+    def test_malformed_cursors(self):
+        """Строки, bool, дробный id и лишние элементы - invalid cursor, а не кусок фильтра or_()"""
+        cursors = [
+            'not base64 at all!',
+            raw_cursor(['1500,id.gt.0', 42]),
+            raw_cursor([1500, '42),or(id.gt.0']),
+            raw_cursor([1500, 42.5]),
+            raw_cursor([True, 42]),
+            raw_cursor([1500, True]),
+            raw_cursor([{'a': 1}, 42]),
+            raw_cursor([1500, 42, 7]),
+            raw_cursor([1500]),
+            raw_cursor({'value': 1500}),
+            raw_cursor(b'[1e999, 42]'),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(ValueError):
+                    app.decode_cards_cursor(cursor, 1)
+        with self.assertRaises(ValueError):
+            app.decode_cards_cursor(raw_cursor([7, 42]), None)
+        with self.assertRaises(ValueError):
+            app.decode_cards_cursor(12345, 1)
+
+    def test_apply_cursor_filters(self):
+        query = mock.MagicMock()
+        query.or_.return_value = query
+        app.apply_cards_cursor(query, 1, app.encode_cards_cursor({'id': 42, 'price_number': 1500}, 1))
+        query.or_.assert_called_once_with('price_number.gt.1500,and(price_number.eq.1500,id.gt.42),price_number.is.null')
+        app.apply_cards_cursor(query, 0, app.encode_cards_cursor({'id': 42, 'views_count': None}, 0))
+        query.or_.assert_called_with('and(views_count.is.null,id.gt.42),views_count.not.is.null')
+        app.apply_cards_cursor(query, None, app.encode_cards_cursor({'id': 42}, None))
+        query.gt.assert_called_with('id', 42)
+
+    def test_filter_rejects_crafted_cursor(self):
+        """cards/filter отвечает invalid_cursor и через Supabase, и из реплики"""
+        self.use_database(cards=make_cards(3), images=[])
+        message = ['cards', 'filter', {'business_id': 'b1'}, 2, 1, None, {'cursor': raw_cursor(['x', 1])}]
+        for serves_filter in (False, True):
+            with self.subTest(serves_filter=serves_filter), \
+                    mock.patch.object(app, 'CATALOG_STORE_SERVES_FILTER', serves_filter):
+                self.sent.clear()
+                app.socket_actions.dispatch(message)
+                self.assertEqual(self.sent, [['error', 'invalid_cursor']])
+
+    def test_pages_from_both_paths(self):
+        """Курсор со страницы Supabase продолжает выдачу из реплики и наоборот"""
+        self.use_database(cards=make_cards(5), images=[])
+        first, cursor = app.get_cards_page({'business_id': 'b1'}, 2, 2)
+        with mock.patch.object(app, 'CATALOG_STORE_SERVES_FILTER', True):
+            second, cursor = app.get_cards_page({'business_id': 'b1'}, 2, 2, cursor=cursor)
+        third, cursor = app.get_cards_page({'business_id': 'b1'}, 2, 2, cursor=cursor)
+        self.assertEqual([card['id'] for card in first + second + third], [5, 4, 3, 2, 1])
+        self.assertIsNone(cursor)
+
+
+class TestStreamCards(CatalogTestCase):
+
+    def stream(self, limit=None, chunk_size=10):
+        app.stream_cards({'business_id': 'b1'}, limit, None, None, None, chunk_size, {'business_id': 'b1'})
+        chunks = [message[3] for message in self.sent if message[1] == 'filter_chunk']
+        self.assertEqual([message[2] for message in self.sent if message[1] == 'filter_chunk'], list(range(len(chunks))))
+        self.assertEqual(self.sent[-1][:3], ['cards', 'filter_end', len(chunks)])
+        return chunks
+
+    def test_one_cards_query_for_all_chunks(self):
+        """Пачки режутся из одной выборки: запросов не больше, чем без потокового режима"""
+        cards = make_cards(45)
+        db = self.use_database(cards=cards, images=make_images(cards, 2))
+        chunks = self.stream()
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 10, 10, 5])
+        self.assertTrue(all(len(card['images']) == 2 for chunk in chunks for card in chunk))
+        self.assertEqual((db.count('cards'), db.count('images')), (1, 1))
+
+    def test_full_catalog_past_row_cap(self):
+        """Весь каталог больше лимита PostgREST: страницы по 999 строк, фото - по IMAGES_BATCH_SIZE карточек"""
+        cards = make_cards(1200)
+        db = self.use_database(cards=cards, images=make_images(cards, 1))
+        chunks = self.stream(chunk_size=200)
+        self.assertEqual([card['id'] for chunk in chunks for card in chunk], list(range(1, 1201)))
+        self.assertEqual([len(chunk) for chunk in chunks], [200] * 6)
+        self.assertEqual((db.count('cards'), db.count('images')), (2, 9))
+
+    def test_limit(self):
+        db = self.use_database(cards=make_cards(45), images=[])
+        chunks = self.stream(limit=25)
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+        self.assertIsNotNone(self.sent[-1][4]['next_cursor'])
+        self.assertEqual(db.count('cards'), 1)
+
+    def test_replica_without_queries(self):
+        """Из загруженной реплики поток не делает ни одного запроса"""
+        db = self.use_database(cards=make_cards(45), images=[])
+        with mock.patch.object(app, 'CATALOG_STORE_SERVES_FILTER', True):
+            app.catalog_store.get('b1')
+            db.requests.clear()
+            chunks = self.stream()
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 10, 10, 5])
+        self.assertEqual(db.requests, [])
+
+
+class TestCardsCacheRace(CatalogTestCase):
+
+    def test_write_during_fetch_not_cached(self):
+        """
+        Выборка прочитала карточку до записи, а закончилась после invalidate_catalog:
+        следующий запрос идет в базу, а не получает старые строки с новой версией
+        """
+        db = self.use_database(cards=make_cards(2), images=[])
+        fetch_cards = app.fetch_cards
+
+        def fetch_then_write(*args):
+            result = fetch_cards(*args)
+            db.tables['cards'][0]['title'] = 'Новое название'
+            app.invalidate_catalog('b1', 1)
+            return result
+
+        filters = {'business_id': 'b1'}
+        with mock.patch.object(app, 'fetch_cards', fetch_then_write):
+            cards, _ = app.get_cards_page(filters, 10)
+        self.assertEqual(cards[0]['title'], 'Букет 1')
+        cards, _ = app.get_cards_page(filters, 10)
+        self.assertEqual(cards[0]['title'], 'Новое название')
+
+
+class TestCardsUpdate(CatalogTestCase):
+
+    def update(self, card_id, business_id, title):
+        app.socket_actions.dispatch(['cards', 'update', {'title': title, 'price': '1500'}, None, card_id, business_id])
+        self.assertEqual(self.sent[-1], ['cards', 'updated', card_id])
+
+    def test_same_business_single_request(self):
+        """Бизнес не меняется - один запрос update, без отдельного чтения business_id"""
+        db = self.use_database(cards=make_cards(2), images=[])
+        app.catalog_search.get('b1')
+        db.requests.clear()
+        self.update(1, 'b1', 'Тюльпаны')
+        self.assertEqual(db.requests, [('cards', 'update')])
+        self.assertEqual(app.catalog_search.search('b1', 'тюльпаны', prefix=False)[0][0], '1')
+
+    def test_moved_card_leaves_old_index(self):
+        db = self.use_database(cards=make_cards(2) + make_cards(1, 'b2', start=3), images=[])
+        app.catalog_search.get('b1')
+        app.catalog_search.get('b2')
+        self.update(1, 'b2', 'Тюльпаны')
+        self.assertEqual(db.tables['cards'][0]['business_id'], 'b2')
+        self.assertEqual(app.catalog_search.search('b1', 'тюльпаны', prefix=False), [])
+        self.assertEqual(app.catalog_search.search('b2', 'тюльпаны', prefix=False)[0][0], '1')
+
+
+class TestCardsSync(CatalogTestCase):
+
+    def setUp(self):
+        self.since = (datetime.utcnow() - timedelta(minutes=1)).isoformat()
+        self.db = self.use_database(cards=make_cards(2) + make_cards(1, 'b2', start=3), images=[], catalog_tombstones=[])
+
+    def move(self, card_id, business_id):
+        app.socket_actions.dispatch(['cards', 'update', {'title': 'Букет'}, None, card_id, business_id])
+
+    def test_moved_card_deleted_for_old_business(self):
+        """Перенос в другой бизнес - tombstone в прежнем, карточка в выборке нового"""
+        self.move(1, 'b2')
+        old = app.sync_catalog('b1', self.since)
+        new = app.sync_catalog('b2', self.since)
+        self.assertFalse(old['full'])
+        self.assertEqual(old['deleted_cards'], ['1'])
+        self.assertEqual(old['cards'], [])
+        self.assertEqual([card['id'] for card in new['cards']], [1])
+        self.assertEqual(new['deleted_cards'], [])
+
+    def test_card_moved_back(self):
+        """Карточка вернулась в прежний бизнес: приходит как измененная, а не удаленная"""
+        self.move(1, 'b2')
+        self.move(1, 'b1')
+        back = app.sync_catalog('b1', self.since)
+        self.assertEqual([card['id'] for card in back['cards']], [1])
+        self.assertEqual(back['deleted_cards'], [])
+        self.assertEqual(app.sync_catalog('b2', self.since)['deleted_cards'], ['1'])
+
+    def test_update_in_place_writes_no_tombstone(self):
+        self.move(1, 'b1')
+        self.assertEqual(self.db.tables['catalog_tombstones'], [])
+
+if __name__ == '__main__':
+    unittest.main()
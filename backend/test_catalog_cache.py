@@ -0,0 +1,124 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from unittest import mock
+
+from catalog_cache import CatalogCache, CatalogVersions
+
+
+class TestCatalogCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = CatalogCache(max_entries=2, ttl=30)
+
+    def test_make_key_normalizes_filters(self):
+        """_id и id, порядок значений in_() и ключей - один и тот же запрос"""
+        first = CatalogCache.make_key({'_id': [3, 1], 'business_id': 'b'}, 10, 1, None)
+        second = CatalogCache.make_key({'business_id': 'b', 'id': [1, 3]}, 10, 1, None)
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, CatalogCache.make_key({'business_id': 'b', 'id': [1, 3]}, 20, 1, None))
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set('a', ['cards'], ['b1'])
+        self.assertEqual(self.cache.get('a'), ['cards'])
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_ttl_expiry(self):
+        """Запись старше ttl - промах"""
+        with mock.patch('catalog_cache.time.monotonic', return_value=100.0):
+            self.cache.set('a', 1, ['b1'])
+        with mock.patch('catalog_cache.time.monotonic', return_value=129.0):
+            self.assertEqual(self.cache.get('a'), 1)
+        with mock.patch('catalog_cache.time.monotonic', return_value=131.0):
+            self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняется давно не читанная запись"""
+        self.cache.set('a', 1, ['b1'])
+        self.cache.set('b', 2, ['b1'])
+        self.cache.get('a')
+        self.cache.set('c', 3, ['b1'])
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_invalidate_business(self):
+        """Запись в бизнес сбрасывает его выдачи и выдачи без business_id, чужие остаются"""
+        cache = CatalogCache(max_entries=10, ttl=30)
+        cache.set('own', 1, ['b1'])
+        cache.set('other', 2, ['b2'])
+        cache.set('unknown', 3, [])
+        cache.invalidate('b1')
+        self.assertIsNone(cache.get('own'))
+        self.assertIsNone(cache.get('unknown'))
+        self.assertEqual(cache.get('other'), 2)
+
+    def test_invalidate_all(self):
+        self.cache.set('a', 1, ['b1'])
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_fetch_overlapping_invalidate_not_cached(self):
+        """Выборка, начатая до сброса бизнеса, не сохраняется; выборки других бизнесов - сохраняются"""
+        cache = CatalogCache(max_entries=10, ttl=30)
+        generation = cache.generation()
+        cache.invalidate('b1')
+        cache.set('own', 'before write', ['b1'], generation)
+        cache.set('other', 2, ['b2'], generation)
+        cache.set('unknown', 3, [], generation)
+        self.assertIsNone(cache.get('own'))
+        self.assertIsNone(cache.get('unknown'))
+        self.assertEqual(cache.get('other'), 2)
+        self.assertEqual(cache.stats()['stale'], 2)
+        cache.set('own', 'after write', ['b1'], cache.generation())
+        self.assertEqual(cache.get('own'), 'after write')
+
+    def test_invalidate_all_during_fetch(self):
+        cache = CatalogCache(max_entries=10, ttl=30)
+        generation = cache.generation()
+        cache.invalidate()
+        cache.set('other', 2, ['b2'], generation)
+        self.assertIsNone(cache.get('other'))
+
+    def test_disabled_with_zero_ttl(self):
+        cache = CatalogCache(max_entries=10, ttl=0)
+        cache.set('a', 1, ['b1'])
+        self.assertIsNone(cache.get('a'))
+
+
+class TestCatalogVersions(unittest.TestCase):
+
+    def test_bump_changes_only_that_business(self):
+        versions = CatalogVersions(max_age=3600)
+        before = (versions.get('b1'), versions.get('b2'))
+        versions.bump('b1')
+        self.assertNotEqual(versions.get('b1'), before[0])
+        self.assertEqual(versions.get('b2'), before[1])
+
+    def test_unknown_business_bumps_all(self):
+        """Запись в неизвестный бизнес меняет версии всех каталогов"""
+        versions = CatalogVersions(max_age=3600)
+        before = versions.get('b2')
+        versions.bump()
+        self.assertNotEqual(versions.get('b2'), before)
+
+    def test_restart_changes_versions(self):
+        """Другой процесс - другие версии: клиент после рестарта получит каталог заново"""
+        self.assertNotEqual(CatalogVersions().get('b1'), CatalogVersions().get('b1'))
+
+    def test_versions_expire_with_max_age(self):
+        versions = CatalogVersions(max_age=60)
+        with mock.patch('catalog_cache.time.time', return_value=1200.0):
+            first = versions.get('b1')
+        with mock.patch('catalog_cache.time.time', return_value=1230.0):
+            self.assertEqual(versions.get('b1'), first)
+        with mock.patch('catalog_cache.time.time', return_value=1300.0):
+            self.assertNotEqual(versions.get('b1'), first)
+
+if __name__ == '__main__':
+    unittest.main()
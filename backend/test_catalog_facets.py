@@ -0,0 +1,44 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from catalog_facets import FacetCounts, compute_facets
+
+CARDS = [
+    {'id': 1, 'category': 'Розы', 'colors': ['красный', 'белый', 'красный'], 'sizes': [], 'price_number': 1500},
+    {'id': 2, 'category': 'Розы', 'colors': ['белый'], 'sizes': [{'name': 'M', 'price': 2000}], 'price_number': 0},
+    {'id': 3, 'category': 'Пионы', 'colors': None, 'sizes': [{'name': 'M', 'price': 2000}], 'price_number': 20000},
+    {'id': 4, 'category': '', 'colors': [], 'sizes': [], 'price_number': None},
+]
+
+
+class TestFacets(unittest.TestCase):
+
+    def test_counts(self):
+        """Карточка считается в значении один раз, пустые значения не считаются"""
+        facets = compute_facets(CARDS, [0, 1000, 5000])
+        self.assertEqual(facets['total'], 4)
+        self.assertEqual(facets['category'], {'Розы': 2, 'Пионы': 1})
+        self.assertEqual(facets['colors'], {'белый': 2, 'красный': 1})
+        self.assertEqual(list(facets['sizes'].values()), [2])
+        self.assertEqual(facets['price']['min'], 0)
+        self.assertEqual(facets['price']['max'], 20000)
+        self.assertEqual([bucket['count'] for bucket in facets['price']['buckets']], [1, 1, 1])
+        self.assertIsNone(facets['price']['buckets'][-1]['to'])
+
+    def test_incremental_matches_recount(self):
+        """add/remove дают те же счетчики, что пересчет с нуля"""
+        counts = FacetCounts([0, 1000, 5000])
+        for card in CARDS:
+            counts.add(card)
+        counts.remove(CARDS[0])
+        counts.add({**CARDS[0], 'category': 'Пионы', 'price_number': 900})
+        counts.remove(CARDS[2])
+        expected = compute_facets([{**CARDS[0], 'category': 'Пионы', 'price_number': 900}, CARDS[1], CARDS[3]],
+                                  [0, 1000, 5000])
+        self.assertEqual(counts.snapshot(), expected)
+        self.assertEqual(counts.snapshot()['price']['max'], 900)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from catalog_search import BusinessSearchIndex, CatalogSearch, analyze, stem
+
+CARDS = [
+    {'id': 1, 'title': 'Букет красных роз', 'category': 'Розы', 'description': 'Свежие розы из Эквадора'},
+    {'id': 2, 'title': 'Тюльпаны микс', 'category': 'Тюльпаны', 'description': 'Весенний букет, в нем есть и розы'},
+    {'id': 3, 'title': 'Корзина с пионами', 'category': 'Пионы', 'description': 'Нежные пионы в корзине'},
+    {'id': 4, 'title': 'Красный тюльпан', 'category': 'Тюльпаны', 'description': None},
+]
+
+
+def ranked_ids(results):
+    return [card_id for card_id, _ in results]
+
+
+class TestAnalyzer(unittest.TestCase):
+
+    def test_word_forms_share_stem(self):
+        """Падежи и числа сводятся к одной основе"""
+        self.assertEqual({stem(word) for word in ['роза', 'розы', 'розами', 'роз']}, {'роз'})
+        self.assertEqual(stem('красные'), stem('красный'))
+
+    def test_stop_words_and_yo(self):
+        self.assertEqual(analyze('Ёлка и в ёлки'), [stem('елка'), stem('елки')])
+
+
+class TestBusinessSearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = BusinessSearchIndex(CARDS)
+
+    def test_morphology_match(self):
+        self.assertEqual(set(ranked_ids(self.index.search('розами', prefix=False))), {'1', '2'})
+
+    def test_title_outranks_description(self):
+        """BM25F: совпадение в названии и категории весит больше, чем в описании"""
+        self.assertEqual(ranked_ids(self.index.search('розы', prefix=False)), ['1', '2'])
+
+    def test_all_words_add_up(self):
+        """Карточка с обоими словами запроса выше карточек с одним"""
+        self.assertEqual(ranked_ids(self.index.search('красный тюльпан', prefix=False))[0], '4')
+
+    def test_prefix_of_last_word(self):
+        """Поиск по мере набора: последнее слово дополняется по словарю"""
+        self.assertEqual(ranked_ids(self.index.search('пио')), ['3'])
+        self.assertEqual(self.index.search('пио', prefix=False), [])
+
+    def test_upsert_and_remove(self):
+        self.index.upsert({'id': 3, 'title': 'Орхидея', 'category': 'Орхидеи', 'description': ''})
+        self.assertEqual(self.index.search('пионы', prefix=False), [])
+        self.assertEqual(ranked_ids(self.index.search('орхидея', prefix=False)), ['3'])
+        self.index.remove(1)
+        self.assertEqual(ranked_ids(self.index.search('розы', prefix=False)), ['2'])
+
+    def test_limit_and_empty_query(self):
+        self.assertEqual(len(self.index.search('букет розы тюльпаны', limit=2)), 2)
+        self.assertEqual(self.index.search('и в'), [])
+
+
+class TestCatalogSearch(unittest.TestCase):
+
+    def test_index_and_remove_per_business(self):
+        """Карточка, перенесенная в другой бизнес, убирается из индекса прежнего"""
+        search = CatalogSearch(lambda business_id: CARDS if business_id == 'b1' else [])
+        self.assertEqual(ranked_ids(search.search('b1', 'пионы', prefix=False)), ['3'])
+        search.get('b2')
+        search.remove_card('b1', 3)
+        search.index_card('b2', CARDS[2])
+        self.assertEqual(search.search('b1', 'пионы', prefix=False), [])
+        self.assertEqual(ranked_ids(search.search('b2', 'пионы', prefix=False)), ['3'])
+
+    def test_writes_during_rebuild_not_lost(self):
+        """Индекс, построенный по строкам до записи, не затирает index_card/remove_card во время построения"""
+        def load_business(business_id):
+            snapshot = list(CARDS)
+            search.index_card('b1', {'id': 5, 'title': 'Орхидея', 'category': 'Орхидеи', 'description': ''})
+            search.remove_card('b1', 3)
+            search.remove_card(None, 4)
+            return snapshot
+
+        search = CatalogSearch(load_business)
+        self.assertEqual(ranked_ids(search.search('b1', 'орхидея', prefix=False)), ['5'])
+        self.assertEqual(search.search('b1', 'пионы', prefix=False), [])
+        self.assertEqual(search.search('b1', 'красный тюльпан', prefix=False)[0][0], '2')
+
+    def test_index_card_skips_unloaded_business(self):
+        search = CatalogSearch(lambda business_id: [])
+        search.index_card('b1', CARDS[0])
+        self.assertEqual(search.search('b1', 'розы'), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import unittest
+import sys
+import os
+import random
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from catalog_store import BusinessCatalog, CatalogStore
+from catalog_columnar import np
+
+SORTS = [('views_count', True), ('price_number', False), ('price_number', True), ('id', False)]
+
+
+def make_cards():
+    return [
+        {'id': 1, 'business_id': 'b1', 'category': 'Розы', 'price_number': 3000, 'views_count': 10},
+        {'id': 2, 'business_id': 'b1', 'category': 'Тюльпаны', 'price_number': 1500, 'views_count': None},
+        {'id': 3, 'business_id': 'b1', 'category': 'Розы', 'price_number': 1500, 'views_count': 50},
+        {'id': 4, 'business_id': 'b1', 'category': 'Пионы', 'price_number': None, 'views_count': 5},
+        {'id': 5, 'business_id': 'b1', 'category': 'Розы', 'price_number': 7000, 'views_count': 50},
+    ]
+
+
+def ids(cards):
+    return [card['id'] for card in cards]
+
+
+class TestBusinessCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = BusinessCatalog('b1', make_cards(), SORTS)
+
+    def test_sort_matches_postgres_nulls(self):
+        """ASC - NULL в конце, DESC - NULL в начале, при равенстве - по id"""
+        self.assertEqual(ids(self.catalog.query({}, ('price_number', False))), [2, 3, 1, 5, 4])
+        self.assertEqual(ids(self.catalog.query({}, ('price_number', True))), [4, 5, 1, 2, 3])
+        self.assertEqual(ids(self.catalog.query({}, ('views_count', True))), [2, 3, 5, 1, 4])
+
+    def test_category_and_price_range(self):
+        cards = self.catalog.query({'business_id': 'b1', 'category': 'Розы'}, ('id', False), ['1000', '5000'])
+        self.assertEqual(ids(cards), [1, 3])
+
+    def test_in_filter_and_id_alias(self):
+        """Список - in_(), _id - то же, что id; значения сравниваются строками, как в PostgREST"""
+        self.assertEqual(ids(self.catalog.query({'_id': ['3', 5]}, ('id', False))), [3, 5])
+        self.assertEqual(ids(self.catalog.query({'category': ['Пионы', 'Тюльпаны']}, ('id', False))), [2, 4])
+
+    def test_cursor_pagination(self):
+        """Страницы после курсора (значение, id) склеиваются в полную выдачу без повторов"""
+        sort = ('price_number', False)
+        first = self.catalog.query({}, sort, limit=2)
+        last = first[-1]
+        rest = self.catalog.query({}, sort, after=(last['price_number'], last['id']))
+        self.assertEqual(ids(first) + ids(rest), [2, 3, 1, 5, 4])
+
+    def test_unknown_column_not_served(self):
+        """Незнакомая колонка или пустой in_() - None, запрос уходит в Supabase"""
+        self.assertIsNone(self.catalog.query({'color': 'red'}, ('id', False)))
+        self.assertIsNone(self.catalog.query({'category': []}, ('id', False)))
+        self.assertIsNone(self.catalog.query({}, ('title', False)))
+
+    def test_upsert_and_remove_update_indexes(self):
+        self.catalog.upsert({'id': 3, 'business_id': 'b1', 'category': 'Пионы', 'price_number': 100, 'views_count': 1})
+        self.assertEqual(ids(self.catalog.query({'category': 'Розы'}, ('id', False))), [1, 5])
+        self.assertEqual(ids(self.catalog.query({}, ('price_number', False)))[0], 3)
+        self.catalog.remove(1)
+        self.assertEqual(ids(self.catalog.query({'category': 'Розы'}, ('price_number', False))), [5])
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestColumnarParity(unittest.TestCase):
+    """ColumnarCatalog (NumPy) отвечает так же, как индексы BusinessCatalog"""
+
+    def setUp(self):
+        rnd = random.Random(7)
+        categories = ['Розы', 'Тюльпаны', 'Пионы', None]
+        cards = [{
+            'id': card_id,
+            'business_id': 'b1',
+            'category': rnd.choice(categories),
+            'price_number': rnd.choice([None, rnd.randrange(500, 10000, 250)]),
+            'views_count': rnd.choice([None, rnd.randint(0, 20)]),
+        } for card_id in range(1, 301)]
+        self.indexed = BusinessCatalog('b1', cards, SORTS)
+        self.columnar = BusinessCatalog('b1', cards, SORTS, columnar=True)
+        self.queries = [
+            ({}, None),
+            ({'category': 'Розы'}, None),
+            ({'category': ['Пионы', 'Тюльпаны']}, ['1000', '6000']),
+            ({'business_id': 'b1', '_id': [5, '17', 250]}, None),
+            ({}, [2000, 2000]),
+        ]
+
+    def assert_same(self, filters, sort, price_range=None, after=None, limit=None):
+        expected = self.indexed.query(filters, sort, price_range, after, limit)
+        actual = self.columnar.query(filters, sort, price_range, after, limit)
+        self.assertEqual(ids(actual), ids(expected), (filters, sort, price_range, after, limit))
+
+    def test_filters_and_sorts(self):
+        for filters, price_range in self.queries:
+            for sort in SORTS:
+                self.assert_same(filters, sort, price_range)
+                self.assert_same(filters, sort, price_range, limit=7)
+
+    def test_cursor_pages(self):
+        """Курсоры с NULL и повторяющимися значениями - на каждой странице"""
+        for sort in SORTS:
+            column = sort[0]
+            for card in self.indexed.query({}, sort)[::37]:
+                self.assert_same({}, sort, after=(card.get(column), card['id']), limit=20)
+
+    def test_after_write(self):
+        """После upsert/remove колоночное представление перестраивается"""
+        for catalog in (self.indexed, self.columnar):
+            catalog.upsert({'id': 1000, 'business_id': 'b1', 'category': 'Розы', 'price_number': 1, 'views_count': 99})
+            catalog.remove(5)
+        self.assert_same({'category': 'Розы'}, ('price_number', False), limit=10)
+        self.assert_same({}, ('views_count', True), limit=10)
+
+
+class TestCatalogStore(unittest.TestCase):
+
+    def test_loads_once_and_tracks_cards(self):
+        loads = []
+
+        def load_business(business_id):
+            loads.append(business_id)
+            return make_cards()
+
+        store = CatalogStore(load_business, lambda card_id: None, SORTS)
+        store.get('b1')
+        store.get('b1')
+        self.assertEqual(loads, ['b1'])
+        self.assertEqual(store.find_business(3), 'b1')
+
+    def make_store(self, during_load=None):
+        """Реплика над таблицей в памяти; during_load(store) - записи между чтением снимка и заменой реплики"""
+        self.db = {card['id']: card for card in make_cards()}
+        self.store = None
+
+        def load_business(business_id):
+            snapshot = [dict(card) for card in self.db.values() if card['business_id'] == business_id]
+            if during_load is not None:
+                during_load(self.store)
+            return snapshot
+
+        def load_card(card_id):
+            card = self.db.get(int(card_id))
+            return dict(card) if card is not None else None
+
+        self.store = CatalogStore(load_business, load_card, SORTS)
+        return self.store
+
+    def test_write_during_first_load_not_lost(self):
+        """refresh_card во время первой загрузки повторяется на снимке, прочитанном до записи"""
+        def write(store):
+            self.db[3]['price_number'] = 100
+            store.refresh_card(3, 'b1')
+
+        catalog = self.make_store(write).get('b1')
+        self.assertEqual(catalog.cards[3]['price_number'], 100)
+        self.assertEqual(ids(catalog.query({}, ('price_number', False)))[0], 3)
+
+    def test_write_during_reconcile_not_lost(self):
+        """Сверка не возвращает удаленную и перенесенную карточку и не откатывает views_count"""
+        writes = []
+
+        def write(store):
+            if writes:
+                writes.pop()(store)
+
+        store = self.make_store(write)
+        store.get('b1')
+
+        def delete_and_move(store):
+            del self.db[5]
+            store.refresh_card(5, 'b1')
+            self.db[2]['business_id'] = 'b2'
+            store.refresh_card(2, 'b2')
+            self.db[1]['views_count'] = 11
+            store.patch_card(1, {'views_count': 11})
+
+        writes.append(delete_and_move)
+        store._reconcile('b1')
+        catalog = store.get('b1')
+        self.assertEqual(sorted(catalog.cards), [1, 3, 4])
+        self.assertEqual(catalog.cards[1]['views_count'], 11)
+        self.assertIsNone(store.find_business(2))
+        self.assertEqual(store.stats()['reconciles'], 1)
+
+    def test_load_error_propagates(self):
+        """Ошибку загрузки обрабатывает вызывающий (cards/filter откатывается на fetch_cards)"""
+        def load_business(business_id):
+            raise RuntimeError('PostgREST error')
+
+        store = CatalogStore(load_business, lambda card_id: None, SORTS)
+        with self.assertRaises(RuntimeError):
+            store.get('b1')
+        self.assertFalse(store.is_loaded('b1'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from io import BytesIO
+from PIL import Image
+
+import image_processing
+from image_processing import ImagePool
+
+
+def make_jpeg(size, color='red'):
+    output = BytesIO()
+    Image.new('RGB', size, color).save(output, format='JPEG')
+    return output.getvalue()
+
+
+def crash_once(marker_path):
+    """В первый раз роняет процесс пула, как OOM killer, во второй - возвращает результат"""
+    if not os.path.exists(marker_path):
+        open(marker_path, 'w').close()
+        os._exit(1)
+    return 'done'
+
+
+class TestImagePool(unittest.TestCase):
+
+    def test_inline_when_size_zero(self):
+        """size=0 - задача выполняется в текущем процессе"""
+        pool = ImagePool(0)
+        self.assertEqual(pool.run(max, 1, 2), 2)
+        self.assertEqual(pool.stats()['inline'], 1)
+
+    def test_retry_on_fresh_pool_after_crash(self):
+        """Упавший процесс пула не роняет загрузку: задача повторяется на новом пуле"""
+        pool = ImagePool(1)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                result = pool.run(crash_once, os.path.join(directory, 'crashed'))
+            self.assertEqual(result, 'done')
+            self.assertEqual(pool.stats()['restarts'], 1)
+        finally:
+            pool.shutdown()
+
+
+class TestImageVariants(unittest.TestCase):
+
+    def test_card_variants_from_bytes(self):
+        """full вписывается в 1200x1200, lazy - в 100x100"""
+        variants = image_processing.compress_card_image(make_jpeg((3000, 2000)))
+        self.assertEqual(Image.open(BytesIO(variants['full'])).size, (1200, 800))
+        self.assertEqual(Image.open(BytesIO(variants['lazy'])).size, (100, 67))
+
+    def test_decode_from_path(self):
+        """Собранный файл загрузки читается по пути так же, как байты"""
+        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as f:
+            f.write(make_jpeg((800, 600)))
+        try:
+            data = image_processing.compress_logo(f.name)
+        finally:
+            os.remove(f.name)
+        self.assertEqual(Image.open(BytesIO(data)).size, (400, 300))
+
+    def test_small_image_not_upscaled(self):
+        variants = image_processing.compress_card_image(make_jpeg((50, 40)))
+        self.assertEqual(Image.open(BytesIO(variants['full'])).size, (50, 40))
+
+
+if __name__ == '__main__':
+    unittest.main()
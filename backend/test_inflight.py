@@ -0,0 +1,84 @@
+import unittest
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from inflight import InFlight
+
+
+class TestInFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.inflight = InFlight()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def slow(self, result=None, error=None):
+        def fn():
+            self.calls += 1
+            self.started.set()
+            self.release.wait(5)
+            if error is not None:
+                raise error
+            return result
+        return fn
+
+    def run_concurrently(self, fn, followers=3):
+        """Лидер блокируется в fn, пока остальные вызовы с тем же ключом не встанут в ожидание"""
+        outcomes = []
+
+        def call():
+            try:
+                outcomes.append(self.inflight.run('b1', fn))
+            except Exception as e:
+                outcomes.append(e)
+
+        threads = [threading.Thread(target=call)]
+        threads[0].start()
+        self.assertTrue(self.started.wait(5))
+        for _ in range(followers):
+            thread = threading.Thread(target=call)
+            thread.start()
+            threads.append(thread)
+        deadline = time.monotonic() + 5
+        while self.inflight.coalesced < followers and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_concurrent_calls_coalesce(self):
+        """fn выполняется один раз, все вызовы получают его результат"""
+        outcomes = self.run_concurrently(self.slow(result=['cards']))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(sorted(leader for _, leader in outcomes), [False, False, False, True])
+        self.assertTrue(all(result == ['cards'] for result, _ in outcomes))
+        self.assertEqual(self.inflight.coalesced, 3)
+
+    def test_error_shared(self):
+        error = RuntimeError('PostgREST error')
+        outcomes = self.run_concurrently(self.slow(error=error))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(outcomes, [error] * 4)
+
+    def test_key_released_after_completion(self):
+        """Завершенная операция не кэшируется: следующий вызов выполняет fn заново"""
+        self.release.set()
+        self.assertEqual(self.inflight.run('b1', self.slow(result=1)), (1, True))
+        self.assertNotIn('b1', self.inflight)
+        self.assertEqual(self.inflight.run('b1', self.slow(result=2)), (2, True))
+        self.assertEqual(len(self.inflight), 0)
+        self.assertEqual(self.inflight.coalesced, 0)
+
+    def test_error_releases_key(self):
+        self.release.set()
+        with self.assertRaises(RuntimeError):
+            self.inflight.run('b1', self.slow(error=RuntimeError('boom')))
+        self.assertNotIn('b1', self.inflight)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from socket_actions import ActionRegistry, Arg, ArgumentError
+
+
+class TestArg(unittest.TestCase):
+
+    def test_required(self):
+        with self.assertRaisesRegex(ArgumentError, 'card_id is required'):
+            Arg('card_id', required=True).parse(['cards', 'delete', None], 2)
+
+    def test_types(self):
+        arg = Arg('limit', (int, type(None)))
+        self.assertEqual(arg.parse(['cards', 'filter', 10], 2), 10)
+        with self.assertRaisesRegex(ArgumentError, r'limit must be int\|NoneType, got str'):
+            arg.parse(['cards', 'filter', '10'], 2)
+
+    def test_default_is_copied(self):
+        """Изменяемое значение по умолчанию не делится между вызовами"""
+        arg = Arg('filters', dict, default={})
+        first = arg.parse(['cards', 'filter'], 2)
+        first['business_id'] = 'b1'
+        self.assertEqual(arg.parse(['cards', 'filter'], 2), {})
+
+
+class TestActionRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.observed = []
+        self.actions = ActionRegistry(observer=lambda *event: self.observed.append(event))
+        self.calls = []
+
+        @self.actions.register('cards', 'delete', Arg('account'), Arg('card_id', required=True))
+        def cards_delete(message, account, card_id):
+            self.calls.append((account, card_id))
+            self.actions.record_reply(12)
+
+        @self.actions.register('cards', 'fail')
+        def cards_fail(message):
+            raise RuntimeError('boom')
+
+    def test_handler_gets_parsed_args(self):
+        self.assertTrue(self.actions.dispatch(['cards', 'delete', None, 7], 30))
+        self.assertEqual(self.calls, [(None, 7)])
+        stats = self.actions.stats()['actions']['cards/delete']
+        self.assertEqual((stats['calls'], stats['bytes_in'], stats['bytes_out'], stats['replies']), (1, 30, 12, 1))
+        self.assertEqual(self.observed[0][0], 'cards/delete')
+        self.assertEqual(self.observed[0][2:], ('ok', 30))
+
+    def test_unknown_action(self):
+        self.assertFalse(self.actions.dispatch(['cards', 'nope']))
+        self.assertFalse(self.actions.dispatch(['cards']))
+        self.assertEqual(self.actions.stats()['unknown'], 2)
+        self.assertEqual(self.observed, [])
+
+    def test_invalid_args_counted_and_raised(self):
+        with self.assertRaises(ArgumentError):
+            self.actions.dispatch(['cards', 'delete', None])
+        stats = self.actions.stats()['actions']['cards/delete']
+        self.assertEqual((stats['calls'], stats['invalid'], stats['errors']), (1, 1, 0))
+        self.assertEqual(stats['last_error'], 'card_id is required')
+        self.assertEqual(self.observed[0][2], 'invalid')
+        self.assertEqual(self.calls, [])
+
+    def test_handler_error_counted_and_raised(self):
+        with self.assertRaises(RuntimeError):
+            self.actions.dispatch(['cards', 'fail'])
+        self.assertEqual(self.actions.stats()['actions']['cards/fail']['errors'], 1)
+        self.assertEqual(self.observed[0][2], 'error')
+        self.assertIsNone(self.actions.current())
+
+    def test_duplicate_registration(self):
+        with self.assertRaises(ValueError):
+            self.actions.register('cards', 'fail')(lambda message: None)
+
+    def test_name_of(self):
+        """Имена для меток - только зарегистрированные действия"""
+        self.assertEqual(self.actions.name_of(['cards', 'delete', None, 1]), 'cards/delete')
+        self.assertEqual(self.actions.name_of(['cards', 'x' * 1000]), 'unknown')
+        self.assertEqual(self.actions.name_of([]), 'unknown')
+
+if __name__ == '__main__':
+    unittest.main()
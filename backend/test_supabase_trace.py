@@ -0,0 +1,86 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from supabase_trace import SupabaseTracer
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+BOT_COPY = os.path.join(BACKEND_DIR, '..', 'bot', 'supabase_trace.py')
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    """Построитель запроса PostgREST: цепочка вызовов и execute()"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, *args):
+        return self
+
+    def eq(self, *args):
+        return self
+
+    def execute(self):
+        return FakeResponse(self.rows)
+
+
+class FakeClient:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def table(self, name):
+        return FakeQuery(self.rows)
+
+
+class TestSupabaseTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.slow = []
+        self.tracer = SupabaseTracer(slow_ms=0, log=self.slow.append)
+        self.client = self.tracer.wrap(FakeClient([{'id': 1}, {'id': 2}]))
+
+    def test_calls_counted_per_table_and_scope(self):
+        """Вызовы сводятся по таблице/операции и по действию"""
+        with self.tracer.scope('cards/filter'):
+            self.client.table('cards').select('*').eq('id', 1).execute()
+            self.client.table('images').select('*').execute()
+
+        stats = self.tracer.stats()
+        self.assertEqual(stats['calls']['cards.select']['calls'], 1)
+        self.assertEqual(stats['calls']['cards.select']['rows'], 2)
+        scope = stats['scopes']['cards/filter']
+        self.assertEqual(scope['invocations'], 1)
+        self.assertEqual(scope['calls'], 2)
+        self.assertEqual(scope['calls_per_invocation'], 2)
+
+    def test_calls_outside_scope(self):
+        """Вызовы вне scope() попадают в общий bucket '-'"""
+        self.client.table('cards').select('*').execute()
+        self.assertEqual(self.tracer.stats()['scopes']['-']['calls'], 1)
+
+    def test_slow_query_logged(self):
+        """Запрос дольше порога попадает в лог и в список медленных"""
+        tracer = SupabaseTracer(slow_ms=0.000001, log=self.slow.append)
+        tracer.wrap(FakeClient([])).table('cards').select('*').eq('id', 5).execute()
+        self.assertEqual(len(self.slow), 1)
+        self.assertIn('cards.select', self.slow[0])
+        self.assertEqual(tracer.stats()['slow'][0]['filters'], ['eq(id,5)'])
+
+    def test_bot_copy_is_identical(self):
+        """Копия модуля в bot/ не должна расходиться с этой"""
+        if not os.path.exists(BOT_COPY):
+            self.skipTest('bot/ not found')
+        with open(os.path.join(BACKEND_DIR, 'supabase_trace.py'), encoding='utf-8') as f:
+            backend_source = f.read()
+        with open(BOT_COPY, encoding='utf-8') as f:
+            bot_source = f.read()
+        self.assertEqual(backend_source, bot_source)
+
+if __name__ == '__main__':
+    unittest.main()
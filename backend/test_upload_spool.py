@@ -0,0 +1,98 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from unittest import mock
+
+from upload_spool import UploadError, UploadSpool
+
+DATA = bytes(range(256)) * 4 + b'tail'
+
+
+class TestUploadSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spool = UploadSpool(self.directory, ttl=60, max_size=2048, chunk_size=256, max_chunk_size=512)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write_all(self, upload, order):
+        for index in order:
+            start = index * upload.chunk_size
+            self.spool.write_chunk(upload.upload_id, index, DATA[start:start + upload.chunk_size])
+
+    def assertUploadError(self, code, fn, *args):
+        with self.assertRaises(UploadError) as context:
+            fn(*args)
+        self.assertEqual(context.exception.code, code)
+
+    def test_chunks_out_of_order(self):
+        """Части в любом порядке собираются в исходный файл, последняя часть короче"""
+        upload = self.spool.begin(len(DATA), {'kind': 'card_image'})
+        self.assertEqual(upload.chunk_count, 5)
+        self.assertEqual(upload.chunk_length(4), 4)
+        self.write_all(upload, [4, 2, 0, 3, 1])
+        with open(self.spool.finish(upload.upload_id).path, 'rb') as f:
+            self.assertEqual(f.read(), DATA)
+
+    def test_repeated_chunk_is_noop(self):
+        upload = self.spool.begin(len(DATA), {})
+        self.write_all(upload, [0, 0])
+        self.assertEqual(upload.received_bytes, 256)
+        self.assertEqual(upload.missing(), [1, 2, 3, 4])
+
+    def test_resume_after_reconnect(self):
+        """begin с известным upload_id возвращает ту же загрузку с недостающими частями"""
+        upload = self.spool.begin(len(DATA), {'business_id': 'b1'})
+        self.write_all(upload, [0, 1, 3])
+        resumed = self.spool.begin(len(DATA), {}, upload_id=upload.upload_id)
+        self.assertIs(resumed, upload)
+        state = resumed.state()
+        self.assertEqual((state['missing'], state['received_bytes']), ([2, 4], 768))
+        self.assertUploadError('upload_incomplete', self.spool.finish, upload.upload_id)
+        self.write_all(resumed, state['missing'])
+        self.assertTrue(self.spool.finish(upload.upload_id).complete)
+
+    def test_invalid_chunks(self):
+        upload = self.spool.begin(len(DATA), {})
+        self.assertUploadError('invalid_chunk_length', self.spool.write_chunk, upload.upload_id, 0, b'short')
+        self.assertUploadError('invalid_chunk_length', self.spool.write_chunk, upload.upload_id, 4, DATA[:256])
+        self.assertUploadError('invalid_chunk_index', self.spool.write_chunk, upload.upload_id, 5, b'')
+        self.assertUploadError('invalid_chunk_index', self.spool.write_chunk, upload.upload_id, True, DATA[:256])
+        self.assertUploadError('upload_not_found', self.spool.write_chunk, 'missing', 0, DATA[:256])
+        self.assertEqual(upload.received, set())
+
+    def test_invalid_sizes(self):
+        self.assertUploadError('invalid_upload_size', self.spool.begin, 0, {})
+        self.assertUploadError('invalid_upload_size', self.spool.begin, '100', {})
+        self.assertUploadError('upload_too_large', self.spool.begin, 4096, {})
+        self.assertUploadError('upload_not_found', self.spool.begin, 100, {}, 'missing')
+        self.assertEqual(self.spool.begin(100, {}, chunk_size=4096).chunk_size, 512)
+
+    def test_discard_removes_file(self):
+        upload = self.spool.begin(len(DATA), {})
+        self.assertTrue(os.path.exists(upload.path))
+        self.spool.discard(upload.upload_id)
+        self.assertFalse(os.path.exists(upload.path))
+        self.assertUploadError('upload_not_found', self.spool.get, upload.upload_id)
+
+    def test_cleanup_after_ttl(self):
+        """Брошенная загрузка удаляется через ttl без обращений, активная остается"""
+        with mock.patch('upload_spool.time.monotonic', return_value=1000.0):
+            stale = self.spool.begin(len(DATA), {})
+            active = self.spool.begin(len(DATA), {})
+        with mock.patch('upload_spool.time.monotonic', return_value=1050.0):
+            self.write_all(active, [0])
+        with mock.patch('upload_spool.time.monotonic', return_value=1070.0):
+            self.assertEqual(self.spool.cleanup(), 1)
+        self.assertFalse(os.path.exists(stale.path))
+        self.assertEqual(self.spool.get(active.upload_id), active)
+        self.assertEqual(self.spool.stats(), {'uploads': 1, 'bytes': 256})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import datetime
+
+import wire_format
+
+MESSAGE = ['cards', 'filter', [{'id': 1, 'title': 'Букет', 'price_number': 1500, 'images': []}], {'business_id': 'b'}]
+
+
+class TestNegotiate(unittest.TestCase):
+
+    def test_first_supported_format(self):
+        self.assertEqual(wire_format.negotiate(['cbor', 'native', 'json']), 'native')
+        self.assertEqual(wire_format.negotiate('json'), 'json')
+
+    def test_unknown_falls_back_to_json(self):
+        self.assertEqual(wire_format.negotiate(['cbor']), wire_format.DEFAULT_FORMAT)
+        self.assertEqual(wire_format.negotiate(None), wire_format.DEFAULT_FORMAT)
+
+    def test_msgpack_only_when_installed(self):
+        expected = 'msgpack' if wire_format.msgpack is not None else wire_format.DEFAULT_FORMAT
+        self.assertEqual(wire_format.negotiate(['msgpack']), expected)
+
+
+class TestRoundTrip(unittest.TestCase):
+
+    def test_every_available_format(self):
+        """decode(encode(сообщение)) возвращает то же сообщение во всех форматах"""
+        for fmt in wire_format.available_formats():
+            with self.subTest(fmt=fmt):
+                self.assertEqual(wire_format.decode(wire_format.encode(MESSAGE, fmt)), MESSAGE)
+
+    def test_json_is_text_msgpack_is_binary(self):
+        self.assertIsInstance(wire_format.encode(MESSAGE, 'json'), str)
+        if wire_format.msgpack is not None:
+            self.assertIsInstance(wire_format.encode(MESSAGE, 'msgpack'), bytes)
+
+    def test_dates_encoded_as_iso(self):
+        created = datetime.datetime(2025, 1, 2, 3, 4, 5)
+        for fmt in wire_format.available_formats():
+            if fmt == 'native':
+                continue
+            with self.subTest(fmt=fmt):
+                decoded = wire_format.decode(wire_format.encode(['cards', 'x', {'created_at': created}], fmt))
+                self.assertEqual(decoded[2]['created_at'], '2025-01-02T03:04:05')
+
+
+class TestMessageSize(unittest.TestCase):
+
+    def test_text_frame(self):
+        self.assertEqual(wire_format.message_size('["cards","filter"]'), 18)
+
+    def test_top_level_attachment(self):
+        """images/add с фото бинарным вложением"""
+        message = ['images', 'add', 5, 0, b'\x89PNG' * 10, 'business']
+        self.assertEqual(wire_format.message_size(message), 40)
+
+    def test_nested_attachment(self):
+        """Вложение внутри словаря: payload business_settings/upload_logo"""
+        message = ['business_settings', 'upload_logo', {'business_id': 'b', 'image_data': b'x' * 100}]
+        self.assertEqual(wire_format.message_size(message), 100)
+
+    def test_no_attachments(self):
+        self.assertEqual(wire_format.message_size(['cards', 'filter', {'business_id': 'b'}]), 0)
+
+if __name__ == '__main__':
+    unittest.main()
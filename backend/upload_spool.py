@@ -0,0 +1,165 @@
+"""Докачиваемые загрузки файлов по частям: части пишутся во временный файл, а не копятся в памяти"""
+
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+
+class UploadError(ValueError):
+    """Ошибка протокола загрузки: код уходит клиенту в ['error', code]"""
+
+    def __init__(self, code, detail=''):
+        super().__init__(f"{code}: {detail}" if detail else code)
+        self.code = code
+
+
+class Upload:
+    def __init__(self, upload_id, path, size, chunk_size, meta):
+        self.upload_id = upload_id
+        self.path = path
+        self.size = size
+        self.chunk_size = chunk_size
+        self.meta = meta
+        self.received = set()
+        self.touched_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    @property
+    def received_bytes(self):
+        return sum(self.chunk_length(index) for index in self.received)
+
+    @property
+    def complete(self):
+        return len(self.received) == self.chunk_count
+
+    def chunk_length(self, index):
+        if index == self.chunk_count - 1:
+            return self.size - index * self.chunk_size
+        return self.chunk_size
+
+    def missing(self):
+        return [index for index in range(self.chunk_count) if index not in self.received]
+
+    def state(self):
+        """Состояние для клиента: с какой части продолжать после переподключения"""
+        return {
+            'upload_id': self.upload_id,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'chunk_count': self.chunk_count,
+            'received_bytes': self.received_bytes,
+            'missing': self.missing()
+        }
+
+
+class UploadSpool:
+    """
+    Незавершенные загрузки по upload_id. begin() создает загрузку (или возвращает существующую
+    для докачки), write_chunk() пишет часть по смещению index * chunk_size - повтор части безопасен,
+    finish() отдает путь к собранному файлу. Брошенные загрузки удаляются через ttl секунд
+    """
+
+    def __init__(self, directory=None, ttl=3600, max_size=30 * 1024 * 1024, chunk_size=256 * 1024,
+                 max_chunk_size=1024 * 1024):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'shop_uploads')
+        self.ttl = ttl
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max_chunk_size
+        self._uploads = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._remove_orphans()
+
+    def begin(self, size, meta, upload_id=None, chunk_size=None):
+        """Новая загрузка или, если upload_id уже известен, продолжение прежней"""
+        self.cleanup()
+        if upload_id:
+            upload = self._uploads.get(upload_id)
+            if upload is None:
+                raise UploadError('upload_not_found', upload_id)
+            upload.touched_at = time.monotonic()
+            return upload
+
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise UploadError('invalid_upload_size', str(size))
+        if size > self.max_size:
+            raise UploadError('upload_too_large', f"{size} > {self.max_size}")
+        chunk_size = min(int(chunk_size or self.chunk_size), self.max_chunk_size)
+        if chunk_size <= 0:
+            raise UploadError('invalid_chunk_size', str(chunk_size))
+
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self.directory, f"{upload_id}.part")
+        with open(path, 'wb') as f:
+            f.truncate(size)
+        upload = Upload(upload_id, path, size, chunk_size, meta)
+        with self._lock:
+            self._uploads[upload_id] = upload
+        return upload
+
+    def get(self, upload_id):
+        upload = self._uploads.get(upload_id)
+        if upload is None:
+            raise UploadError('upload_not_found', str(upload_id))
+        return upload
+
+    def write_chunk(self, upload_id, index, data):
+        upload = self.get(upload_id)
+        if not isinstance(index, int) or isinstance(index, bool) or not 0 <= index < upload.chunk_count:
+            raise UploadError('invalid_chunk_index', str(index))
+        if len(data) != upload.chunk_length(index):
+            raise UploadError('invalid_chunk_length', f"chunk {index}: {len(data)} != {upload.chunk_length(index)}")
+        with upload.lock:
+            if index not in upload.received:
+                with open(upload.path, 'r+b') as f:
+                    f.seek(index * upload.chunk_size)
+                    f.write(data)
+                upload.received.add(index)
+            upload.touched_at = time.monotonic()
+        return upload
+
+    def finish(self, upload_id):
+        """Путь к собранному файлу. Загрузка остается, пока не вызван discard() - commit можно повторить"""
+        upload = self.get(upload_id)
+        if not upload.complete:
+            raise UploadError('upload_incomplete', f"missing chunks: {upload.missing()[:20]}")
+        return upload
+
+    def discard(self, upload_id):
+        with self._lock:
+            upload = self._uploads.pop(upload_id, None)
+        if upload is not None:
+            try:
+                os.remove(upload.path)
+            except OSError:
+                pass
+
+    def cleanup(self):
+        """Удаляет загрузки, к которым не обращались дольше ttl"""
+        now = time.monotonic()
+        stale = [upload_id for upload_id, upload in list(self._uploads.items()) if now - upload.touched_at > self.ttl]
+        for upload_id in stale:
+            self.discard(upload_id)
+        return len(stale)
+
+    def _remove_orphans(self):
+        """Файлы загрузок прошлого запуска процесса, которые уже никто не докачает"""
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith('.part') and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        uploads = list(self._uploads.values())
+        return {'uploads': len(uploads), 'bytes': sum(upload.received_bytes for upload in uploads)}
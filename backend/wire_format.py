@@ -0,0 +1,69 @@
+"""Форматы сообщений события 'message' и их согласование с клиентом"""
+
+import serialization
+
+try:
+    import msgpack
+except ImportError:  # без msgpack клиенту будет предложен native или json
+    msgpack = None
+
+# json    - как раньше: список, сериализованный в строку внутри события Socket.IO
+# native  - список передается самим Socket.IO, без второй сериализации в строку
+# msgpack - бинарный MessagePack, уходит бинарным вложением Socket.IO
+DEFAULT_FORMAT = 'json'
+PREFERENCE = ['msgpack', 'native', 'json']
+
+
+def available_formats():
+    return [fmt for fmt in PREFERENCE if fmt != 'msgpack' or msgpack is not None]
+
+
+def negotiate(requested):
+    """Первый поддерживаемый формат из запрошенных клиентом (строка или список), иначе json"""
+    if isinstance(requested, str):
+        requested = [requested]
+    supported = available_formats()
+    for fmt in requested or []:
+        if fmt in supported:
+            return fmt
+    return DEFAULT_FORMAT
+
+
+def encode(payload, fmt=DEFAULT_FORMAT):
+    """Сообщение для emit('message', ...) в формате соединения"""
+    if fmt == 'msgpack':
+        return msgpack.packb(payload, use_bin_type=True, default=serialization.default)
+    if fmt == 'native':
+        return payload
+    return serialization.dumps(payload)
+
+
+def decode(raw):
+    """Входящее сообщение в любом из форматов -> список [resource, action, ...]"""
+    if isinstance(raw, (bytes, bytearray, memoryview)):
+        if msgpack is None:
+            raise ValueError("msgpack message received but msgpack is not installed")
+        return msgpack.unpackb(raw, raw=False)
+    if isinstance(raw, str):
+        return serialization.loads(raw)
+    return raw
+
+
+def message_size(raw):
+    """
+    Размер входящего сообщения в байтах. Для списка из Socket.IO (native, вложения) - сумма
+    бинарных вложений на любой глубине, в том числе внутри словарей вроде payload upload_logo
+    """
+    if isinstance(raw, (str, bytes, bytearray, memoryview)):
+        return len(raw)
+    return _attachments_size(raw)
+
+
+def _attachments_size(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_attachments_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(_attachments_size(item) for item in value.values())
+    return 0
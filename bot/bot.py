@@ -5,6 +5,7 @@ from datetime import datetime
 from typing import List, Optional, Dict, Any
 import json
 import re
+import html
 
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
@@ -18,6 +19,8 @@ from datetime import timedelta
 import uuid
 from datetime import timezone
 
+from supabase_trace import SupabaseTracer
+
 # Загружаем переменные окружения
 load_dotenv('../.env')
 
@@ -61,8 +64,38 @@ bot = Bot(
 )
 dp = Dispatcher()
 
-# Инициализация Supabase клиента
+# Инициализация Supabase клиента с трассировкой запросов (медленные - в лог)
+supabase_tracer = SupabaseTracer(
+    slow_ms=float(os.getenv('SUPABASE_SLOW_QUERY_MS', '500')),
+    log=logger.warning
+)
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+if os.getenv('SUPABASE_TRACE', '1') == '1':
+    supabase = supabase_tracer.wrap(supabase)
+
+# Имена scope для сводки - только из известных команд и кнопок: текст апдейта задает пользователь
+TRACED_COMMANDS = {'start', 'help', 'stats'}
+TRACED_CALLBACKS = {
+    'main_menu', 'business_info_menu', 'subscription_payment_menu', 'free_trial_menu',
+    'activate_free_trial_confirm', 'activate_free_trial_execute', 'bind_card_menu', 'card_bind_info'
+}
+
+def trace_scope_name(event: types.Update) -> str:
+    """command:start, callback:main_menu, command:other, ... - ограниченный набор имен"""
+    if event.callback_query:
+        data = event.callback_query.data
+        return f"callback:{data if data in TRACED_CALLBACKS else 'other'}"
+    if event.message and event.message.text and event.message.text.startswith('/'):
+        # /start@shop_bot payload -> start
+        command = event.message.text.split()[0][1:].split('@')[0].lower()
+        return f"command:{command if command in TRACED_COMMANDS else 'other'}"
+    return event.event_type
+
+@dp.update.outer_middleware()
+async def trace_supabase_calls(handler, event: types.Update, data: Dict[str, Any]) -> Any:
+    """Запросы к Supabase при обработке апдейта засчитываются команде или кнопке"""
+    with supabase_tracer.scope(trace_scope_name(event)):
+        return await handler(event, data)
 
 async def init_db() -> None:
     """Инициализация таблиц в Supabase через SQL Editor"""
@@ -1371,74 +1404,75 @@ async def background_task() -> None:
     
     while True:
         try:
-            # Получаем и отправляем намёки
-            hints = await get_unsent_hints()
-            for hint in hints:
-                message = format_hint_message(hint)
-                if message == "Ошибка форматирования намёка":
-                    logger.warning(f"Пропущен намёк {hint['id']} из-за ошибки форматирования")
-                    continue
+            with supabase_tracer.scope("background_task"):
+                # Получаем и отправляем намёки
+                hints = await get_unsent_hints()
+                for hint in hints:
+                    message = format_hint_message(hint)
+                    if message == "Ошибка форматирования намёка":
+                        logger.warning(f"Пропущен намёк {hint['id']} из-за ошибки форматирования")
+                        continue
                 
-                sent_to_any = False
-                for admin_id in ADMIN_CHAT_IDS:
-                    try:
-                        await bot.send_message(
-                            chat_id=admin_id,
-                            text=message,
-                            parse_mode=ParseMode.HTML
-                        )
-                        logger.info(f"Намёк {hint['id']} отправлен администратору {admin_id}")
-                        sent_to_any = True
-                    except Exception as e:
-                        logger.error(f"Ошибка отправки намёка {hint['id']} админу {admin_id}: {e}")
+                    sent_to_any = False
+                    for admin_id in ADMIN_CHAT_IDS:
+                        try:
+                            await bot.send_message(
+                                chat_id=admin_id,
+                                text=message,
+                                parse_mode=ParseMode.HTML
+                            )
+                            logger.info(f"Намёк {hint['id']} отправлен администратору {admin_id}")
+                            sent_to_any = True
+                        except Exception as e:
+                            logger.error(f"Ошибка отправки намёка {hint['id']} админу {admin_id}: {e}")
                 
-                if sent_to_any:
-                    await mark_hint_as_sent(hint["id"])
-                else:
-                    logger.warning(f"Намёк {hint['id']} не отправлен ни одному администратору")
+                    if sent_to_any:
+                        await mark_hint_as_sent(hint["id"])
+                    else:
+                        logger.warning(f"Намёк {hint['id']} не отправлен ни одному администратору")
             
-            # Получаем и отправляем заказы
-            orders = await get_unsent_orders()
-            for order in orders:
-                message = format_order_message(order)
-                if message == "Ошибка форматирования заказа":
-                    logger.warning(f"Пропущен заказ {order['id']} из-за ошибки форматирования")
-                    continue
+                # Получаем и отправляем заказы
+                orders = await get_unsent_orders()
+                for order in orders:
+                    message = format_order_message(order)
+                    if message == "Ошибка форматирования заказа":
+                        logger.warning(f"Пропущен заказ {order['id']} из-за ошибки форматирования")
+                        continue
                 
-                # Отправляем уведомление владельцу бизнеса
-                owner_id = await get_business_owner_by_order(order["id"])
-                if owner_id:
-                    try:
-                        await send_notification_to_owner(owner_id, message)
-                        logger.info(f"Заказ {order['id']} отправлен владельцу бизнеса {owner_id}")
-                    except Exception as e:
-                        logger.error(f"Ошибка отправки заказа владельцу {owner_id}: {e}")
+                    # Отправляем уведомление владельцу бизнеса
+                    owner_id = await get_business_owner_by_order(order["id"])
+                    if owner_id:
+                        try:
+                            await send_notification_to_owner(owner_id, message)
+                            logger.info(f"Заказ {order['id']} отправлен владельцу бизнеса {owner_id}")
+                        except Exception as e:
+                            logger.error(f"Ошибка отправки заказа владельцу {owner_id}: {e}")
                 
-                # Также отправляем администраторам
-                sent_to_any = False
-                for admin_id in ADMIN_CHAT_IDS:
-                    try:
-                        await bot.send_message(
-                            chat_id=admin_id,
-                            text=message,
-                            parse_mode=ParseMode.HTML
-                        )
-                        logger.info(f"Заказ {order['id']} отправлен администратору {admin_id}")
-                        sent_to_any = True
-                    except Exception as e:
-                        logger.error(f"Ошибка отправки заказа {order['id']} админу {admin_id}: {e}")
+                    # Также отправляем администраторам
+                    sent_to_any = False
+                    for admin_id in ADMIN_CHAT_IDS:
+                        try:
+                            await bot.send_message(
+                                chat_id=admin_id,
+                                text=message,
+                                parse_mode=ParseMode.HTML
+                            )
+                            logger.info(f"Заказ {order['id']} отправлен администратору {admin_id}")
+                            sent_to_any = True
+                        except Exception as e:
+                            logger.error(f"Ошибка отправки заказа {order['id']} админу {admin_id}: {e}")
                 
-                if sent_to_any or owner_id:
-                    await mark_order_as_sent(order["id"])
-                else:
-                    logger.warning(f"Заказ {order['id']} не отправлен ни одному администратору")
+                    if sent_to_any or owner_id:
+                        await mark_order_as_sent(order["id"])
+                    else:
+                        logger.warning(f"Заказ {order['id']} не отправлен ни одному администратору")
             
-            # Проверяем подписки каждые 30 минут (1800 секунд / 60 = 30 итераций)
-            subscription_check_counter += 1
-            if subscription_check_counter >= 30:
-                logger.info("Проверка подписок и отправка напоминаний...")
-                await check_and_send_subscription_reminders()
-                subscription_check_counter = 0
+                # Проверяем подписки каждые 30 минут (1800 секунд / 60 = 30 итераций)
+                subscription_check_counter += 1
+                if subscription_check_counter >= 30:
+                    logger.info("Проверка подписок и отправка напоминаний...")
+                    await check_and_send_subscription_reminders()
+                    subscription_check_counter = 0
             
             # Сбрасываем счетчик ошибок при успешном выполнении
             if error_count > 0:
@@ -1718,12 +1752,25 @@ async def send_stats(message: types.Message) -> None:
 
 <i>Обновлено: {datetime.now().strftime('%H:%M:%S')}</i>
 """
+        response += format_supabase_trace()
         await message.answer(response, parse_mode=ParseMode.HTML)
             
     except Exception as e:
         logger.error(f"Ошибка получения статистики: {e}")
         await message.answer("Ошибка получения статистики.")
 
+def format_supabase_trace() -> str:
+    """Сколько запросов к Supabase стоят команды и фоновая задача - для /stats"""
+    scopes = supabase_tracer.stats()['scopes']
+    if not scopes:
+        return ""
+    lines = ["\n<b>🗄 Запросы к Supabase</b>"]
+    for name, stats in list(scopes.items())[:10]:
+        per_call = stats['calls_per_invocation']
+        per_call_text = f", в среднем {per_call} за вызов" if per_call is not None else ""
+        lines.append(f"{html.escape(name)}: {stats['calls']} запросов, {stats['total_ms']:.0f} ms{per_call_text}")
+    return "\n".join(lines) + "\n"
+
 async def on_startup() -> None:
     """Выполняется при запуске бота"""
     logger.info("Бот запускается...")
@@ -0,0 +1,218 @@
+"""
+Трассировка запросов к Supabase: обертка над клиентом, которая для каждого execute()
+запоминает таблицу, операцию, фильтры, время и число строк, сводит вызовы по внешнему
+действию (сообщение сокета, апдейт бота) и пишет в лог медленные запросы.
+
+Модуль без зависимостей от приложения и лежит в двух одинаковых копиях: backend/supabase_trace.py
+и bot/supabase_trace.py. Образы бэкенда и бота собираются из контекстов ./backend и ./bot
+(docker-compose), общая папка в них не попадает. Правьте обе копии вместе - test_supabase_trace.py
+в backend проверяет, что они совпадают
+"""
+
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+OPERATIONS = {'select', 'insert', 'update', 'upsert', 'delete'}
+NO_SCOPE = '-'  # вызовы вне scope(): фоновые задачи, старт процесса
+
+_current_scope = contextvars.ContextVar('supabase_trace_scope', default=None)
+
+
+def describe_call(name, args, kwargs):
+    """Короткая запись вызова построителя запроса для лога: eq(id,5), in_(card_id,[150 items])"""
+    parts = []
+    for value in list(args) + [f"{key}={value}" for key, value in kwargs.items()]:
+        if isinstance(value, (list, tuple, set)) and len(value) > 3:
+            parts.append(f"[{len(value)} items]")
+        elif isinstance(value, dict):
+            parts.append('{' + ','.join(value) + '}')
+        else:
+            text = str(value)
+            parts.append(text if len(text) <= 60 else text[:57] + '...')
+    return f"{name}({','.join(parts)})"
+
+
+def count_rows(response):
+    data = getattr(response, 'data', None)
+    if isinstance(data, list):
+        return len(data)
+    return 0 if data is None else 1
+
+
+class _Scope:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total_ms = 0.0
+
+
+class TracedQuery:
+    """Построитель запроса PostgREST: пропускает вызовы к оригиналу и замеряет execute()"""
+
+    def __init__(self, tracer, query, target, operation=None, filters=()):
+        self._tracer = tracer
+        self._query = query
+        self._target = target
+        self._operation = operation
+        self._filters = filters
+
+    def _wrap(self, result, name, call=None):
+        if not hasattr(result, 'execute'):
+            return result
+        if name in OPERATIONS:
+            return TracedQuery(self._tracer, result, self._target, name, self._filters)
+        return TracedQuery(self._tracer, result, self._target, self._operation, self._filters + (call or name,))
+
+    def __getattr__(self, name):
+        attr = getattr(self._query, name)
+        if name == 'execute':
+            return self._execute
+        if not callable(attr):
+            return self._wrap(attr, name)  # свойства вроде .not_
+
+        def call(*args, **kwargs):
+            return self._wrap(attr(*args, **kwargs), name, describe_call(name, args, kwargs))
+        return call
+
+    def _execute(self, *args, **kwargs):
+        started = time.perf_counter()
+        response = None
+        error = None
+        try:
+            response = self._query.execute(*args, **kwargs)
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._tracer.record(
+                self._target, self._operation or 'select', self._filters,
+                (time.perf_counter() - started) * 1000, count_rows(response), error
+            )
+
+
+class TracedClient:
+    """Клиент Supabase с трассировкой table()/from_()/rpc(), остальное (storage, auth) - как есть"""
+
+    def __init__(self, client, tracer):
+        self._client = client
+        self._tracer = tracer
+
+    def table(self, name):
+        return TracedQuery(self._tracer, self._client.table(name), name)
+
+    def from_(self, name):
+        return TracedQuery(self._tracer, self._client.from_(name), name)
+
+    def rpc(self, fn, *args, **kwargs):
+        return TracedQuery(self._tracer, self._client.rpc(fn, *args, **kwargs), f"rpc:{fn}", 'rpc')
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class SupabaseTracer:
+    """
+    Сводка вызовов Supabase. slow_ms - порог медленного запроса (0 - не логировать),
+    log - куда писать медленные запросы (print или logger.warning)
+    """
+
+    def __init__(self, slow_ms=500, log=print, recent_slow=50):
+        self.slow_ms = slow_ms
+        self.log = log
+        self._lock = threading.Lock()
+        self._by_call = {}  # (таблица, операция) -> счетчики
+        self._by_scope = {}  # действие -> счетчики
+        self._slow = deque(maxlen=recent_slow)
+
+    def wrap(self, client):
+        return TracedClient(client, self)
+
+    @contextmanager
+    def scope(self, name):
+        """Все вызовы Supabase внутри блока засчитываются действию name"""
+        scope = _Scope(name)
+        token = _current_scope.set(scope)
+        try:
+            yield scope
+        finally:
+            _current_scope.reset(token)
+            with self._lock:
+                stats = self._scope_stats(name)
+                stats['invocations'] += 1
+                stats['max_calls'] = max(stats['max_calls'], scope.calls)
+                if scope.calls:
+                    stats['invocations_with_calls'] += 1
+
+    def record(self, target, operation, filters, elapsed_ms, rows, error=None):
+        scope = _current_scope.get()
+        scope_name = scope.name if scope is not None else NO_SCOPE
+        if scope is not None:
+            scope.calls += 1
+            scope.total_ms += elapsed_ms
+        with self._lock:
+            stats = self._by_call.setdefault((target, operation), {
+                'calls': 0, 'errors': 0, 'rows': 0, 'total_ms': 0.0, 'max_ms': 0.0
+            })
+            stats['calls'] += 1
+            stats['rows'] += rows
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if error is not None:
+                stats['errors'] += 1
+            scope_stats = self._scope_stats(scope_name)
+            scope_stats['calls'] += 1
+            scope_stats['total_ms'] += elapsed_ms
+            key = f"{target}.{operation}"
+            scope_stats['by_call'][key] = scope_stats['by_call'].get(key, 0) + 1
+
+        if self.slow_ms and elapsed_ms >= self.slow_ms:
+            entry = {
+                'at': time.time(),
+                'scope': scope_name,
+                'target': target,
+                'operation': operation,
+                'filters': list(filters),
+                'ms': round(elapsed_ms, 1),
+                'rows': rows,
+                'error': str(error) if error is not None else None
+            }
+            with self._lock:
+                self._slow.append(entry)
+            self.log(
+                f"Медленный запрос Supabase {elapsed_ms:.0f} ms [{scope_name}] "
+                f"{target}.{operation} {' '.join(entry['filters'])} -> {rows} rows"
+                + (f", error: {error}" if error is not None else '')
+            )
+
+    def _scope_stats(self, name):
+        return self._by_scope.setdefault(name, {
+            'invocations': 0, 'invocations_with_calls': 0, 'calls': 0, 'max_calls': 0,
+            'total_ms': 0.0, 'by_call': {}
+        })
+
+    def stats(self):
+        """Сводка: по таблицам/операциям, по действиям (сколько round trip'ов стоит действие) и медленные запросы"""
+        with self._lock:
+            calls = {
+                f"{target}.{operation}": {
+                    **stats,
+                    'total_ms': round(stats['total_ms'], 2),
+                    'max_ms': round(stats['max_ms'], 2),
+                    'avg_ms': round(stats['total_ms'] / stats['calls'], 2) if stats['calls'] else 0.0
+                }
+                for (target, operation), stats in sorted(self._by_call.items(), key=lambda item: -item[1]['total_ms'])
+            }
+            scopes = {}
+            for name, stats in sorted(self._by_scope.items(), key=lambda item: -item[1]['calls']):
+                invocations = stats['invocations']
+                scopes[name] = {
+                    **stats,
+                    'by_call': dict(sorted(stats['by_call'].items(), key=lambda item: -item[1])),
+                    'total_ms': round(stats['total_ms'], 2),
+                    'calls_per_invocation': round(stats['calls'] / invocations, 2) if invocations else None
+                }
+            return {'slow_ms': self.slow_ms, 'calls': calls, 'scopes': scopes, 'slow': list(self._slow)}